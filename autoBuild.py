@@ -44,13 +44,37 @@ folderStructure = {
 fileStructure = {
     'init': os.path.join('plugins', os.path.join('user', 'init.py')),
     'menu': os.path.join('plugins', os.path.join('user', 'menu.py')),
-    'nuke_submit_node': os.path.join('plugins', os.path.join('user', os.path.join('python', 'nuke_submit_node.py')))
+    'nuke_submit_node': os.path.join('plugins', os.path.join('user', os.path.join('python', 'nuke_submit_node.py'))),
+    'hq_connection': os.path.join('plugins', os.path.join('user', os.path.join('python', 'hq_connection.py'))),
+    'hq_cache': os.path.join('plugins', os.path.join('user', os.path.join('python', 'hq_cache.py'))),
+    'hq_worker': os.path.join('plugins', os.path.join('user', os.path.join('python', 'hq_worker.py'))),
+    'hq_frames': os.path.join('plugins', os.path.join('user', os.path.join('python', 'hq_frames.py'))),
+    'hq_submit': os.path.join('plugins', os.path.join('user', os.path.join('python', 'hq_submit.py'))),
+    'hq_trace': os.path.join('plugins', os.path.join('user', os.path.join('python', 'hq_trace.py'))),
+    'hq_profile': os.path.join('plugins', os.path.join('user', os.path.join('python', 'hq_profile.py'))),
+    'hq_monitor': os.path.join('plugins', os.path.join('user', os.path.join('python', 'hq_monitor.py'))),
+    'hq_resume': os.path.join('plugins', os.path.join('user', os.path.join('python', 'hq_resume.py'))),
+    'hq_ledger': os.path.join('plugins', os.path.join('user', os.path.join('python', 'hq_ledger.py'))),
+    'hq_spool': os.path.join('plugins', os.path.join('user', os.path.join('python', 'hq_spool.py'))),
+    'hq_servers': os.path.join('plugins', os.path.join('user', os.path.join('python', 'hq_servers.py')))
 }
 
 pluginComponents = {
     'init': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/dependencies/init.py'],
     'menu': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/dependencies/menu.py'],
-    'nuke_submit_node': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/nuke_submit_node.py']
+    'nuke_submit_node': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/nuke_submit_node.py'],
+    'hq_connection': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/hq_connection.py'],
+    'hq_cache': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/hq_cache.py'],
+    'hq_worker': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/hq_worker.py'],
+    'hq_frames': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/hq_frames.py'],
+    'hq_submit': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/hq_submit.py'],
+    'hq_trace': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/hq_trace.py'],
+    'hq_profile': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/hq_profile.py'],
+    'hq_monitor': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/hq_monitor.py'],
+    'hq_resume': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/hq_resume.py'],
+    'hq_ledger': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/hq_ledger.py'],
+    'hq_spool': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/hq_spool.py'],
+    'hq_servers': ['', 'https://raw.githubusercontent.com/SpaghettiBaguette/hqueue-renderScript/master/hq_servers.py']
 }
 
 for i in pluginComponents.keys():
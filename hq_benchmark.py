@@ -0,0 +1,363 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import os
+import sys
+import tempfile
+import json
+import time
+import xmlrpclib
+import subprocess
+import hq_connection
+import hq_submit
+import hq_frames
+import hq_ledger
+import hq_spool
+import hq_cache
+from hq_standin_server import standinServer
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, peak memory is left out there
+    resource = None
+
+# Linux keeps a process's memory high-water mark here, and starts it again on exec
+procStatus = '/proc/self/status'
+
+#################################################################################################################################################################################################
+#### SESSIONS
+
+def freshProxySession(hq_server):
+    """One "Test path + Get clients + Submit" session the way it was done
+    before pooling: a new proxy and a ping for every helper call."""
+    roundTrips = 0
+    for calls in [[('getHQRoot', 'windows'), ('getHQRoot', 'linux'), ('getHQRoot', 'macosx')],
+                  [('getClients', None, ['id', 'hostname'])],
+                  [('newjob', {'name': 'benchmark'})]]:
+        s = xmlrpclib.ServerProxy(hq_connection.serverURL(hq_server), allow_none=True)
+        s.ping()
+        roundTrips += 1
+        for call in calls:
+            getattr(s, call[0])(*call[1:])
+            roundTrips += 1
+    return roundTrips
+
+def pooledSession(hq_server):
+    """The same session run through the shared keep-alive connection,
+    pinging only when the server has not answered recently."""
+    s = hq_connection.getConnection(hq_server)
+    before = s.stats.snapshot()['requests']
+    for calls in [[('getHQRoot', 'windows'), ('getHQRoot', 'linux'), ('getHQRoot', 'macosx')],
+                  [('getClients', None, ['id', 'hostname'])],
+                  [('newjob', {'name': 'benchmark'})]]:
+        # Only ping when the health cache has gone stale
+        if not s.recentlyAlive():
+            s.ping()
+        for call in calls:
+            s.call(*call)
+    return s.stats.snapshot()['requests'] - before
+
+def runSession(server, session, repeats):
+    server.connects = 0
+    start = time.time()
+    roundTrips = 0
+    for i in range(repeats):
+        roundTrips += session(server.address)
+    elapsed = time.time() - start
+    return {
+        'round_trips': roundTrips,
+        'connects': server.connects,
+        'seconds': elapsed,
+    }
+
+def connectionBenchmark(repeats=20):
+    """Compare connect counts and timings for fresh and pooled sessions."""
+    server = standinServer().start()
+    try:
+        fresh = runSession(server, freshProxySession, repeats)
+        hq_connection.closeAllConnections()
+        pooled = runSession(server, pooledSession, repeats)
+        hq_connection.closeAllConnections()
+    finally:
+        server.stop()
+    return {'sessions': repeats, 'fresh_proxy': fresh, 'pooled': pooled}
+
+def freshGetHQROOT(hq_server):
+    """getHQROOT as it used to be: a ping then one call per platform."""
+    s = xmlrpclib.ServerProxy(hq_connection.serverURL(hq_server), allow_none=True)
+    s.ping()
+    return dict((OSplatform, s.getHQRoot(OSplatform)) for OSplatform in ['windows', 'linux', 'macosx'])
+
+def batchedGetHQROOT(hq_server):
+    """getHQROOT as it is now: a batched call on a healthy connection."""
+    s = hq_connection.getConnection(hq_server)
+    if not s.recentlyAlive():
+        s.ping()
+    platforms = ['windows', 'linux', 'macosx']
+    return dict(zip(platforms, s.batch([('getHQRoot', (OSplatform,)) for OSplatform in platforms])))
+
+def measureGetHQROOT(server, function, repeats):
+    server.requests = 0
+    start = time.time()
+    for i in range(repeats):
+        function(server.address)
+    elapsed = time.time() - start
+    return {
+        'round_trips_per_call': server.requests / float(repeats),
+        'seconds_per_call': elapsed / repeats,
+    }
+
+def multicallBenchmark(repeats=10, latency=0.05):
+    """Measure getHQROOT against servers with and without system.multicall."""
+    results = {'latency': latency, 'calls': repeats}
+    for name, multicall in [('multicall', True), ('no_multicall', False)]:
+        server = standinServer(latency, multicall).start()
+        try:
+            results['serial_' + name] = measureGetHQROOT(server, freshGetHQROOT, repeats)
+            # Warm the health cache so the steady state is measured
+            hq_connection.getConnection(server.address).ping()
+            results[name] = measureGetHQROOT(server, batchedGetHQROOT, repeats)
+        finally:
+            hq_connection.closeAllConnections()
+            server.stop()
+    return results
+
+def sceneJobs(sceneCount):
+    return [{'name': 'shot%03d' % i, 'command': '', 'priority': 5,
+             'children': [{'name': 'Frame Range_1-10', 'command': 'nuke -F 1-10 -x shot.nk', 'priority': 5}]}
+            for i in range(sceneCount)]
+
+def serialSubmit(hq_server, jobs):
+    """Submitting a batch the way the submit buttons did: a new proxy, a ping
+    and a newjob per scene."""
+    for job in jobs:
+        s = xmlrpclib.ServerProxy(hq_connection.serverURL(hq_server), allow_none=True)
+        s.ping()
+        s.newjob(job)
+
+def batchSubmit(hq_server, jobs):
+    hq_submit.sendJobs(hq_server, jobs, hq_submit.buildUmbrellaJobSpec('benchmark', 5))
+
+def batchSubmitBenchmark(sceneCount=40, latency=0.02):
+    """Time submitting sceneCount scenes one by one and as one batch."""
+    results = {'scenes': sceneCount, 'latency': latency}
+    jobs = sceneJobs(sceneCount)
+    for name, submit in [('serial', serialSubmit), ('batch', batchSubmit)]:
+        server = standinServer(latency).start()
+        try:
+            server.requests = 0
+            start = time.time()
+            submit(server.address, jobs)
+            results[name] = {
+                'round_trips': server.requests,
+                'connects': server.connects,
+                'seconds': time.time() - start,
+            }
+        finally:
+            hq_connection.closeAllConnections()
+            server.stop()
+    return results
+
+def payloadJob(frameCount, compact, app='maya', chunkSize=1):
+    """A job like the panels build, chunkSize frames per chunk, assigned to a client list."""
+    hqRoot = {'linux': '/mnt/hq', 'windows': 'Q:', 'macosx': '/Volumes/hq'}
+    chunks = hq_frames.frameSet([(1, frameCount, 1)]).chunks(chunkSize)
+    if app == 'nuke':
+        fileName = hq_submit.resolveNukeFilePaths('$HQROOT/shots/shot010/comp/shot010_comp_v012.nk', hqRoot, 'linux')
+        parms = hq_submit.getBaseParameters('Render -> NK: ' + fileName['hq'], 'clients', 'render001,render002', '',
+                                            hq_submit.hqRootExecutables('$HQROOT/nuke_distros/$OS-Nuke9.0v8', hqRoot, 'Nuke9.0'),
+                                            'localhost:5000', 5)
+        return hq_submit.nukeJobSpec(parms, chunks, fileName, compact)
+    fileName = hq_submit.resolveMayaFilePaths('$HQROOT/projects/show/scenes/shot010_lighting_v012.ma', hqRoot, 'linux')
+    parms = hq_submit.getBaseParameters('Render -> MA: ' + fileName['hq'], 'clients', 'render001,render002', '',
+                                        hq_submit.hqRootExecutables('$HQROOT/maya_distros/$OS-Maya2016', hqRoot, 'bin/Render'),
+                                        'localhost:5000', 5)
+    return hq_submit.mayaJobSpec(parms, 'file', chunks, fileName, compact)
+
+def payloadBenchmark(frameCount=5000, latency=0.0):
+    """Compare the serialized size and newjob time of full and compact job specs."""
+    results = {'frames': frameCount}
+    server = standinServer(latency).start()
+    try:
+        for name, compact in [('full', False), ('compact', True)]:
+            job = payloadJob(frameCount, compact)
+            start = time.time()
+            hq_connection.getConnection(server.address).newjob(job)
+            results[name] = {
+                'payload_bytes': len(xmlrpclib.dumps((job,), 'newjob', allow_none=True)),
+                'newjob_seconds': time.time() - start,
+            }
+    finally:
+        hq_connection.closeAllConnections()
+        server.stop()
+    return results
+
+def pagedBenchmark(frameCount=20000, latency=0.02):
+    """Compare sending a large job tree in one newjob call and in pages."""
+    job = payloadJob(frameCount, False)
+    results = {'children': frameCount, 'latency': latency, 'page_size': hq_submit.childPageSize}
+    for name, pageSize in [('single_request', frameCount), ('paged', hq_submit.childPageSize)]:
+        server = standinServer(latency).start()
+        try:
+            submission = hq_submit.pagedSubmission(server.address, job, pageSize=pageSize)
+            submission.submit()
+            results[name] = {
+                'requests': len(submission.pages),
+                'largest_request_bytes': max(len(xmlrpclib.dumps((page,), 'newjob', allow_none=True))
+                                             for page in submission.pages),
+                'seconds': submission.seconds,
+                'children_per_second': submission.childrenPerSecond(),
+            }
+        finally:
+            hq_connection.closeAllConnections()
+            server.stop()
+    return results
+
+def gzipSession(hq_server, frameCount):
+    """List every client's details and submit a job, the two biggest messages a session sends."""
+    s = hq_connection.getConnection(hq_server)
+    s.ping()
+    s.stats.reset()
+    start = time.time()
+    s.getClients(None, ['id', 'hostname', 'os'])
+    s.newjob(payloadJob(frameCount, False))
+    results = s.stats.snapshot()
+    results['seconds'] = time.time() - start
+    return results
+
+def gzipBenchmark(clientCount=2000, frameCount=500, linkMbits=10.0):
+    """Compare bytes on the wire with gzip on, off, and against a server
+    that cannot read gzip. vpn_seconds adds the time the bytes would take
+    over a linkMbits link to the measured local time."""
+    results = {'clients': clientCount, 'children': frameCount, 'link_mbits': linkMbits}
+    threshold = hq_connection.gzipThreshold
+    for name, useGzip, serverGzip in [('plain', False, True), ('gzip', True, True), ('gzip_unsupported', True, False)]:
+        server = standinServer(clientCount=clientCount, gzip=serverGzip).start()
+        hq_connection.gzipThreshold = threshold if useGzip else -1
+        try:
+            session = gzipSession(server.address, frameCount)
+            session['vpn_seconds'] = session['seconds'] + \
+                (session['bytes_sent'] + session['bytes_received']) * 8 / (linkMbits * 1000000)
+            session['supports_gzip'] = hq_connection.getConnection(server.address).supportsGzip
+            results[name] = session
+        finally:
+            hq_connection.gzipThreshold = threshold
+            hq_connection.closeAllConnections()
+            server.stop()
+    return results
+
+def procStatusKB(field):
+    """Return a kilobyte field such as VmHWM from /proc/self/status, or None
+    where there is no /proc."""
+    try:
+        with open(procStatus, 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return None
+
+def peakMemoryKB():
+    """Return the peak resident memory of this process. ru_maxrss is only
+    used without /proc, Linux carries it over from the parent across exec."""
+    peak = procStatusKB('VmHWM')
+    if peak is not None or resource is None:
+        return peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def useScratchHome(directory):
+    """Keep the benchmark's ledger, spool, caches and config out of the real
+    home directory, for this process and the cases it starts."""
+    os.environ['HOME'] = directory
+    hq_ledger.ledgerLocation = os.path.join(directory, '.hQueueLedger.dat')
+    hq_spool.spoolDirectory = os.path.join(directory, '.hQueueSpool')
+    hq_spool.rejectedDirectory = os.path.join(hq_spool.spoolDirectory, 'rejected')
+    # The caches were created on import with the real paths, so they are pointed at the new ones
+    hq_cache.cacheLocation = hq_cache.metadata.location = os.path.join(directory, '.hQueueCache.dat')
+    hq_cache.inventoryLocation = hq_cache.inventory.location = os.path.join(directory, '.hQueueClients.dat')
+    hq_cache.metadata.entries = None
+    hq_cache.inventory.servers = None
+    # No "Servers" list, so every job goes to the stand-in
+    hq_submit.configLocation = os.path.join(directory, '.hQueueConfig.dat')
+
+def measureSubmission(hq_server, app, frameCount, compact):
+    """Build and send one job and return its timings, size and peak memory.
+    Run by runCase in a fresh interpreter, so the peak is the case's own.
+    memory_growth_kb is how far the peak rose above the memory in use before the build."""
+    baseline = procStatusKB('VmRSS') or peakMemoryKB()
+    start = time.time()
+    job = payloadJob(frameCount, compact, app, hq_frames.defaultChunkSize)
+    buildSeconds = time.time() - start
+    payloadBytes = len(xmlrpclib.dumps((job,), 'newjob', allow_none=True))
+
+    start = time.time()
+    ids = hq_submit.sendJob(hq_server, job)
+    sendSeconds = time.time() - start
+    peak = peakMemoryKB()
+    return {
+        'chunks': len(job['children']),
+        'build_seconds': buildSeconds,
+        'payload_bytes': payloadBytes,
+        'send_seconds': sendSeconds,
+        'submitted': bool(ids),
+        'peak_memory_kb': peak,
+        'memory_growth_kb': peak - baseline if peak is not None else None,
+    }
+
+def runCase(hq_server, app, frameCount, compact):
+    """Run measureSubmission in a new python, which starts without the
+    stand-in and the jobs it has recorded, and return its results."""
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--case', hq_server, app,
+                                      str(frameCount), '1' if compact else '0'])
+    return json.loads(output)
+
+def submissionBenchmark(frameCounts=(100, 1000, 100000), latency=0.0):
+    """Measure the end to end cost of submitting Nuke and Maya jobs of each
+    frame count: spec build time, payload bytes, round trips and peak memory."""
+    results = {'latency': latency, 'chunk_size': hq_frames.defaultChunkSize}
+    server = standinServer(latency).start()
+    try:
+        for app in ['nuke', 'maya']:
+            for compact in [False, True]:
+                cases = results.setdefault(app + ('_compact' if compact else ''), {})
+                for frameCount in frameCounts:
+                    server.requests = 0
+                    server.jobs.clear()
+                    del server.submissions[:]
+                    case = runCase(server.address, app, frameCount, compact)
+                    case['round_trips'] = server.requests
+                    cases[str(frameCount)] = case
+    finally:
+        server.stop()
+    return results
+
+##################################################################################################################################################################################################
+############################################ Main code
+##################################################################################################################################################################################################
+
+if __name__ == '__main__' and sys.argv[1:2] == ['--case']:
+    # One submissionBenchmark case, its HOME is already the parent's scratch directory
+    useScratchHome(os.environ['HOME'])
+    (hq_server, app, frameCount, compact) = sys.argv[2:6]
+    # Keep progress messages out of the JSON on stdout
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    stdout.write(json.dumps(measureSubmission(hq_server, app, int(frameCount), compact == '1')))
+elif __name__ == '__main__':
+    # Keep the benchmark jobs out of the real ledger, spool and config
+    useScratchHome(tempfile.mkdtemp())
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    results = {
+        'connection': connectionBenchmark(repeats),
+        'getHQROOT': multicallBenchmark(),
+        'batchSubmit': batchSubmitBenchmark(),
+        'payload': payloadBenchmark(),
+        'paged': pagedBenchmark(),
+        'gzip': gzipBenchmark(),
+        'submission': submissionBenchmark(),
+    }
+    print json.dumps(results, indent=4, sort_keys=True)
@@ -0,0 +1,328 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import os
+import os.path
+import json
+import time
+import threading
+import xmlrpclib
+import hq_connection
+
+# The metadata cache lives next to the ~/.hQueueConfig.dat server config
+cacheLocation = os.path.join(os.environ['HOME'], ".hQueueCache.dat")
+
+# Seconds each kind of server metadata stays valid for
+metadataTTL = {
+    'hq_root': 24 * 60 * 60,
+    'client_groups': 60 * 60,
+    'email_event_names': 24 * 60 * 60,
+    'queue_depth': float(os.environ.get('HQUEUE_QUEUE_DEPTH_TTL', 15.0)),
+}
+
+# Metadata refreshed together when the panels ask for it, the queue depth is only read when failing over
+refreshedMetadata = ['client_groups', 'email_event_names', 'hq_root']
+
+# Jobs in these states are what a server still has to get through
+queuedStatuses = ['waiting', 'scheduled', 'assigned', 'running']
+
+platforms = ['windows', 'linux', 'macosx']
+
+# Server methods that return the event names for each email reason
+emailEventMethods = {
+    "start": "getStartedJobEventNames",
+    "success": "getSucceededStatusNames",
+    "failure": "getFailedJobStatusNames",
+    "pause": "getPausedJobStatusNames",
+    "resume": "getResumedEventNames",
+    "reschedule": "getRescheduledEventNames",
+    "priority change": "getPriorityChangedEventNames",
+}
+
+#################################################################################################################################################################################################
+#### FETCHERS
+
+def raiseFaults(results):
+    for result in results:
+        if isinstance(result, xmlrpclib.Fault):
+            raise result
+    return results
+
+def hqRootFromResults(results):
+    return dict(zip(platforms, raiseFaults(results)))
+
+def clientGroupsFromResults(results):
+    return raiseFaults(results)[0]
+
+def queueDepthFromResults(results):
+    # The server only lists the ids, so the depth is the length of the list
+    return len(raiseFaults(results)[0])
+
+def emailEventNamesFromResults(results):
+    # Reasons the server does not support are stored as None
+    names = {}
+    for reason, result in zip(sorted(emailEventMethods.keys()), results):
+        if isinstance(result, xmlrpclib.Fault):
+            names[reason] = None
+        else:
+            names[reason] = result
+    return names
+
+# For each metadata key, the calls that fetch it and how to read their results
+metadataFetchers = {
+    'hq_root': ([('getHQRoot', (OSplatform,)) for OSplatform in platforms], hqRootFromResults),
+    'client_groups': ([('getClientGroups', ())], clientGroupsFromResults),
+    'email_event_names': ([(emailEventMethods[reason], ()) for reason in sorted(emailEventMethods.keys())],
+                          emailEventNamesFromResults),
+    'queue_depth': ([('getJobIdsByStatus', (queuedStatuses,))], queueDepthFromResults),
+}
+
+#################################################################################################################################################################################################
+#### METADATA CACHE
+
+class serverMetadataCache(object):
+    """Server metadata that rarely changes, such as the $HQROOT mount points,
+    kept on disk per server address so it survives between sessions."""
+
+    def __init__(self, location=cacheLocation):
+        self.location = location
+        self.entries = None
+        self._lock = threading.RLock()
+
+    def load(self):
+        with self._lock:
+            if self.entries is None:
+                self.entries = {}
+                if os.path.isfile(self.location):
+                    try:
+                        with open(self.location, 'r') as f:
+                            self.entries = json.load(f)
+                    except ValueError:
+                        # A corrupt cache is simply rebuilt
+                        print("Ignoring unreadable cache file '" + self.location + "'.")
+            return self.entries
+
+    def save(self):
+        with self._lock:
+            with open(self.location, 'w') as f:
+                json.dump(self.entries, f)
+
+    def get(self, hq_server, key):
+        """Return the cached value for the server, or None if it is missing
+        or older than its TTL."""
+        with self._lock:
+            entry = self.load().get(hq_connection.serverURL(hq_server), {}).get(key)
+        if entry is None or time.time() - entry['time'] > metadataTTL[key]:
+            return None
+        return entry['value']
+
+    def set(self, hq_server, key, value):
+        self.setMany(hq_server, {key: value})
+
+    def setMany(self, hq_server, values):
+        """Cache several values for the server with a single write to disk."""
+        with self._lock:
+            server = self.load().setdefault(hq_connection.serverURL(hq_server), {})
+            for key in values.keys():
+                server[key] = {'value': values[key], 'time': time.time()}
+            self.save()
+
+    def invalidate(self, hq_server, key=None):
+        """Forget one cached value, or everything cached for the server."""
+        with self._lock:
+            server = self.load().get(hq_connection.serverURL(hq_server), {})
+            if key is None:
+                server.clear()
+            else:
+                server.pop(key, None)
+            self.save()
+
+    def fetch(self, connection, keys):
+        """Fetch the given keys from the server in one batch, cache them
+        and return them as a dictionary."""
+        calls = []
+        for key in keys:
+            calls.extend(metadataFetchers[key][0])
+        results = connection.batch(calls, raiseFaults=False)
+
+        values = {}
+        for key in keys:
+            keyCalls, fromResults = metadataFetchers[key]
+            values[key] = fromResults(results[:len(keyCalls)])
+            results = results[len(keyCalls):]
+
+        self.setMany(connection.hq_server, values)
+        return values
+
+    def getOrFetch(self, connection, key):
+        """Return the cached value, fetching it from the server if needed."""
+        value = self.get(connection.hq_server, key)
+        if value is None:
+            value = self.fetch(connection, [key])[key]
+        return value
+
+    def refresh(self, connection):
+        """Refetch the refreshedMetadata from the server in one round trip."""
+        return self.fetch(connection, refreshedMetadata)
+
+metadata = serverMetadataCache()
+
+#################################################################################################################################################################################################
+#### CLIENT INVENTORY
+
+# The client inventory is kept in its own file next to the metadata cache
+inventoryLocation = os.path.join(os.environ['HOME'], ".hQueueClients.dat")
+
+# Client attributes stored for every client, and the fallback if the server rejects them
+inventoryAttributes = ["id", "hostname", "os"]
+basicInventoryAttributes = ["id", "hostname"]
+
+# Seconds between full client listings, so renamed clients are picked up eventually
+fullSyncInterval = 24 * 60 * 60
+
+# Seconds a sync is trusted to know every platform the server's clients run. A job is only
+# given fewer than every platform's command when the inventory was synced more recently,
+# since a client on another platform may have joined since.
+platformsMaxAge = float(os.environ.get('HQUEUE_INVENTORY_AGE', 10 * 60))
+
+def platformFromOS(clientOS):
+    """Return the platform of a client's os attribute, such as 'linux-x86_64',
+    or None if it is not recognised."""
+    clientOS = str(clientOS).lower()
+    if clientOS.startswith('win'):
+        return 'windows'
+    elif clientOS.startswith('linux'):
+        return 'linux'
+    elif clientOS.startswith('darwin') or clientOS.startswith('mac') or 'osx' in clientOS:
+        return 'macosx'
+    return None
+
+class clientInventory(object):
+    """The clients registered on each HQueue server, keyed by client id and
+    kept on disk between sessions. A sync only lists the client ids and then
+    fetches the full details of clients it has not seen before."""
+
+    def __init__(self, location=inventoryLocation):
+        self.location = location
+        self.servers = None
+        self._lock = threading.RLock()
+        self._syncing = {}
+
+    def load(self):
+        with self._lock:
+            if self.servers is None:
+                self.servers = {}
+                if os.path.isfile(self.location):
+                    try:
+                        with open(self.location, 'r') as f:
+                            self.servers = json.load(f)
+                    except ValueError:
+                        print("Ignoring unreadable client inventory '" + self.location + "'.")
+            return self.servers
+
+    def save(self):
+        with self._lock:
+            with open(self.location, 'w') as f:
+                json.dump(self.servers, f)
+
+    def clients(self, hq_server):
+        """Return the known clients of the server sorted by hostname,
+        or None if the server has never been synced."""
+        with self._lock:
+            server = self.load().get(hq_connection.serverURL(hq_server))
+            if server is None:
+                return None
+            return sorted(server['clients'].values(), key=lambda client: client['hostname'])
+
+    def hostnames(self, hq_server):
+        clients = self.clients(hq_server)
+        if clients is None:
+            return None
+        return [client['hostname'] for client in clients]
+
+    def recentlySynced(self, hq_server, maxAge=None):
+        """Return True if the server's inventory was synced within maxAge seconds, platformsMaxAge by default."""
+        maxAge = platformsMaxAge if maxAge is None else maxAge
+        with self._lock:
+            server = self.load().get(hq_connection.serverURL(hq_server))
+            return server is not None and time.time() - server.get('synced', 0) < maxAge
+
+    def platforms(self, hq_server, hostnames=None):
+        """Return the set of platforms the server's clients run, or only the
+        given hostnames. Returns None if the inventory has not been synced
+        within platformsMaxAge, or if any of the clients is missing from it
+        or has no known platform."""
+        if not self.recentlySynced(hq_server):
+            return None
+        clients = self.clients(hq_server)
+        if clients is None:
+            return None
+        if hostnames is not None:
+            clients = [client for client in clients if client['hostname'] in hostnames]
+            if len(clients) < len(set(hostnames)):
+                return None
+
+        platforms = set(platformFromOS(client.get('os')) for client in clients)
+        if not platforms or None in platforms:
+            return None
+        return platforms
+
+    def fetchClients(self, connection, client_ids):
+        try:
+            return connection.getClients(client_ids, inventoryAttributes)
+        except xmlrpclib.Fault:
+            # Older servers may not know every attribute we ask for
+            return connection.getClients(client_ids, basicInventoryAttributes)
+
+    def sync(self, connection):
+        """Bring the inventory of the connection's server up to date."""
+        url = hq_connection.serverURL(connection.hq_server)
+        with self._lock:
+            server = self.load().get(url)
+
+        if server is None or time.time() - server['fullSync'] > fullSyncInterval:
+            # Nothing known yet, or time for a full listing
+            clients = dict((str(client['id']), client) for client in self.fetchClients(connection, None))
+            server = {'clients': clients, 'fullSync': time.time()}
+        else:
+            # The id list is the cheap fingerprint, only unseen clients are fetched in full
+            client_ids = [str(client['id']) for client in connection.getClients(None, ["id"])]
+            clients = dict((client_id, server['clients'][client_id])
+                           for client_id in client_ids if client_id in server['clients'])
+            new_ids = [int(client_id) for client_id in client_ids if client_id not in clients]
+            if new_ids:
+                for client in self.fetchClients(connection, new_ids):
+                    clients[str(client['id'])] = client
+            server = {'clients': clients, 'fullSync': server['fullSync']}
+
+        server['synced'] = time.time()
+        with self._lock:
+            self.load()[url] = server
+            self.save()
+
+    def syncInBackground(self, connection, onDone=None):
+        """Sync the server's inventory on a background thread. Only one sync
+        per server runs at a time, onDone is called once it has finished."""
+        url = hq_connection.serverURL(connection.hq_server)
+        with self._lock:
+            if self._syncing.get(url):
+                return
+            self._syncing[url] = True
+
+        def runSync():
+            try:
+                self.sync(connection)
+            except Exception, e:
+                print("Could not sync the client list from '" + connection.hq_server + "'.", e)
+            finally:
+                with self._lock:
+                    self._syncing[url] = False
+            if onDone is not None:
+                onDone()
+
+        thread = threading.Thread(target=runSync)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+inventory = clientInventory()
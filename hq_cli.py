@@ -0,0 +1,328 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import os
+import os.path
+import sys
+import json
+import time
+import argparse
+import posixpath
+import hq_cache
+import hq_submit
+import hq_frames
+import hq_trace
+import hq_monitor
+import hq_resume
+import hq_spool
+
+# Scene file extensions and the application that renders them
+sceneApplications = {
+    '.nk': 'nuke',
+    '.ma': 'maya',
+    '.mb': 'maya',
+}
+
+# Rough number of seconds each application takes to start on a render node
+startupSeconds = {
+    'nuke': 10.0,
+    'maya': 30.0,
+}
+
+defaultAppVersions = {
+    'nuke': '9.0v8',
+    'maya': '2016',
+}
+
+jobNamePrefixes = {
+    'nuke': "Render -> NK: ",
+    'maya': "Render -> MA: ",
+}
+
+clientSelectionTypes = ['any', 'clients', 'client_groups']
+
+#################################################################################################################################################################################################
+#### ARGUMENTS
+
+def parseChunk(value):
+    """Parse a --chunk value such as fixed:10, time:15 or clients into a
+    (strategy, value) pair. Time chunks are in minutes, like the panels."""
+    strategy, sep, amount = value.partition(':')
+    if strategy not in hq_frames.chunkStrategies.values():
+        raise argparse.ArgumentTypeError("Unknown chunking strategy: " + strategy)
+    try:
+        if strategy == 'fixed':
+            return (strategy, int(amount) if amount else hq_frames.defaultChunkSize)
+        elif strategy == 'time':
+            return (strategy, float(amount) * 60)
+        return (strategy, int(amount) if amount else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError("Chunk size is invalid: " + value)
+
+def parseFrames(value):
+    try:
+        return hq_frames.frameSet.parse(value)
+    except ValueError, e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def buildParser():
+    parser = argparse.ArgumentParser(description="Submit Nuke and Maya renders to HQueue without opening either application.")
+    parser.add_argument('scenes', nargs='*', metavar='scene', help="Path of a .nk, .ma or .mb file, may start with $HQROOT")
+    parser.add_argument('--scene-list', default=None, help="File listing one scene path per line")
+    parser.add_argument('--umbrella', default=None, help="Submit every scene under one parent job with this name")
+    parser.add_argument('--frames', type=parseFrames, help="Frame expression, e.g. 1-100x2,150, needed unless retrying")
+    parser.add_argument('--chunk', type=parseChunk, default=('fixed', hq_frames.defaultChunkSize),
+                        help="fixed:FRAMES, time:MINUTES or clients[:COUNT] (default fixed:%d)" % hq_frames.defaultChunkSize)
+    parser.add_argument('--seconds-per-frame', type=float, default=0.0, help="Estimated render time used by time chunks")
+    parser.add_argument('--server', default=None, help="HQueue server address (default from ~/.hQueueConfig.dat)")
+    parser.add_argument('--name', default=None, help="Job name when submitting one scene (default is built from the scene path)")
+    parser.add_argument('--priority', type=int, default=5, choices=range(1, 11))
+    parser.add_argument('--assign-to', choices=clientSelectionTypes, default=None,
+                        help="Defaults to clients or client_groups when those are given, otherwise any")
+    parser.add_argument('--clients', default='', help="Comma separated client hostnames")
+    parser.add_argument('--client-groups', default='', help="Comma separated client group names")
+    parser.add_argument('--app', choices=sorted(set(sceneApplications.values())), default=None,
+                        help="Application to render with (default from the scene extension)")
+    parser.add_argument('--app-version', default=None, help="Application version, e.g. 9.0v8 or 2016")
+    parser.add_argument('--install-dir', default=None, help="Install directory, may contain $HQROOT and $OS")
+    parser.add_argument('--executable', default=None, help="Executable inside the install directory")
+    parser.add_argument('--renderer', default='file', help="Maya renderer (default file)")
+    parser.add_argument('--compact', action='store_true',
+                        help="Declare paths and priority once on the parent job instead of in every chunk")
+    parser.add_argument('--dry-run', action='store_true', help="Print the job spec instead of submitting it")
+    parser.add_argument('--resume', action='store_true',
+                        help="Only submit frames whose images are missing or empty on disk")
+    parser.add_argument('--output', action='append', default=[],
+                        help="Image path checked by --resume, e.g. $HQROOT/renders/sh010/comp.####.exr, may be repeated. "
+                             "Defaults to the Write nodes of a .nk script")
+    parser.add_argument('--retry-failed', nargs='?', type=int, const=-1, default=None, metavar='JOBID',
+                        help="Submit the failed chunks of a job in the ledger again, by default the last job sent to the server")
+    parser.add_argument('--flush-spool', action='store_true',
+                        help="Send the jobs spooled while their server was unreachable, waiting until they are all sent")
+    parser.add_argument('--watch', action='store_true', help="Follow the submitted jobs until they finish")
+    return parser
+
+#################################################################################################################################################################################################
+#### JOB SPEC
+
+def sceneApplication(scene):
+    extension = os.path.splitext(scene)[1].lower()
+    return sceneApplications.get(extension)
+
+def defaultInstallDir(app, version):
+    if app == 'nuke':
+        return '$HQROOT/nuke_distros/$OS-Nuke' + version
+    return '$HQROOT/maya_distros/$OS-Maya' + version
+
+def defaultExecutable(app, version):
+    if app == 'nuke':
+        # Nuke9.0v8 installs Nuke9.0
+        return 'Nuke' + version.split('v')[0]
+    return posixpath.join('bin', 'Render')
+
+def assignment(args):
+    if args.assign_to is not None:
+        return args.assign_to
+    elif args.clients:
+        return 'clients'
+    elif args.client_groups:
+        return 'client_groups'
+    return 'any'
+
+def chunkFrames(args, app, assigned_to, frames):
+    (strategy, value) = args.chunk
+    if strategy == 'clients' and value is None:
+        value = hq_submit.availableClientCount(args.server, assigned_to, args.clients)
+    return hq_frames.chunkFrames(frames, strategy, value, args.seconds_per_frame, startupSeconds[app])
+
+def buildJob(args, app, name, hqRoot, fileResponse, frames=None):
+    """Build the same containing job spec the Nuke and Maya panels submit,
+    for frames or every frame given on the command line."""
+    version = args.app_version or defaultAppVersions[app]
+    installDir = args.install_dir or defaultInstallDir(app, version)
+    executable = args.executable or defaultExecutable(app, version)
+    assigned_to = assignment(args)
+
+    parms = hq_submit.getBaseParameters(name or jobNamePrefixes[app] + fileResponse['hq'], assigned_to,
+                                        args.clients, args.client_groups,
+                                        hq_submit.hqRootExecutables(installDir, hqRoot, executable),
+                                        args.server, args.priority)
+    chunks = chunkFrames(args, app, assigned_to, frames if frames is not None else args.frames)
+    platforms = hq_submit.targetPlatforms(args.server, assigned_to, args.clients)
+    if app == 'nuke':
+        return hq_submit.nukeJobSpec(parms, chunks, fileResponse, args.compact, platforms)
+    return hq_submit.mayaJobSpec(parms, args.renderer, chunks, fileResponse, args.compact, platforms)
+
+def buildSceneJob(args, scene, name=None):
+    """Check the scene exists and return its job spec, or None if it cannot be submitted."""
+    app = args.app or sceneApplication(scene)
+    if app is None:
+        print "Cannot tell which application renders '" + scene + "', use --app"
+        return None
+
+    if app == 'nuke':
+        resolveFilePaths = hq_submit.resolveNukeFilePaths
+    else:
+        resolveFilePaths = hq_submit.resolveMayaFilePaths
+    response = hq_submit.checkFilePath(args.server, scene, resolveFilePaths)
+    if response is None:
+        return None
+    (hqRoot, OSplatform, fileResponse, found) = response
+    if not found:
+        print "File path cannot be found:", scene
+        return None
+
+    frames = args.frames
+    if args.resume:
+        frames = resumeFrames(args, app, scene, hqRoot, OSplatform, fileResponse)
+        if frames is None:
+            return None
+    return buildJob(args, app, name, hqRoot, fileResponse, frames)
+
+def resumeFrames(args, app, scene, hqRoot, OSplatform, fileResponse):
+    """Return the frames of the scene whose images are not on disk yet, or
+    None if there is nothing to render or the images can't be found."""
+    outputs = args.output
+    if not outputs and app == 'nuke':
+        localScene = fileResponse[OSplatform].strip('"')
+        if not os.path.isfile(localScene):
+            localScene = fileResponse['hq'].strip('"')
+        outputs = hq_resume.nukeScriptOutputs(localScene)
+    if not outputs:
+        print "Cannot tell where the images of '" + scene + "' are written, use --output"
+        return None
+
+    outputs = [output.replace('$HQROOT', hqRoot[OSplatform]) for output in outputs]
+    frames = hq_resume.missingFrames(outputs, args.frames)
+    if frames is None:
+        print "Every frame of", scene, "has already been rendered"
+    elif frames != args.frames:
+        print "Resuming", scene, "with", len(frames), "of", len(args.frames), "frames:", frames
+    return frames
+
+def watchJobs(hq_server, jobIds):
+    """Print the chunk counts of the jobs whenever a status changes, until they all finish."""
+    def printProgress(monitor, changes):
+        print time.strftime('%H:%M:%S'), monitor.summaryText()
+
+    monitor = hq_monitor.jobMonitor(hq_server, jobIds, printProgress)
+    try:
+        monitor.watch()
+    except KeyboardInterrupt:
+        print "Stopped watching, the jobs carry on on the farm"
+        return False
+    return monitor.status() == 'succeeded'
+
+def retryJob(args):
+    ids = hq_submit.retryFailed(args.server, args.retry_failed if args.retry_failed >= 0 else None)
+    if ids is None:
+        return 0
+    elif ids is False:
+        return 1
+    print "Submitted the failed chunks as job", ids[0]
+    if args.watch:
+        return 0 if watchJobs(args.server, ids[:1]) else 1
+    return 0
+
+def flushSpool():
+    """Send every spooled job, backing off while a server is unreachable."""
+    jobs = len(hq_spool.spooledJobs())
+    if not jobs:
+        print "No spooled jobs to send"
+        return 0
+    print "Sending", jobs, "spooled jobs"
+    flusher = hq_spool.spoolFlusher(hq_submit.submitJob)
+    try:
+        flusher.run()
+    except KeyboardInterrupt:
+        print len(hq_spool.spooledJobs()), "jobs are still spooled"
+        return 1
+    return 0
+
+def readSceneList(location):
+    with open(location, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+##################################################################################################################################################################################################
+############################################ Main code
+##################################################################################################################################################################################################
+
+def main(argv=None):
+    parser = buildParser()
+    args = parser.parse_args(argv)
+
+    if args.server is None:
+        args.server = hq_submit.retrieveConfigCache()
+    if args.retry_failed is not None:
+        return retryJob(args)
+    if args.flush_spool:
+        return flushSpool()
+
+    scenes = list(args.scenes)
+    if args.scene_list is not None:
+        scenes.extend(readSceneList(args.scene_list))
+    if not scenes:
+        parser.error("No scenes to submit")
+    if args.frames is None:
+        parser.error("--frames is required")
+
+    hq_trace.startSession('hq_cli ' + ' '.join(scenes))
+    try:
+        return submitScenes(args, scenes)
+    finally:
+        hq_trace.endSession()
+
+def submitScenes(args, scenes):
+    start = time.time()
+    # Warm the $HQROOT cache once so the scenes don't all ask the server for it
+    if hq_submit.getHQROOT(args.server) is None:
+        return 1
+    # The client inventory says which platforms need commands, so it is synced first unless that
+    # was just done. Without a recent sync the jobs get every platform's command.
+    if not hq_cache.inventory.recentlySynced(args.server):
+        hq_submit.syncClients(args.server)
+
+    # Scene checks touch the file server, so the specs are built side by side
+    name = args.name if len(scenes) == 1 else None
+    mainJobs = hq_submit.runConcurrently(buildSceneJob, [(args, scene, name) for scene in scenes])
+    for scene, mainJob in zip(scenes, mainJobs):
+        if isinstance(mainJob, Exception):
+            print "Could not build the job for", scene, "-", mainJob
+    submittable = [(scene, mainJob) for (scene, mainJob) in zip(scenes, mainJobs)
+                   if mainJob is not None and not isinstance(mainJob, Exception)]
+    if not submittable:
+        return 1
+
+    if args.dry_run:
+        jobs = [mainJob for (scene, mainJob) in submittable]
+        if args.umbrella is not None:
+            jobs = dict(hq_submit.buildUmbrellaJobSpec(args.umbrella, args.priority), children=jobs)
+        elif len(jobs) == 1:
+            jobs = jobs[0]
+        print json.dumps(jobs, indent=4, sort_keys=True)
+        return 0 if len(submittable) == len(scenes) else 1
+
+    umbrella = None
+    if args.umbrella is not None:
+        umbrella = hq_submit.buildUmbrellaJobSpec(args.umbrella, args.priority)
+    # The jobs go to the least loaded server of the config's "Servers" list, which is then the one watched
+    (args.server, ids) = hq_submit.sendJobsWithFailover(args.server, [mainJob for (scene, mainJob) in submittable],
+                                                        umbrella)
+    if ids is False:
+        return 1
+    elif ids is None:
+        print "The jobs are spooled in", hq_spool.spoolDirectory + ", send them with --flush-spool or by opening a submit panel"
+        return 1
+
+    for (scene, mainJob), jobId in zip(submittable, ids):
+        if jobId is not None:
+            print "Submitted", scene, "to", args.server, "as job", jobId
+    submitted = [jobId for jobId in ids if jobId is not None]
+    print "Submitted", len(submitted), "of", len(scenes), "scenes in %.2fs" % (time.time() - start)
+    succeeded = len(ids) == len(scenes) and None not in ids
+    if args.watch and submitted:
+        succeeded = watchJobs(args.server, submitted) and succeeded
+    return 0 if succeeded else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,524 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import os
+import sys
+import time
+import random
+import socket
+import threading
+import httplib
+import xmlrpclib
+from xml.parsers.expat import ExpatError
+import hq_trace
+
+# Number of idle keep-alive connections kept open per server
+maxIdleTransports = 4
+
+# Seconds a successful call counts as proof that the server is alive
+healthCheckTTL = float(os.environ.get('HQUEUE_HEALTH_TTL', 30.0))
+
+# Request bodies bigger than this many bytes are gzip compressed, a negative value turns it off.
+# Anything that fits in one packet, such as a ping, is left alone.
+gzipThreshold = int(os.environ.get('HQUEUE_GZIP_THRESHOLD', 1400))
+# HTTP errors a server gives for a request body it can't decode. Only these send the first
+# compressed request again uncompressed, any other error may come after the call has run.
+gzipRefusedCodes = [400, 415, 501]
+
+# Seconds to wait for the server to accept a connection, and for it to answer a call.
+# A ping does no work on the server so it only gets the connect timeout to answer.
+connectTimeout = float(os.environ.get('HQUEUE_CONNECT_TIMEOUT', 5.0))
+readTimeout = float(os.environ.get('HQUEUE_READ_TIMEOUT', 60.0))
+
+# Calls that only read from the server are sent again this many times when the connection fails,
+# waiting retryBackoff seconds before the first retry and twice as long before each one after.
+# newjob is never sent twice, the server may have created the job before the connection dropped.
+maxRetries = int(os.environ.get('HQUEUE_RETRIES', 2))
+retryBackoff = 0.25
+idempotentMethods = ['ping', 'system.listMethods', 'system.methodHelp', 'system.methodSignature']
+
+# Once this many calls in a row could not reach a server, calls to it fail straight away for
+# breakerCooldown seconds instead of each one waiting for a timeout. Then one call is let through.
+breakerThreshold = int(os.environ.get('HQUEUE_BREAKER_FAILURES', 3))
+breakerCooldown = float(os.environ.get('HQUEUE_BREAKER_SECONDS', 30.0))
+
+#################################################################################################################################################################################################
+#### STATISTICS
+
+class connectionStats(object):
+    """Thread safe counters describing the traffic sent to one server."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {'connects': 0, 'requests': 0, 'bytes_sent': 0, 'bytes_received': 0}
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def reset(self):
+        with self._lock:
+            for name in self.counters.keys():
+                self.counters[name] = 0
+
+#################################################################################################################################################################################################
+#### ERRORS
+
+class serverError(Exception):
+    """A call that did not get a proper answer from the server. A server that
+    answers with a fault still raises xmlrpclib.Fault."""
+
+    reason = "the server did not answer properly"
+    retryable = False
+
+    def __init__(self, hq_server, method, cause):
+        Exception.__init__(self, hq_server, method, cause)
+        self.hq_server = hq_server
+        self.method = method
+        self.cause = cause
+
+    def __str__(self):
+        return "%s - %s" % (self.reason, self.cause)
+
+class serverUnreachable(serverError):
+    reason = "could not connect to the server"
+    retryable = True
+
+class serverTimeout(serverError):
+    reason = "the server did not answer in time"
+
+class connectionLost(serverError):
+    reason = "the connection to the server was lost"
+    retryable = True
+
+class serverProtocolError(serverError):
+    reason = "the server sent a bad response"
+
+    def __init__(self, hq_server, method, cause):
+        serverError.__init__(self, hq_server, method, cause)
+        # A proxy in front of the server that can't reach it yet is worth asking again
+        self.retryable = getattr(cause, 'errcode', None) in (502, 503, 504)
+
+class circuitOpenError(serverUnreachable):
+    reason = "the server has stopped answering, not trying it again yet"
+    retryable = False
+
+def classifyError(hq_server, method, error):
+    """Return the serverError matching a socket, http or xmlrpclib error, or
+    None if the error did not come from talking to the server."""
+    if isinstance(error, serverError):
+        (error.hq_server, error.method) = (hq_server, method)
+        return error
+    elif isinstance(error, socket.timeout):
+        return serverTimeout(hq_server, method, error)
+    elif isinstance(error, xmlrpclib.ProtocolError):
+        return serverProtocolError(hq_server, method, error)
+    elif isinstance(error, (xmlrpclib.ResponseError, ExpatError)):
+        return serverProtocolError(hq_server, method, error)
+    elif isinstance(error, (socket.error, httplib.HTTPException)):
+        return connectionLost(hq_server, method, error)
+    return None
+
+def isIdempotent(method, args):
+    """Return True if the call only reads from the server, so sending it twice is harmless."""
+    if method == 'system.multicall':
+        return bool(args) and all(isIdempotent(call['methodName'], call['params']) for call in args[0])
+    return method in idempotentMethods or method.startswith('get')
+
+class circuitBreaker(object):
+    """Counts the calls in a row that could not reach a server. Once there
+    are threshold of them the breaker opens and calls fail straight away.
+    After cooldown seconds one call is let through; if it gets an answer the
+    breaker closes again, otherwise it stays open for another cooldown."""
+
+    def __init__(self, threshold=None, cooldown=None):
+        self.threshold = breakerThreshold if threshold is None else threshold
+        self.cooldown = breakerCooldown if cooldown is None else cooldown
+        self.failures = 0
+        self.openedAt = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def state(self):
+        with self._lock:
+            if self.openedAt is None:
+                return 'closed'
+            elif self._trial or time.time() - self.openedAt >= self.cooldown:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        """Return True if a call may be sent, only one call is let through while half open."""
+        if self.threshold <= 0:
+            return True
+        with self._lock:
+            if self.openedAt is None:
+                return True
+            elif self._trial or time.time() - self.openedAt < self.cooldown:
+                return False
+            self._trial = True
+            return True
+
+    def retryIn(self):
+        with self._lock:
+            if self.openedAt is None:
+                return 0.0
+            return max(0.0, self.openedAt + self.cooldown - time.time())
+
+    def succeeded(self):
+        with self._lock:
+            self.failures = 0
+            self.openedAt = None
+            self._trial = False
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or (self.threshold > 0 and self.failures >= self.threshold):
+                self.openedAt = time.time()
+            self._trial = False
+
+    def cancelled(self):
+        with self._lock:
+            self._trial = False
+
+#################################################################################################################################################################################################
+#### TRANSPORT
+
+class countingHTTPConnection(httplib.HTTPConnection):
+    """A HTTPConnection that records every TCP connect it makes. Connecting
+    waits at most connectTimeout seconds, reading an answer readTimeout."""
+
+    def __init__(self, host, stats):
+        httplib.HTTPConnection.__init__(self, host, timeout=connectTimeout)
+        self.stats = stats
+        self.readTimeout = readTimeout
+
+    def connect(self):
+        try:
+            httplib.HTTPConnection.connect(self)
+        except socket.error, e:
+            raise serverUnreachable(self.host, None, e)
+        self.sock.settimeout(self.readTimeout)
+        self.stats.count('connects')
+
+    def setReadTimeout(self, seconds):
+        self.readTimeout = seconds
+        if self.sock is not None:
+            self.sock.settimeout(seconds)
+
+class keepAliveTransport(xmlrpclib.Transport):
+    """A xmlrpclib transport that keeps its HTTP/1.1 connection open
+    between requests instead of reconnecting for every call. Responses are
+    accepted gzip encoded and requests over encode_threshold bytes are
+    sent gzip encoded. Body bytes on the wire are counted in stats."""
+
+    def __init__(self, stats, encode_threshold=None):
+        xmlrpclib.Transport.__init__(self)
+        self.stats = stats
+        self.encode_threshold = encode_threshold
+        self.accept_gzip_encoding = gzipThreshold >= 0
+        self.compressed = False
+        self.lastSent = 0
+        self.lastReceived = 0
+        self.readTimeout = readTimeout
+
+    def send_content(self, connection, request_body):
+        connection.setReadTimeout(self.readTimeout)
+        connection.putheader("Content-Type", "text/xml")
+        self.compressed = self.encode_threshold is not None and len(request_body) > self.encode_threshold
+        if self.compressed:
+            connection.putheader("Content-Encoding", "gzip")
+            request_body = xmlrpclib.gzip_encode(request_body)
+        self.lastSent = len(request_body)
+        self.stats.count('bytes_sent', self.lastSent)
+        connection.putheader("Content-Length", str(len(request_body)))
+        connection.endheaders(request_body)
+
+    def parse_response(self, response):
+        self.lastReceived = int(response.getheader("content-length", 0))
+        self.stats.count('bytes_received', self.lastReceived)
+        return xmlrpclib.Transport.parse_response(self, response)
+
+    def make_connection(self, host):
+        # Reuse the open connection if it still points at the same host
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        self._connection = host, countingHTTPConnection(chost, self.stats)
+        return self._connection[1]
+
+#################################################################################################################################################################################################
+#### CONNECTION
+
+def serverURL(hq_server):
+    """Return the full http URL for the given HQ server address."""
+    if not hq_server.startswith("http://"):
+        return "http://%s" % hq_server
+    return hq_server
+
+class remoteMethod(object):
+    """A callable standing in for a single method on the HQueue server."""
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+
+    def __getattr__(self, name):
+        # Support dotted method names such as system.listMethods
+        return remoteMethod(self.connection, "%s.%s" % (self.name, name))
+
+    def __call__(self, *args):
+        return self.connection.call(self.name, *args)
+
+class hqServerConnection(object):
+    """A pooled, keep-alive connection to a single HQueue server.
+    Remote methods can be called on it directly, so it can be used
+    anywhere a xmlrpclib.ServerProxy was used before.
+
+    Calls that don't get a proper answer raise a serverError subclass.
+    Calls that only read are retried, and once the server keeps failing
+    its circuit breaker opens and calls raise circuitOpenError at once."""
+
+    def __init__(self, hq_server):
+        self.hq_server = hq_server
+        self.url = serverURL(hq_server)
+        self.stats = connectionStats()
+        self.healthTTL = healthCheckTTL
+        self.supportsMulticall = None
+        self.supportsGzip = None
+        self.lastSuccess = None
+        self.lastFailure = None
+        self.breaker = circuitBreaker()
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return remoteMethod(self, name)
+
+    def _acquireProxy(self):
+        # Hand out an idle proxy and its transport if there is one, so its socket is reused
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        transport = keepAliveTransport(self.stats, self._encodeThreshold())
+        return (xmlrpclib.ServerProxy(self.url, transport=transport, allow_none=True), transport)
+
+    def _releaseProxy(self, proxy, transport):
+        with self._lock:
+            if len(self._idle) < maxIdleTransports:
+                self._idle.append((proxy, transport))
+                return
+        proxy('close')()
+
+    def _encodeThreshold(self):
+        if self.supportsGzip is False or gzipThreshold < 0:
+            return None
+        return gzipThreshold
+
+    def call(self, method, *args):
+        """Call the named method on the server and return its result."""
+        if not self.breaker.allow():
+            self.stats.count('fast_failures')
+            raise circuitOpenError(self.hq_server, method, "%d calls in a row failed, trying again in %d seconds"
+                                   % (self.breaker.failures, self.breaker.retryIn() + 0.5))
+
+        attempt = 0
+        while True:
+            try:
+                result = self._call(method, args, self._encodeThreshold())
+            except xmlrpclib.Fault:
+                self.breaker.succeeded()
+                raise
+            except serverError, e:
+                if attempt < maxRetries and e.retryable and isIdempotent(method, args):
+                    attempt += 1
+                    self.stats.count('retries')
+                    time.sleep(retryBackoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+                    continue
+                self.breaker.failed()
+                raise
+            except Exception:
+                # Not the server's doing, such as an argument that can't be marshalled
+                self.breaker.cancelled()
+                raise
+            self.breaker.succeeded()
+            return result
+
+    def _call(self, method, args, encodeThreshold):
+        (proxy, transport) = self._acquireProxy()
+        transport.encode_threshold = encodeThreshold
+        transport.readTimeout = connectTimeout if method == 'ping' else readTimeout
+        transport.lastSent = transport.lastReceived = 0
+        self.stats.count('requests')
+        start = time.time() if hq_trace.tracer is not None else None
+        try:
+            result = getattr(proxy, method)(*args)
+        except xmlrpclib.Fault:
+            # The server answered, it just didn't like the call
+            self._trace(method, args, start, transport, 'fault')
+            self.markAlive()
+            self._releaseProxy(proxy, transport)
+            if self._gzipUntested(transport):
+                return self._callUncompressed(method, args)
+            raise
+        except Exception, e:
+            # A failed request can leave the socket in an unknown state, so drop it
+            traceback = sys.exc_info()[2]
+            classified = classifyError(self.hq_server, method, e)
+            self._trace(method, args, start, transport, type(classified or e).__name__)
+            proxy('close')()
+            if classified is None:
+                raise
+            self.lastFailure = time.time()
+            if isinstance(e, xmlrpclib.ProtocolError) and e.errcode in gzipRefusedCodes and self._gzipUntested(transport):
+                return self._callUncompressed(method, args)
+            raise classified, None, traceback
+
+        self._trace(method, args, start, transport, 'ok')
+        if self._gzipUntested(transport):
+            self.supportsGzip = True
+        self.markAlive()
+        self._releaseProxy(proxy, transport)
+        return result
+
+    def _trace(self, method, args, start, transport, outcome):
+        if start is None:
+            return
+        calls = len(args[0]) if method == 'system.multicall' and args else None
+        hq_trace.tracer.record(self.hq_server, method, start, transport.lastSent, transport.lastReceived,
+                               outcome, transport.compressed, calls)
+
+    def _gzipUntested(self, transport):
+        return transport.compressed and self.supportsGzip is None
+
+    def _callUncompressed(self, method, args):
+        # The first compressed request failed, see if the server just can't read gzip
+        result = self._call(method, args, None)
+        self.supportsGzip = False
+        return result
+
+    def batch(self, calls, raiseFaults=True):
+        """Run several independent calls and return their results in order.
+        calls is a list of (method, args) tuples. The batch is sent as one
+        system.multicall request, or as concurrent calls over at most
+        maxIdleTransports connections if the server does not support multicall. With raiseFaults off, a call that faults
+        returns its xmlrpclib.Fault instead of raising it."""
+        if not calls:
+            return []
+        elif len(calls) == 1:
+            results = [self._callCatchingFault(calls[0][0], calls[0][1])]
+        elif self.supportsMulticall is not False:
+            try:
+                results = self._multicall(calls)
+                self.supportsMulticall = True
+            except xmlrpclib.Fault:
+                # The server has no system.multicall, remember and fall back
+                self.supportsMulticall = False
+                results = self._concurrentCalls(calls)
+        else:
+            results = self._concurrentCalls(calls)
+
+        if raiseFaults:
+            for result in results:
+                if isinstance(result, xmlrpclib.Fault):
+                    raise result
+        return results
+
+    def _callCatchingFault(self, method, args):
+        try:
+            return self.call(method, *args)
+        except xmlrpclib.Fault, fault:
+            return fault
+
+    def _multicall(self, calls):
+        requests = [{'methodName': method, 'params': list(args)} for (method, args) in calls]
+        results = []
+        for result in self.call('system.multicall', requests):
+            # Each entry is either a one item list or a fault struct
+            if isinstance(result, dict):
+                results.append(xmlrpclib.Fault(result['faultCode'], result['faultString']))
+            else:
+                results.append(result[0])
+        return results
+
+    def _concurrentCalls(self, calls):
+        # One worker per pooled transport, so a big batch doesn't open a socket per call
+        results = [None] * len(calls)
+        errors = []
+        pending = range(len(calls))
+        pendingLock = threading.Lock()
+
+        def runCalls():
+            while True:
+                with pendingLock:
+                    # Once a call has raised the batch fails, so don't send the rest
+                    if not pending or errors:
+                        return
+                    index = pending.pop(0)
+                try:
+                    results[index] = self._callCatchingFault(calls[index][0], calls[index][1])
+                except Exception:
+                    errors.append(sys.exc_info())
+
+        threads = [threading.Thread(target=runCalls) for i in range(min(maxIdleTransports, len(calls)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+        return results
+
+    def markAlive(self):
+        """Record that the server has just answered a call."""
+        self.lastSuccess = time.time()
+        self.lastFailure = None
+
+    def recentlyAlive(self):
+        """Return True if the server answered a call within the health TTL
+        and has not failed since, in which case a ping can be skipped."""
+        if self.lastSuccess is None or self.lastFailure is not None or self.breaker.state() != 'closed':
+            return False
+        return time.time() - self.lastSuccess < self.healthTTL
+
+    def close(self):
+        """Close every idle connection to the server."""
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for (proxy, transport) in idle:
+            proxy('close')()
+
+#################################################################################################################################################################################################
+#### CONNECTION POOL
+
+_connections = {}
+_connectionsLock = threading.Lock()
+
+def getConnection(hq_server):
+    """Return the shared connection for the given HQ server, creating it
+    the first time the server is used."""
+    url = serverURL(hq_server)
+    with _connectionsLock:
+        connection = _connections.get(url)
+        if connection is None:
+            connection = hqServerConnection(hq_server)
+            _connections[url] = connection
+    return connection
+
+def closeAllConnections():
+    """Close and forget every pooled server connection."""
+    with _connectionsLock:
+        connections = _connections.values()
+        _connections.clear()
+    for connection in connections:
+        connection.close()
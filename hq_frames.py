@@ -0,0 +1,213 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import re
+import heapq
+
+# Labels shown in the submission panels for each chunking strategy
+chunkStrategies = {
+    'Fixed frames per chunk': 'fixed',
+    'Target time per chunk': 'time',
+    'One chunk per client': 'clients',
+}
+chunkStrategyLabels = ['Fixed frames per chunk', 'Target time per chunk', 'One chunk per client']
+
+defaultChunkSize = 10
+
+# One comma separated part of a frame expression: 5, 1-100, 1-100x2 or -5--1
+framePartPattern = re.compile(r'^\s*(-?\d+)(?:\s*-\s*(-?\d+)(?:\s*[xX:]\s*(\d+))?)?\s*$')
+
+#################################################################################################################################################################################################
+#### FRAME SETS
+
+def runLength(run):
+    return (run[1] - run[0]) // run[2] + 1
+
+def runExpression(run):
+    """Return the frame expression for a single (start, end, step) run."""
+    (start, end, step) = run
+    if start == end:
+        return str(start)
+    elif step == 1:
+        return "%d-%d" % (start, end)
+    return "%d-%dx%d" % (start, end, step)
+
+def compressFrames(frames):
+    """Return (start, end, step) runs for a sorted iterable of unique frames."""
+    runs = []
+    for frame in frames:
+        if runs:
+            (start, end, step) = runs[-1]
+            if start == end:
+                # A single frame takes the step of whatever frame follows it
+                runs[-1] = (start, frame, frame - start)
+                continue
+            elif frame == end + step:
+                runs[-1] = (start, frame, step)
+                continue
+        runs.append((frame, frame, 1))
+    return runs
+
+def normaliseRuns(runs):
+    """Sort runs, join runs that continue each other and resolve any overlaps."""
+    normalised = []
+    for run in sorted(runs):
+        if not normalised:
+            normalised.append(run)
+            continue
+
+        last = normalised[-1]
+        (start, end, step) = run
+        if start > last[1]:
+            if last[2] == step and start == last[1] + step:
+                # The run carries on where the last one stopped
+                normalised[-1] = (last[0], end, step)
+            else:
+                normalised.append(run)
+        elif last[2] == step and (start - last[0]) % step == 0:
+            # Overlapping runs on the same grid just extend each other
+            normalised[-1] = (last[0], max(last[1], end), step)
+        else:
+            # Overlapping runs on different grids are rare, expand and compress them again
+            frames = set(range(last[0], last[1] + 1, last[2])) | set(range(start, end + 1, step))
+            normalised[-1:] = compressFrames(sorted(frames))
+            normalised = normaliseRuns(normalised) if len(normalised) > 1 else normalised
+    return normalised
+
+class frameSet(object):
+    """A set of frames kept as sorted (start, end, step) runs, so even a
+    100,000 frame range costs a handful of tuples. Frames are only produced
+    lazily when the set is iterated."""
+
+    def __init__(self, runs=()):
+        self.runs = normaliseRuns([(start, start + ((end - start) // step) * step, step) for (start, end, step) in runs])
+
+    @classmethod
+    def parse(cls, expression):
+        """Parse an expression such as '1-100x2, 150, 200-210, -5--1'."""
+        runs = []
+        for part in str(expression).split(','):
+            if not part.strip():
+                continue
+            match = framePartPattern.match(part)
+            if match is None:
+                raise ValueError("Frame range is invalid: " + part.strip())
+
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) is not None else start
+            step = int(match.group(3)) if match.group(3) is not None else 1
+            if end < start or step < 1:
+                raise ValueError("Frame range is invalid: " + part.strip())
+            runs.append((start, end, step))
+
+        if not runs:
+            raise ValueError("Frame range is empty")
+        return cls(runs)
+
+    @classmethod
+    def fromFrames(cls, frames):
+        """Build a frame set from an iterable of frames."""
+        return cls(compressFrames(sorted(set(frames))))
+
+    def __iter__(self):
+        for (start, end, step) in self.runs:
+            for frame in xrange(start, end + 1, step):
+                yield frame
+
+    def __len__(self):
+        return sum(runLength(run) for run in self.runs)
+
+    def __contains__(self, frame):
+        for (start, end, step) in self.runs:
+            if start <= frame <= end and (frame - start) % step == 0:
+                return True
+        return False
+
+    def __eq__(self, other):
+        return isinstance(other, frameSet) and self.runs == other.runs
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __str__(self):
+        return ','.join(runExpression(run) for run in self.runs)
+
+    def __repr__(self):
+        return "frameSet('%s')" % str(self)
+
+    def first(self):
+        return self.runs[0][0]
+
+    def last(self):
+        return self.runs[-1][1]
+
+    def chunks(self, chunkSize):
+        """Split the set into frame sets of at most chunkSize frames, each a
+        single run. Chunk boundaries are worked out per run, so no frame
+        list is ever built."""
+        chunkSize = max(1, int(chunkSize))
+        chunks = []
+        for (start, end, step) in self.runs:
+            for chunkStart in xrange(start, end + 1, chunkSize * step):
+                chunkEnd = min(chunkStart + (chunkSize - 1) * step, end)
+                chunks.append(frameSet([(chunkStart, chunkEnd, step)]))
+        return chunks
+
+#################################################################################################################################################################################################
+#### CHUNKING
+
+def targetTimeChunkSize(targetSeconds, secondsPerFrame, startupSeconds=0.0):
+    """Return how many frames fit in a chunk that should take targetSeconds,
+    once the application's startupSeconds have been paid."""
+    if secondsPerFrame <= 0:
+        return defaultChunkSize
+    return max(1, int((targetSeconds - startupSeconds) / float(secondsPerFrame)))
+
+def splitRun(run, count):
+    """Split a run into count single run frameSets whose lengths differ by at most one frame."""
+    (start, end, step) = run
+    (size, extra) = divmod(runLength(run), count)
+    chunks = []
+    for index in range(count):
+        length = size + (1 if index < extra else 0)
+        chunks.append(frameSet([(start, start + (length - 1) * step, step)]))
+        start += length * step
+    return chunks
+
+def clientChunks(frames, clientCount):
+    """Split a frameSet into one chunk per client. A chunk is a single run, so
+    a set with more runs than there are clients gets one chunk per run. The
+    chunks are shared out between the runs so they are as even as they can be."""
+    runs = frames.runs
+    chunkCount = min(max(clientCount, len(runs)), len(frames))
+    counts = [1] * len(runs)
+    # Each extra chunk goes to the run whose chunks are currently the longest
+    longest = [(-runLength(run), index) for index, run in enumerate(runs)]
+    heapq.heapify(longest)
+    for i in range(chunkCount - len(runs)):
+        (length, index) = heapq.heappop(longest)
+        counts[index] += 1
+        heapq.heappush(longest, (-runLength(runs[index]) / float(counts[index]), index))
+
+    chunks = []
+    for run, count in zip(runs, counts):
+        chunks.extend(splitRun(run, count))
+    return chunks
+
+def chunkFrames(frames, strategy='fixed', value=defaultChunkSize, secondsPerFrame=0.0, startupSeconds=0.0):
+    """Split a frameSet into chunk frameSets using one of the strategies:
+    'fixed'   - value frames per chunk.
+    'time'    - chunks that take about value seconds given secondsPerFrame and startupSeconds.
+    'clients' - one chunk for each of value clients, or one per run if there are more runs.
+    A chunk never reaches past the last frame of the run it was cut from.
+    """
+    if strategy == 'fixed':
+        chunkSize = value
+    elif strategy == 'time':
+        chunkSize = targetTimeChunkSize(value, secondsPerFrame, startupSeconds)
+    elif strategy == 'clients':
+        return clientChunks(frames, value)
+    else:
+        raise ValueError("Unknown chunking strategy: " + str(strategy))
+
+    return frames.chunks(chunkSize)
@@ -0,0 +1,131 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import os
+import os.path
+import json
+import time
+import threading
+import xmlrpclib
+import hq_connection
+
+# Every submitted job is appended here as one line of JSON
+ledgerLocation = os.path.join(os.path.expanduser('~'), '.hQueueLedger.dat')
+# Once the ledger grows past this many bytes the oldest half is dropped
+maxLedgerBytes = 50 * 1024 * 1024
+
+# Chunks in these states are sent again by hq_submit.retryFailed
+retryStatuses = ['failed', 'cancelled', 'abandoned']
+
+_ledgerLock = threading.Lock()
+
+#################################################################################################################################################################################################
+#### LEDGER
+
+def appendLine(record):
+    with _ledgerLock:
+        with open(ledgerLocation, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        if os.path.getsize(ledgerLocation) > maxLedgerBytes:
+            trimLedger()
+
+def trimLedger():
+    with open(ledgerLocation, 'r') as f:
+        lines = f.readlines()
+    temporary = ledgerLocation + '.tmp'
+    with open(temporary, 'w') as f:
+        f.writelines(lines[len(lines) // 2:])
+    if os.path.exists(ledgerLocation):
+        os.remove(ledgerLocation)
+    os.rename(temporary, ledgerLocation)
+
+def readLedger():
+    """Return every recorded submission, oldest first. Lines that only add
+    the child ids of a job are merged into its entry."""
+    if not os.path.isfile(ledgerLocation):
+        return []
+    entries = []
+    byJob = {}
+    with _ledgerLock:
+        with open(ledgerLocation, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash, skip it
+                    continue
+                key = (hq_connection.serverURL(record['server']), record['jobId'])
+                if 'job' in record:
+                    byJob[key] = record
+                    entries.append(record)
+                elif key in byJob:
+                    byJob[key]['childIds'] = record['childIds']
+    return entries
+
+def recordSubmission(hq_server, jobId, main_job):
+    """Add a submitted job to the ledger with the spec of every chunk, so its
+    failed chunks can be sent again later."""
+    try:
+        appendLine({
+            'server': hq_server,
+            'jobId': jobId,
+            'name': main_job['name'],
+            'submitted': time.time(),
+            'job': dict((key, value) for (key, value) in main_job.items() if key != 'children'),
+            'chunks': main_job.get('children', []),
+            'childIds': None,
+        })
+    except (IOError, OSError), e:
+        print "Could not record job", jobId, "in the ledger -", e
+
+def recordChildIds(entry, childIds):
+    entry['childIds'] = childIds
+    try:
+        appendLine({'server': entry['server'], 'jobId': entry['jobId'], 'childIds': childIds})
+    except (IOError, OSError), e:
+        print "Could not record the chunks of job", entry['jobId'], "in the ledger -", e
+
+def findEntry(hq_server, jobId=None):
+    """Return the ledger entry of a job, or of the last job submitted to the server."""
+    url = hq_connection.serverURL(hq_server)
+    for entry in reversed(readLedger()):
+        if hq_connection.serverURL(entry['server']) == url and (jobId is None or entry['jobId'] == jobId):
+            return entry
+    return None
+
+#################################################################################################################################################################################################
+#### RETRY
+
+def chunkStatuses(s, entry):
+    """Return the status of every chunk of a ledger entry by chunk name, or
+    None if the server could not be asked. Once the chunk ids are known the
+    statuses are one batched call."""
+    try:
+        if entry.get('childIds'):
+            names = sorted(entry['childIds'].keys())
+            results = s.batch([('getJob', (entry['childIds'][name], ['status'])) for name in names], raiseFaults=False)
+            return dict((name, result.get('status')) for name, result in zip(names, results)
+                        if isinstance(result, dict))
+
+        # The first look at a job asks for its chunks by id and remembers them
+        parent = s.getJob(entry['jobId'], ['children'])
+        children = (parent or {}).get('children') or []
+        results = s.batch([('getJob', (childId, ['name', 'status'])) for childId in children], raiseFaults=False)
+    except (xmlrpclib.Error, hq_connection.serverError, IOError, OSError), e:
+        print "Could not get the chunks of job", entry['jobId'], "from", entry['server'], "-", e
+        return None
+
+    chunks = [(childId, result) for childId, result in zip(children, results) if isinstance(result, dict)]
+    recordChildIds(entry, dict((result['name'], childId) for (childId, result) in chunks))
+    return dict((result['name'], result.get('status')) for (childId, result) in chunks)
+
+def failedChunks(s, entry):
+    """Return the specs of the chunks of a ledger entry that failed or were cancelled."""
+    statuses = chunkStatuses(s, entry)
+    if statuses is None:
+        return None
+    return [chunk for chunk in entry['chunks'] if statuses.get(chunk['name']) in retryStatuses]
+
+def buildRetryJob(entry, chunks):
+    """Return the original parent job with only the given chunks under it."""
+    return dict(entry['job'], name=entry['name'] + " (retry failed)", children=chunks)
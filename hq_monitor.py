@@ -0,0 +1,165 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import threading
+import xmlrpclib
+import hq_connection
+
+# A job the server doesn't know, it was deleted or the monitor is asking the wrong server
+missingStatus = 'missing'
+# Polls in a row a job can be unknown to the server before it is given up on
+maxMissingPolls = 3
+
+# Statuses a job never leaves on its own
+finishedStatuses = ['succeeded', 'failed', 'cancelled', 'abandoned', missingStatus]
+# Statuses of chunks that are waiting for, or just being handed to, a client
+startingStatuses = [None, 'waiting', 'scheduled', 'assigned']
+
+# Seconds between polls, polling speeds up while chunks start and backs off while they run
+minPollInterval = 2.0
+maxPollInterval = 30.0
+pollBackoff = 1.5
+
+#################################################################################################################################################################################################
+#### MONITOR
+
+def runDirectly(function, args):
+    function(*args)
+
+class jobMonitor(object):
+    """Follows submitted jobs and every job under them. jobIds is one id or
+    a list of them, such as every scene of a batch. Each poll is one
+    batched getJob request for the whole tree, sent as a single
+    system.multicall where the server supports it. Only jobs whose children
+    are not known yet are asked for their children.
+
+    onChange is called with the monitor and a dict of the jobs whose status
+    changed, {jobId: (oldStatus, newStatus)}, so a UI only redraws what moved.
+    A job the server still doesn't know after maxMissingPolls polls is given
+    the finished status 'missing' and is no longer asked for."""
+
+    def __init__(self, hq_server, jobIds, onChange=None, dispatch=runDirectly,
+                 minInterval=minPollInterval, maxInterval=maxPollInterval):
+        self.hq_server = hq_server
+        self.jobIds = list(jobIds) if isinstance(jobIds, (list, tuple)) else [jobIds]
+        self.onChange = onChange
+        self.dispatch = dispatch
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.interval = minInterval
+        self.statuses = dict((jobId, None) for jobId in self.jobIds)
+        self.names = {}
+        self.children = {}
+        self.missing = {}
+        self.polls = 0
+        self.errors = 0
+        self.thread = None
+        self._stop = threading.Event()
+
+    def poll(self):
+        """Ask the server for the status of every job in the tree and return
+        the changes. Returns None if the server could not be reached."""
+        calls = []
+        for jobId in self.trackedJobs():
+            if self.statuses[jobId] == missingStatus:
+                continue
+            attribs = ['status'] if jobId in self.children else ['name', 'status', 'children']
+            calls.append(('getJob', (jobId, attribs)))
+
+        try:
+            results = hq_connection.getConnection(self.hq_server).batch(calls, raiseFaults=False)
+        except Exception, e:
+            self.errors += 1
+            self.interval = min(self.interval * pollBackoff, self.maxInterval)
+            print "Could not get the status of", self.jobName(), "from", self.hq_server, "-", e
+            return None
+        self.polls += 1
+
+        changes = {}
+        for (method, (jobId, attribs)), job in zip(calls, results):
+            if isinstance(job, xmlrpclib.Fault) or not job:
+                self.missing[jobId] = self.missing.get(jobId, 0) + 1
+                if self.missing[jobId] >= maxMissingPolls:
+                    print "Job", jobId, "is not on", self.hq_server + ", no longer following it"
+                    changes[jobId] = (self.statuses.get(jobId), missingStatus)
+                    self.statuses[jobId] = missingStatus
+                continue
+            self.missing.pop(jobId, None)
+            if 'children' in attribs:
+                self.names[jobId] = job.get('name')
+                self.children[jobId] = list(job.get('children') or [])
+                for childId in self.children[jobId]:
+                    self.statuses.setdefault(childId, None)
+            status = job.get('status')
+            if status != self.statuses.get(jobId):
+                changes[jobId] = (self.statuses.get(jobId), status)
+                self.statuses[jobId] = status
+
+        self.interval = self.nextInterval(changes)
+        if changes and self.onChange is not None:
+            self.dispatch(self.onChange, (self, changes))
+        return changes
+
+    def trackedJobs(self):
+        return sorted(self.statuses.keys())
+
+    def leafJobs(self):
+        """Return the ids of the jobs that run a command, the chunks."""
+        return [jobId for jobId in self.trackedJobs() if self.children.get(jobId) == []]
+
+    def nextInterval(self, changes):
+        # New jobs to look at, chunks moving or chunks still starting up, poll again soon
+        if changes or any(self.statuses[jobId] in startingStatuses for jobId in self.leafJobs()) or self.unlistedJobs():
+            return self.minInterval
+        return min(self.interval * pollBackoff, self.maxInterval)
+
+    def jobName(self):
+        return ("job " if len(self.jobIds) == 1 else "jobs ") + ', '.join(str(jobId) for jobId in self.jobIds)
+
+    def status(self):
+        """Return the status shared by the followed jobs, or the first unfinished one."""
+        statuses = [self.statuses[jobId] for jobId in self.jobIds]
+        unfinished = [status for status in statuses if status not in finishedStatuses]
+        if unfinished:
+            return unfinished[0]
+        return 'failed' if 'failed' in statuses else statuses[0]
+
+    def unlistedJobs(self):
+        """Return the jobs whose children have not been asked for yet."""
+        return [jobId for jobId in self.statuses
+                if jobId not in self.children and self.statuses[jobId] != missingStatus]
+
+    def finished(self):
+        # A job can finish before its chunks are listed, they are listed first so the summary is complete
+        return all(self.statuses[jobId] in finishedStatuses for jobId in self.jobIds) and not self.unlistedJobs()
+
+    def summary(self):
+        """Return how many chunks are in each status."""
+        counts = {}
+        for jobId in self.leafJobs():
+            counts[self.statuses[jobId]] = counts.get(self.statuses[jobId], 0) + 1
+        return counts
+
+    def summaryText(self):
+        counts = self.summary()
+        text = ', '.join('%d %s' % (counts[status], status) for status in sorted(counts, key=str))
+        name = self.jobName()
+        return "%s %s: %s" % (name[0].upper() + name[1:], self.status() or 'submitted', text or 'waiting for chunks')
+
+    def watch(self):
+        """Poll until the job finishes or the monitor is stopped."""
+        while not self._stop.is_set():
+            self.poll()
+            if self.finished():
+                break
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Watch the job on a background thread."""
+        self.thread = threading.Thread(target=self.watch)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
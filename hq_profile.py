@@ -0,0 +1,80 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import os
+import os.path
+import re
+import cProfile
+import datetime
+import threading
+import functools
+import hq_submit
+
+# Profiles are written here as <scene>_<function>_<timestamp>.prof, open them with pstats or snakeviz
+profileDirectory = os.path.join(os.path.expanduser('~'), '.hQueueProfiles')
+
+#################################################################################################################################################################################################
+#### SWITCH
+
+def isTrue(value):
+    if isinstance(value, basestring):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+def profilingEnabled():
+    """Profiling is on if HQUEUE_PROFILE is set, or "Profile" is true in ~/.hQueueConfig.dat."""
+    if 'HQUEUE_PROFILE' in os.environ:
+        return isTrue(os.environ['HQUEUE_PROFILE'])
+    try:
+        return isTrue(hq_submit.readConfig().get('Profile', False))
+    except (IOError, OSError, ValueError):
+        return False
+
+# Worked out once, so the panels pay nothing when profiling is off
+enabled = profilingEnabled()
+
+#################################################################################################################################################################################################
+#### PROFILING
+
+_active = threading.local()
+
+def profileLocation(sceneName, functionName):
+    scene = os.path.splitext(os.path.basename(sceneName or ''))[0] or 'untitled'
+    scene = re.sub(r'[^\w.-]+', '_', scene)
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    return os.path.join(profileDirectory, '%s_%s_%s.prof' % (scene, functionName, timestamp))
+
+def writeProfile(profile, sceneName, functionName):
+    try:
+        if not os.path.isdir(profileDirectory):
+            os.makedirs(profileDirectory)
+        profile.dump_stats(profileLocation(sceneName, functionName))
+    except (IOError, OSError), e:
+        print "Could not write the profile of", functionName, "-", e
+
+def profiled(sceneName):
+    """Decorator that runs a function under cProfile and writes its profile
+    when it returns. sceneName is called to name the file after the open
+    scene. With profiling off the function is returned unchanged. Calls made
+    while another profiled function is running are part of its profile."""
+    def decorate(function):
+        if not enabled:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if getattr(_active, 'profiling', False):
+                return function(*args, **kwargs)
+            _active.profiling = True
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(function, *args, **kwargs)
+            finally:
+                _active.profiling = False
+                try:
+                    scene = sceneName()
+                except Exception:
+                    scene = None
+                writeProfile(profile, scene, function.__name__)
+        return wrapper
+    return decorate
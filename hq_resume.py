@@ -0,0 +1,154 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import os
+import os.path
+import re
+import hq_frames
+import hq_submit
+
+try:
+    # Python 3, or the scandir backport, reads the directory and file types in one pass
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# Frame number tokens in output paths: ####, @@@, %04d, %d, $F4 and $F
+frameTokenPattern = re.compile(r'(#+|@+|%0?(\d*)d|\$F(\d?))')
+
+# A Write node file knob in a .nk script, e.g. "file /renders/sh010/comp.####.exr"
+nukeWriteFilePattern = re.compile(r'^\s*file\s+("(?:[^"\\]|\\.)*"|\S+)\s*$')
+
+#################################################################################################################################################################################################
+#### OUTPUT PATHS
+
+def outputPattern(outputPath):
+    """Split an output path into its directory and a regex matching the file
+    names of its frames, with the frame number as group 1. Returns None if
+    the path has no frame token or the token is in the directory."""
+    directory, fileName = os.path.split(outputPath)
+    if frameTokenPattern.search(directory):
+        return None
+
+    pattern = ''
+    last = 0
+    found = False
+    for match in frameTokenPattern.finditer(fileName):
+        pattern += re.escape(fileName[last:match.start()])
+        token = match.group(1)
+        if token[0] in '#@':
+            padding = len(token)
+        else:
+            padding = int(match.group(2) or match.group(3) or 1)
+        # A padded number can grow past its padding, e.g. frame 10000 in ####
+        frameGroup = '(-?\\d{%d,})' % padding
+        pattern += frameGroup if not found else '\\1'
+        found = True
+        last = match.end()
+    if not found:
+        return None
+    pattern += re.escape(fileName[last:])
+    return (directory or '.', re.compile('^' + pattern + '$'))
+
+def nukeScriptOutputs(scriptPath):
+    """Return the file knobs of the enabled Write nodes in a .nk script, read
+    as text so Nuke is not needed. Paths built from expressions are skipped."""
+    outputs = []
+    inWrite = False
+    path = None
+    disabled = False
+    with open(scriptPath, 'r') as f:
+        for line in f:
+            stripped = line.strip()
+            if not inWrite:
+                inWrite = stripped == 'Write {'
+                path = None
+                disabled = False
+                continue
+            if stripped == '}':
+                if path and not disabled and '[' not in path:
+                    outputs.append(path)
+                inWrite = False
+                continue
+            match = nukeWriteFilePattern.match(line)
+            if match is not None:
+                path = match.group(1).strip('"')
+            elif stripped in ('disable true', 'disable 1'):
+                disabled = True
+    return outputs
+
+#################################################################################################################################################################################################
+#### SCANNING
+
+def nonEmptyFiles(directory):
+    """Yield (name, size) for the entries of a directory, read in a single
+    pass. size is a function, so only the files the caller wants are stat'ed."""
+    if scandir is not None:
+        for entry in scandir(directory):
+            yield entry.name, lambda entry=entry: entry.stat().st_size if entry.is_file() else 0
+    else:
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            yield name, lambda path=path: os.path.getsize(path) if os.path.isfile(path) else 0
+
+def scanRenderedFrames(directory, patterns, frames):
+    """Return a set of rendered frames for every pattern in one directory.
+    Only files whose name matches a pattern and whose frame was asked for
+    are stat'ed, so a share holding 100k other files costs one listing."""
+    rendered = [set() for pattern in patterns]
+    try:
+        files = list(nonEmptyFiles(directory))
+    except OSError:
+        # Nothing has been rendered into a directory that doesn't exist yet
+        return rendered
+
+    for name, size in files:
+        for index, pattern in enumerate(patterns):
+            match = pattern.match(name)
+            if match is None:
+                continue
+            frame = int(match.group(1))
+            if frame in frames and frame not in rendered[index] and size() > 0:
+                rendered[index].add(frame)
+    return rendered
+
+def renderedFrames(outputPaths, frames):
+    """Return the frames of a frameSet that already exist, and are not empty,
+    for every one of the output paths. Each directory is listed once and the
+    directories are listed side by side, which is what costs time on a share."""
+    patterns = [outputPattern(outputPath) for outputPath in outputPaths]
+    unknown = [outputPath for outputPath, pattern in zip(outputPaths, patterns) if pattern is None]
+    if unknown or not patterns:
+        for outputPath in unknown:
+            print "Cannot find the frame number in output path:", outputPath
+        return set()
+
+    directories = {}
+    for (directory, pattern) in patterns:
+        directories.setdefault(directory, []).append(pattern)
+    wanted = set(frames)
+    scans = hq_submit.runConcurrently(scanRenderedFrames, [(directory, directoryPatterns, wanted)
+                                                           for (directory, directoryPatterns) in directories.items()])
+
+    rendered = None
+    for result in scans:
+        if isinstance(result, Exception):
+            print "Could not scan for rendered frames -", result
+            return set()
+        for outputFrames in result:
+            rendered = outputFrames if rendered is None else rendered & outputFrames
+    return rendered or set()
+
+def missingFrames(outputPaths, frames):
+    """Return the frames of a frameSet still to be rendered, or None if they
+    are all on disk already."""
+    rendered = renderedFrames(outputPaths, frames)
+    if not rendered:
+        return frames
+    missing = [frame for frame in frames if frame not in rendered]
+    if not missing:
+        return None
+    return hq_frames.frameSet.fromFrames(missing)
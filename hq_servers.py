@@ -0,0 +1,98 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import os
+import time
+import threading
+import xmlrpclib
+import hq_connection
+import hq_cache
+
+# The queue depth is the number of jobs in hq_cache.queuedStatuses. The server can only list
+# their ids, so the depth is cached for HQUEUE_QUEUE_DEPTH_TTL seconds rather than listing
+# them on every probe. A server that can't list them is still used, it is just ranked behind
+# the servers whose queue is known.
+
+# Seconds the probe round waits for every server, a server that hasn't answered by then is skipped
+probeTimeout = float(os.environ.get('HQUEUE_PROBE_TIMEOUT', 10.0))
+
+#################################################################################################################################################################################################
+#### PROBING
+
+class serverProbe(object):
+    """What one probe found out about a server. index is the server's place
+    in the configured list, which decides between equally loaded servers.
+    hqRoot is where the server's clients mount $HQROOT, None if unknown."""
+
+    def __init__(self, hq_server, index=0):
+        self.hq_server = hq_server
+        self.index = index
+        self.reachable = False
+        self.queueDepth = None
+        self.hqRoot = None
+        self.seconds = None
+        self.error = "did not answer within %g seconds" % probeTimeout
+
+    def rank(self):
+        return (not self.reachable, self.queueDepth is None, self.queueDepth, self.index)
+
+    def describe(self):
+        if not self.reachable:
+            return "%s unreachable (%s)" % (self.hq_server, self.error)
+        elif self.queueDepth is None:
+            return "%s answered in %.2fs, queue unknown" % (self.hq_server, self.seconds)
+        return "%s answered in %.2fs, %d jobs queued" % (self.hq_server, self.seconds, self.queueDepth)
+
+def probeServer(hq_server, index=0, probe=None):
+    """Ping a server, then ask where it mounts $HQROOT and how many jobs it has queued."""
+    probe = probe or serverProbe(hq_server, index)
+    s = hq_connection.getConnection(hq_server)
+    start = time.time()
+    try:
+        s.ping()
+    except (xmlrpclib.Fault, hq_connection.serverError), e:
+        probe.error = str(e)
+        return probe
+    probe.seconds = time.time() - start
+    probe.reachable = True
+    probe.error = None
+
+    try:
+        # Cached for a day, so this is rarely a call
+        probe.hqRoot = hq_cache.metadata.getOrFetch(s, 'hq_root')
+    except (xmlrpclib.Fault, hq_connection.serverError):
+        pass
+
+    try:
+        probe.queueDepth = hq_cache.metadata.getOrFetch(s, 'queue_depth')
+    except (xmlrpclib.Fault, hq_connection.serverError, TypeError):
+        # Not every version of the server can list its jobs by status
+        pass
+    return probe
+
+def probeServers(servers):
+    """Probe every server at the same time and return their probes in list
+    order. The round takes at most probeTimeout, however many servers there are."""
+    probes = [serverProbe(hq_server, index) for index, hq_server in enumerate(servers)]
+    threads = [threading.Thread(target=probeServer, args=(probe.hq_server, probe.index, probe)) for probe in probes]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    deadline = time.time() + probeTimeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.time()))
+    # A server still being probed is left to finish in the background and counted as unreachable
+    return [probe if not thread.is_alive() else serverProbe(probe.hq_server, probe.index)
+            for probe, thread in zip(probes, threads)]
+
+def rankServers(servers):
+    """Return the probes of the servers, the reachable ones first and the least
+    loaded of those first. Servers that are as loaded as each other keep their order."""
+    return sorted(probeServers(servers), key=serverProbe.rank)
+
+def jobsSent(hq_server):
+    """Forget the server's cached queue depth once jobs have been sent to it,
+    so the next round doesn't rank it by the queue it had before."""
+    if hq_cache.metadata.get(hq_server, 'queue_depth') is not None:
+        hq_cache.metadata.invalidate(hq_server, 'queue_depth')
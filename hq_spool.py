@@ -0,0 +1,196 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import os
+import os.path
+import json
+import time
+import random
+import hashlib
+import threading
+
+# Jobs that could not reach the server wait here, next to ~/.hQueueConfig.dat, one file per job
+spoolDirectory = os.path.join(os.path.expanduser('~'), '.hQueueSpool')
+# Jobs the server refused are moved here rather than retried forever
+rejectedDirectory = os.path.join(spoolDirectory, 'rejected')
+
+# Seconds between attempts to reach a server, doubled after every failure up to the maximum.
+# Every wait is jittered so artists don't all hit a restarted server at the same moment.
+spoolRetrySeconds = 5.0
+maxSpoolRetrySeconds = 300.0
+spoolJitter = 0.5
+
+# A claimed job older than this is assumed to belong to a session that crashed while sending it
+staleClaimSeconds = 600.0
+
+_spoolLock = threading.Lock()
+_sequence = [0]
+
+#################################################################################################################################################################################################
+#### SPOOL
+
+def specHash(hq_server, main_job):
+    return hashlib.sha1(hq_server + json.dumps(main_job, sort_keys=True)).hexdigest()
+
+def spoolJob(hq_server, main_job):
+    """Write a fully built job to the spool. A job that is already spooled
+    for the same server is not written twice. Returns the job's hash."""
+    key = specHash(hq_server, main_job)
+    with _spoolLock:
+        if not os.path.isdir(spoolDirectory):
+            os.makedirs(spoolDirectory)
+        if any(name.split('_')[-1].split('.')[0] == key for name in os.listdir(spoolDirectory)):
+            return key
+
+        # The file name starts with the time it was spooled so the jobs sort in submission order
+        _sequence[0] += 1
+        name = '%017.6f_%06d_%s' % (time.time(), _sequence[0] % 1000000, key)
+        temporary = os.path.join(spoolDirectory, name + '.tmp')
+        with open(temporary, 'w') as f:
+            json.dump({'server': hq_server, 'job': main_job, 'spooled': time.time()}, f)
+        os.rename(temporary, os.path.join(spoolDirectory, name + '.json'))
+    print "The server", hq_server, "could not be reached,", main_job['name'], "will be submitted when it is back"
+    return key
+
+def spooledJobs():
+    """Return the paths of the spooled jobs in the order they were submitted."""
+    if not os.path.isdir(spoolDirectory):
+        return []
+    return [os.path.join(spoolDirectory, name) for name in sorted(os.listdir(spoolDirectory)) if name.endswith('.json')]
+
+def claimJob(path):
+    """Rename a spooled job so no other session sends it too. Returns the
+    claimed path, or None if another session got there first."""
+    claimed = path[:-len('.json')] + '.sending'
+    try:
+        os.rename(path, claimed)
+    except OSError:
+        return None
+    return claimed
+
+def releaseJob(claimed):
+    os.rename(claimed, claimed[:-len('.sending')] + '.json')
+
+def rejectJob(claimed):
+    if not os.path.isdir(rejectedDirectory):
+        os.makedirs(rejectedDirectory)
+    os.rename(claimed, os.path.join(rejectedDirectory, os.path.basename(claimed)[:-len('.sending')] + '.json'))
+
+def releaseStaleClaims():
+    if not os.path.isdir(spoolDirectory):
+        return
+    for name in os.listdir(spoolDirectory):
+        path = os.path.join(spoolDirectory, name)
+        if name.endswith('.sending') and time.time() - os.path.getmtime(path) > staleClaimSeconds:
+            try:
+                releaseJob(path)
+            except OSError:
+                pass
+
+#################################################################################################################################################################################################
+#### FLUSHER
+
+def retryDelay(failures):
+    delay = min(spoolRetrySeconds * 2 ** max(0, failures - 1), maxSpoolRetrySeconds)
+    return delay * random.uniform(1.0 - spoolJitter, 1.0 + spoolJitter)
+
+class spoolFlusher(object):
+    """Drains the spool on a background thread. Jobs for a server are sent in
+    the order they were spooled; once one can't reach its server the rest of
+    that server's jobs wait for the next attempt, which backs off with jitter.
+
+    submit is called as submit(hq_server, main_job) and returns the job ids,
+    None if the server could not be reached or False if the job was refused,
+    or may have reached the server, and must not be sent again."""
+
+    def __init__(self, submit):
+        self.submit = submit
+        self.failures = {}
+        self.nextAttempt = {}
+        self.thread = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+            else:
+                # A job has just been spooled, have another look
+                self._wake.set()
+        return self
+
+    def run(self):
+        releaseStaleClaims()
+        while True:
+            nextAttempt = self.flush()
+            if nextAttempt is None:
+                with self._lock:
+                    # Stop unless a job was spooled while the last ones were sent
+                    if not self._wake.is_set():
+                        self.thread = None
+                        return
+                self._wake.clear()
+                continue
+            self._wake.wait(max(0.0, nextAttempt - time.time()))
+            self._wake.clear()
+
+    def flush(self):
+        """Send every spooled job whose server is due an attempt. Returns when
+        the next attempt is due, or None once the spool is empty."""
+        waiting = set()
+        for path in spooledJobs():
+            try:
+                with open(path, 'r') as f:
+                    record = json.load(f)
+            except (IOError, OSError, ValueError):
+                # Another session has just claimed or sent it
+                continue
+            hq_server = record['server']
+            if hq_server in waiting or time.time() < self.nextAttempt.get(hq_server, 0):
+                # Keep the server's jobs in order behind the one that couldn't be sent
+                waiting.add(hq_server)
+                continue
+
+            claimed = claimJob(path)
+            if claimed is None:
+                continue
+            try:
+                ids = self.submit(hq_server, record['job'])
+            except Exception, e:
+                # Nothing says the job didn't reach the server, so it isn't sent again
+                print "Could not send the spooled job", record['job']['name'], "-", e
+                ids = False
+            if ids is None:
+                releaseJob(claimed)
+                failures = self.failures.get(hq_server, 0) + 1
+                self.failures[hq_server] = failures
+                self.nextAttempt[hq_server] = time.time() + retryDelay(failures)
+                waiting.add(hq_server)
+            elif ids is False:
+                print "The spooled job", record['job']['name'], "was not submitted, it has been moved to", rejectedDirectory
+                rejectJob(claimed)
+            else:
+                print "Submitted the spooled job", record['job']['name'], "to", hq_server, "as job", ids[0]
+                os.remove(claimed)
+                self.failures.pop(hq_server, None)
+                self.nextAttempt.pop(hq_server, None)
+
+        if not waiting:
+            return None
+        return min(self.nextAttempt.get(hq_server, 0) for hq_server in waiting)
+
+_flusher = None
+_flusherLock = threading.Lock()
+
+def startFlusher(submit):
+    """Start draining the spool in the background, unless it is already being drained."""
+    global _flusher
+    with _flusherLock:
+        if _flusher is None:
+            _flusher = spoolFlusher(submit)
+    if spooledJobs():
+        _flusher.start()
+    return _flusher
@@ -0,0 +1,305 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import sys
+import time
+import random
+import argparse
+import threading
+import xmlrpclib
+import SocketServer
+import SimpleXMLRPCServer
+
+defaultHQRoot = {'linux': '/mnt/hq', 'windows': 'Q:', 'macosx': '/Volumes/hq'}
+
+# Event and status names handed out by the email event name calls
+emailEventNames = {
+    'getStartedJobEventNames': ['started'],
+    'getSucceededStatusNames': ['succeeded'],
+    'getFailedJobStatusNames': ['failed', 'abandoned'],
+    'getPausedJobStatusNames': ['paused'],
+    'getResumedEventNames': ['resumed'],
+    'getRescheduledEventNames': ['rescheduled'],
+    'getPriorityChangedEventNames': ['priorityChanged'],
+}
+
+#################################################################################################################################################################################################
+#### SERVER
+
+class keepAliveRequestHandler(SimpleXMLRPCServer.SimpleXMLRPCRequestHandler):
+    # HTTP/1.1 lets the client keep its socket open between calls
+    protocol_version = "HTTP/1.1"
+
+class plainRequestHandler(keepAliveRequestHandler):
+    """A handler for a server that knows nothing about gzip, like older HQueue servers."""
+    encode_threshold = None
+
+    def decode_request_content(self, data):
+        return data
+
+class injectedFailure(Exception):
+    pass
+
+class threadedXMLRPCServer(SocketServer.ThreadingMixIn, SimpleXMLRPCServer.SimpleXMLRPCServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    latency = 0.0
+    requests = 0
+    standin = None
+
+    def _marshaled_dispatch(self, data, dispatch_method=None, path=None):
+        # Every HTTP request is one round trip, however many calls it carries
+        self.requests += 1
+        time.sleep(self.latency)
+        if self.standin.failuresInjected():
+            # Raising here, outside of dispatching, makes the handler answer with a HTTP 500
+            for method in ['request', self.standin.requestMethod(data)]:
+                if self.standin.takeFailure(method, 'error'):
+                    raise injectedFailure("Injected error in " + method)
+        return SimpleXMLRPCServer.SimpleXMLRPCServer._marshaled_dispatch(self, data, dispatch_method, path)
+
+    def _dispatch(self, method, params):
+        # Raising while dispatching is sent back as a Fault
+        if self.standin.takeFailure(method, 'fault'):
+            raise injectedFailure("Injected fault in " + method)
+        return SimpleXMLRPCServer.SimpleXMLRPCServer._dispatch(self, method, params)
+
+class standinServer(object):
+    """A local stand-in for an HQueue server implementing every call this
+    project makes. It records submitted jobs, counts connections and round
+    trips, and can add latency or inject failures.
+
+    Failures are injected per method, or for 'request' to fail any HTTP
+    request. A 'fault' comes back as a xmlrpclib.Fault and an 'error' as a
+    HTTP 500, which the client sees as a ProtocolError. An 'error' only
+    matches the method a request calls directly, not calls inside a multicall.
+    """
+
+    def __init__(self, latency=0.0, multicall=True, clientCount=1, gzip=True, hqRoot=None,
+                 port=0, jobSeconds=0.0, jobFailureRate=0.0, seed=None):
+        self.connects = 0
+        self.hqRoot = dict(hqRoot or defaultHQRoot)
+        self.clients = [{'id': i, 'hostname': 'render%03d' % i, 'os': 'linux', 'ip': '10.0.0.%d' % (i % 250 + 1)}
+                        for i in range(1, clientCount + 1)]
+        self.clientGroups = [{'name': 'linux_farm'}]
+        self.jobs = {}
+        self.submissions = []
+        self.jobSeconds = jobSeconds
+        self.jobFailureRate = jobFailureRate
+        self.failures = {}
+        self.failureRates = {}
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        requestHandler = keepAliveRequestHandler if gzip else plainRequestHandler
+        self.server = threadedXMLRPCServer(("127.0.0.1", port), requestHandler=requestHandler,
+                                           allow_none=True, logRequests=False)
+        self.server.latency = latency
+        self.server.standin = self
+        if multicall:
+            self.server.register_multicall_functions()
+        self.server.register_function(lambda: True, 'ping')
+        self.server.register_function(self.getHQRoot, 'getHQRoot')
+        self.server.register_function(self.getClients, 'getClients')
+        self.server.register_function(lambda: self.clientGroups, 'getClientGroups')
+        self.server.register_function(self.newjob, 'newjob')
+        self.server.register_function(self.getJob, 'getJob')
+        self.server.register_function(self.getJobIdsByStatus, 'getJobIdsByStatus')
+        for method in emailEventNames.keys():
+            self.server.register_function(lambda method=method: emailEventNames[method], method)
+
+        # Count every accepted socket
+        finish_request = self.server.finish_request
+        def countingFinishRequest(request, client_address):
+            self.connects += 1
+            finish_request(request, client_address)
+        self.server.finish_request = countingFinishRequest
+
+        self.address = "127.0.0.1:%d" % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    @requests.setter
+    def requests(self, value):
+        self.server.requests = value
+
+    @property
+    def latency(self):
+        return self.server.latency
+
+    @latency.setter
+    def latency(self, value):
+        self.server.latency = value
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serveForever(self):
+        self.server.serve_forever()
+
+    ##########################################################################################
+    #### FAILURE INJECTION
+
+    def failNext(self, method, count=1, kind='fault'):
+        """Make the next count calls of method fail with a 'fault' or an 'error'."""
+        with self._lock:
+            self.failures[method] = [count, kind]
+
+    def setFailureRate(self, method, rate, kind='fault'):
+        """Make a fraction of the calls of method fail with a 'fault' or an 'error'."""
+        with self._lock:
+            self.failureRates[method] = (rate, kind)
+
+    def failuresInjected(self):
+        return bool(self.failures or self.failureRates)
+
+    def requestMethod(self, data):
+        try:
+            return xmlrpclib.loads(data)[1]
+        except Exception:
+            return None
+
+    def takeFailure(self, method, kind):
+        """Return True if this call of method should fail with the given kind."""
+        with self._lock:
+            failure = self.failures.get(method)
+            if failure is not None and failure[1] == kind:
+                failure[0] -= 1
+                if failure[0] <= 0:
+                    del self.failures[method]
+                return True
+            rate = self.failureRates.get(method)
+            return rate is not None and rate[1] == kind and self.random.random() < rate[0]
+
+    ##########################################################################################
+    #### METHODS
+
+    def getHQRoot(self, OSplatform):
+        return self.hqRoot[OSplatform]
+
+    def getClients(self, ids, attribs):
+        clients = self.clients
+        if ids is not None:
+            clients = [client for client in clients if client['id'] in ids]
+        return [dict((attrib, client[attrib]) for attrib in attribs if attrib in client) for client in clients]
+
+    def newjob(self, job, parent=None):
+        """Record a job, or a list of jobs attached to parent, and return their ids."""
+        jobs = job if isinstance(job, list) else [job]
+        with self._lock:
+            self.submissions.append((job, parent))
+            return [self.recordJob(job, parent) for job in jobs]
+
+    def recordJob(self, job, parent):
+        jobId = len(self.jobs) + 1
+        record = dict((key, value) for (key, value) in job.items() if key != 'children')
+        record.update({'id': jobId, 'parent': parent, 'children': [], 'submitted': time.time(), 'status': None})
+        if self.jobFailureRate and not job.get('children'):
+            record['fails'] = self.random.random() < self.jobFailureRate
+        self.jobs[jobId] = record
+        if parent is not None and parent in self.jobs:
+            self.jobs[parent]['children'].append(jobId)
+        for child in job.get('children', []):
+            self.recordJob(child, jobId)
+        return jobId
+
+    def jobStatus(self, record):
+        if record['status'] is not None:
+            return record['status']
+        elif record['children']:
+            statuses = set(self.jobStatus(self.jobs[child]) for child in record['children'])
+            for status in ['failed', 'running', 'waiting']:
+                if status in statuses:
+                    return status
+            return 'succeeded'
+        elif time.time() - record['submitted'] < self.jobSeconds:
+            return 'running'
+        elif record.get('fails'):
+            return 'failed'
+        return 'succeeded'
+
+    def setJobStatus(self, jobId, status):
+        """Force the status of a job, None lets it be worked out again."""
+        with self._lock:
+            self.jobs[jobId]['status'] = status
+
+    def getJob(self, jobId, attribs=None):
+        with self._lock:
+            record = self.jobs.get(jobId)
+            if record is None:
+                return None
+            job = dict((key, value) for (key, value) in record.items() if key not in ('submitted', 'fails'))
+            job['status'] = self.jobStatus(record)
+        if attribs:
+            job = dict((attrib, job.get(attrib)) for attrib in attribs)
+        return job
+
+    def getJobIdsByStatus(self, statuses):
+        """Return the ids of the jobs in any of the given states."""
+        with self._lock:
+            return [jobId for (jobId, record) in sorted(self.jobs.items()) if self.jobStatus(record) in statuses]
+
+    def leafJobs(self, jobId=None):
+        """Return the recorded jobs that run a command, under jobId if given."""
+        if jobId is None:
+            return [record for record in self.jobs.values() if not record['children']]
+        record = self.jobs[jobId]
+        if not record['children']:
+            return [record]
+        leaves = []
+        for child in record['children']:
+            leaves.extend(self.leafJobs(child))
+        return leaves
+
+##################################################################################################################################################################################################
+############################################ Main code
+##################################################################################################################################################################################################
+
+def parseFailureRate(value):
+    method, sep, rate = value.partition('=')
+    try:
+        return (method, float(rate))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Expected METHOD=RATE, got " + value)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local stand-in for an HQueue server.")
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument('--clients', type=int, default=10, help="Number of render clients to report")
+    parser.add_argument('--hq-root', default=None, help="Path returned as $HQROOT for every platform")
+    parser.add_argument('--job-seconds', type=float, default=0.0, help="Seconds every job runs for")
+    parser.add_argument('--job-failure-rate', type=float, default=0.0, help="Fraction of jobs that fail")
+    parser.add_argument('--failure-rate', type=parseFailureRate, action='append', default=[],
+                        metavar='METHOD=RATE', help="Fraction of calls to METHOD that fault, may be repeated")
+    parser.add_argument('--no-multicall', action='store_true')
+    parser.add_argument('--no-gzip', action='store_true')
+    args = parser.parse_args(argv)
+
+    hqRoot = None
+    if args.hq_root is not None:
+        hqRoot = dict((OSplatform, args.hq_root) for OSplatform in defaultHQRoot.keys())
+    server = standinServer(args.latency, not args.no_multicall, args.clients, not args.no_gzip, hqRoot,
+                           args.port, args.job_seconds, args.job_failure_rate)
+    for (method, rate) in args.failure_rate:
+        server.setFailureRate(method, rate)
+
+    print "HQueue stand-in listening on", server.address
+    try:
+        server.serveForever()
+    except KeyboardInterrupt:
+        pass
+    print "Recorded", len(server.jobs), "jobs in", len(server.submissions), "submissions"
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,841 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import os
+import os.path
+import sys
+import getpass
+import json
+import time
+import hashlib
+import posixpath
+import threading
+import xmlrpclib
+import Queue
+import hq_connection
+import hq_cache
+import hq_frames
+import hq_ledger
+import hq_spool
+import hq_servers
+
+configLocation = os.path.join(os.environ['HOME'], ".hQueueConfig.dat")
+defaultServerAddress = 'localhost:5000'
+
+# Platforms a job can carry commands for
+allPlatforms = ['linux', 'windows', 'macosx']
+
+# Children sent per newjob call once a job tree is too big for a single request
+childPageSize = int(os.environ.get('HQUEUE_PAGE_SIZE', 500))
+
+# This chunk of code is lifted from hqrop.py and rewritten as neccessary #######################################################################
+def expandHQROOT(path, hq_server):
+    """Return the given file path with instances of $HQROOT expanded
+    out to the mount point for the HQueue shared folder root."""
+    # Get the HQueue root path.
+    hq_root = getHQROOT(hq_server)
+    if hq_root is None:
+        return path
+    hq_root = hq_root[0]
+
+    expanded_path = {
+        'windows': path.replace("$HQROOT", hq_root['windows']),
+        'linux': path.replace("$HQROOT", hq_root['linux']),
+        'macosx': path.replace("$HQROOT", hq_root['macosx'])
+    }
+    return expanded_path
+
+def getHQROOT(hq_server):
+    """Query the HQueue server and return the mount point path
+    to the HQueue shared folder root.
+    The answer is cached on disk, so the server is only asked once the cache expires.
+    Return None if the path cannot be retrieved from the server.
+    """
+    # Identify this machine's platform.
+    OSplatform = sys.platform
+    if OSplatform.startswith("win"):
+        OSplatform = "windows"
+    elif OSplatform.startswith("linux"):
+        OSplatform = "linux"
+    elif OSplatform.startswith("darwin"):
+        OSplatform = "macosx"
+
+    # Use the cached mount points if they are still fresh.
+    hq_root = hq_cache.metadata.get(hq_server, 'hq_root')
+    if hq_root is not None:
+        return [hq_root, OSplatform]
+
+    # Connect to the HQueue server.
+    s = hQServerConnect(hq_server)
+    if s is None:
+        return None
+
+    try:
+        # Get the HQ root for all platforms in a single round trip.
+        hq_root = hq_cache.metadata.fetch(s, ['hq_root'])['hq_root']
+    except (xmlrpclib.Fault, hq_connection.serverError), e:
+        print("Could not retrieve $HQROOT from '" + hq_server + "' - " + str(e))
+        return None
+
+    return [hq_root, OSplatform]
+
+def hqServerProxySetup(hq_server):
+    """Returns the shared keep-alive connection to the given HQ server.
+    The connection is pooled in hq_connection so every panel reuses it."""
+    return hq_connection.getConnection(hq_server)
+
+def doesHQServerExists(hq_server):
+    """Check that the given HQ server can be connected to.
+    Returns True if the server exists and False if it does not. Furthermore,
+    it will display an error message if it does not exists."""
+    server = hqServerProxySetup(hq_server)
+    return hQServerPing(server, hq_server)
+
+def hQServerConnect(hq_server):
+    """Connect to the HQueue server and return the proxy connection.
+    The server is only pinged if it has not answered a call recently."""
+    s = hqServerProxySetup(hq_server)
+
+    if s.recentlyAlive() or hQServerPing(s, hq_server):
+        return s
+    else:
+        return None
+
+def hQServerPing(server, hq_server):
+    try:
+        server.ping()
+        return True
+    except (xmlrpclib.Fault, hq_connection.serverError), e:
+        print("Could not connect to '" + hq_server + "' - " + str(e) + "\n\n"
+            + "Make sure that the HQueue server is running\n"
+            + "or change the value of 'HQueue Server'.")
+
+        return False
+
+def getClients(hq_server):
+    """Return a list of all the clients registered on the HQueue server.
+    The list comes from the local client inventory, which is brought up to date
+    in the background. Only the first call for a server waits for the server.
+    Return None if the client list could not be retrieved from the server.
+    """
+    hostnames = hq_cache.inventory.hostnames(hq_server)
+    if hostnames is not None:
+        hq_cache.inventory.syncInBackground(hqServerProxySetup(hq_server))
+        return hostnames
+
+    if not syncClients(hq_server):
+        return None
+    return hq_cache.inventory.hostnames(hq_server)
+
+def syncClients(hq_server):
+    """Bring the client inventory of the server up to date, waiting for the
+    server. Return False if it could not be reached."""
+    s = hQServerConnect(hq_server)
+
+    if s is None:
+        return False
+
+    try:
+        hq_cache.inventory.sync(s)
+    except (xmlrpclib.Fault, hq_connection.serverError), e:
+        print("Could not retrieve client list from '" + hq_server + "' - " + str(e))
+        return False
+    return True
+
+def getClientGroups(hq_server):
+    """Return a list of all the client groups on the HQueue server.
+    Return None if the client group list could not be retrieved from the server.
+    """
+    client_groups = hq_cache.metadata.get(hq_server, 'client_groups')
+    if client_groups is not None:
+        return client_groups
+
+    s = hQServerConnect(hq_server)
+    if s is None:
+        return None
+
+    try:
+        client_groups = hq_cache.metadata.fetch(s, ['client_groups'])['client_groups']
+    except (xmlrpclib.Fault, hq_connection.serverError), e:
+        print("Could not retrieve client group list from '"
+                    + hq_server + "' - " + str(e))
+        return None
+
+    return client_groups
+
+def refreshServerMetadata(hq_server):
+    """Throw away the cached metadata for the server and fetch all of it again.
+    Returns True if the server answered."""
+    hq_cache.metadata.invalidate(hq_server)
+    s = hQServerConnect(hq_server)
+    if s is None:
+        return False
+
+    try:
+        hq_cache.metadata.refresh(s)
+    except (xmlrpclib.Fault, hq_connection.serverError), e:
+        print("Could not refresh the server information from '" + hq_server + "' - " + str(e))
+        return False
+
+    return True
+
+def getBaseParameters(name, assigned_to, clientList, clientGroupList, installDir, serverAddress, priorityLevel):
+    """Return a dictionary of the base parameters used by the submission panels and the CLI"""
+    parms = {
+        "name": name,
+        "assign_to": assigned_to,
+        "clients": clientList,
+        "client_groups": clientGroupList,
+        "dirs_to_create": "",
+        "environment": "",
+        "hfs": installDir,
+        "hq_server": serverAddress,
+        "open_browser": "",
+        "priority": priorityLevel,
+        "hip_action": "",
+        "autosave": "",
+        "warn_unsaved_changes": "",
+        "report_submitted_job_id": "",
+    }
+
+    addSubmittedByParm(parms)
+
+    return parms
+
+def addSubmittedByParm(parms):
+    """Adds who submits the job to the base parameters."""
+    try:
+        parms["submittedBy"] = getpass.getuser()
+    except (ImportError, KeyError):
+        pass
+
+def buildContainingJobSpec(job_name, parms, child_jobs,
+                           apply_conditions_to_children=True, environment=None):
+    """Return a job spec that submits the child job and waits for it.
+    The job containing the child job will not run any command.
+    """
+    job = {
+        "name": job_name,
+        "priority": parms['priority'],
+#        "environment": {"HQCOMMANDS": hutil.json.utf8Dumps(hq_cmds)},
+        "command": "",
+        "children": child_jobs,
+#        "emailTo": parms["emailTo"],
+#        "emailReasons": parms["emailReasons"],
+    }
+
+    if "submittedBy" in parms:
+        job["submittedBy"] = parms["submittedBy"]
+
+    if environment:
+        job["environment"] = environment
+
+    # Add job assignment conditions if any.
+    conditions = {"clients": "host", "client_groups": "hostgroup"}
+    for cond_type in conditions.keys():
+        job_cond_keyword = conditions[cond_type]
+        if parms["assign_to"] == cond_type:
+#            job[job_cond_keyword] = 'josh-laptop'
+            job[job_cond_keyword] = parms[cond_type]
+            if apply_conditions_to_children:
+                for child_job in job["children"]:
+                    child_job[job_cond_keyword] = parms[cond_type]
+
+    return job
+
+def buildChildJobs(jobName, OSCommands, priority, compact=False):
+    job_spec = {
+        "name": jobName,
+        "command": OSCommands,
+    }
+    # A compact child leaves priority and tags to its parent
+    if not compact:
+        job_spec["priority"] = priority
+        job_spec["tags"] = ''
+#        "maxHosts": 1,
+#        "minHosts": 1,
+    return job_spec
+
+def compactReferences(name):
+    """Return a quoted reference to the platform's copy of the variable for
+    every platform, e.g. "$HQR_EXE_LINUX" or "%HQR_EXE_WINDOWS%"."""
+    return {
+        'linux': '"$'+name+'_LINUX"',
+        'windows': '"%'+name+'_WINDOWS%"',
+        'macosx': '"$'+name+'_MACOSX"'
+    }
+
+def compactEnvironment(variables, platforms=allPlatforms):
+    """Return the parent job environment declaring every variable once per
+    platform. variables maps a name to its quoted path for every platform."""
+    environment = {}
+    for name in variables.keys():
+        for OSplatform in platforms:
+            environment[name+'_'+OSplatform.upper()] = variables[name][OSplatform].strip('"')
+    return environment
+
+def buildJobSpec(parms, chunks, buildCommands, variables, compact=False, platforms=allPlatforms):
+    """Return the containing job spec with a child job for every chunk.
+    variables maps names such as HQR_EXE and HQR_SCENE to quoted paths for
+    every platform, and buildCommands(variables, frames, platforms) returns
+    a chunk's commands for the platforms the job can run on. In compact mode
+    the paths, priority and tags are declared once on the parent and each
+    child only carries its name, short commands that reference the parent's
+    environment and the assignment conditions, which HQueue does not pass
+    down from a parent."""
+    environment = None
+    if compact:
+        environment = compactEnvironment(variables, platforms)
+        variables = dict((name, compactReferences(name)) for name in variables.keys())
+
+    childJobs = [buildChildJobs("Frame Range_"+str(frames), buildCommands(variables, frames, platforms),
+                                parms['priority'], compact)
+                 for frames in chunks]
+    return buildContainingJobSpec(parms['name'], parms, childJobs, environment=environment)
+
+def nukeJobSpec(parms, chunks, fileName, compact=False, platforms=allPlatforms):
+    """Return the containing job spec rendering the Nuke script in chunks."""
+    variables = {'HQR_EXE': parms['hfs'], 'HQR_SCENE': fileName}
+
+    def buildCommands(variables, frames, platforms):
+        return buildNukeCommands(variables['HQR_EXE'], frames, variables['HQR_SCENE'], platforms)
+    return buildJobSpec(parms, chunks, buildCommands, variables, compact, platforms)
+
+def mayaJobSpec(parms, renderer, chunks, fileName, compact=False, platforms=allPlatforms):
+    """Return the containing job spec rendering the Maya scene in chunks."""
+    variables = {'HQR_EXE': parms['hfs'], 'HQR_SCENE': fileName, 'HQR_PROJECT': mayaProjectPaths(fileName)}
+
+    def buildCommands(variables, frames, platforms):
+        return buildMayaCommands(variables['HQR_EXE'], renderer, frames, variables['HQR_SCENE'],
+                                 variables['HQR_PROJECT'], platforms)
+    return buildJobSpec(parms, chunks, buildCommands, variables, compact, platforms)
+
+def targetPlatforms(hq_server, assigned_to, clientList):
+    """Return the platforms a job needs commands for, from the client
+    inventory. A job assigned to listed clients needs their platforms, any
+    other job needs every platform in the inventory. When the inventory
+    cannot tell, or has not been synced recently, every platform is returned."""
+    hostnames = None
+    if assigned_to == 'clients' and clientList.strip():
+        hostnames = [client.strip() for client in clientList.split(',') if client.strip()]
+    platforms = hq_cache.inventory.platforms(hq_server, hostnames)
+    if not platforms:
+        return list(allPlatforms)
+    return [OSplatform for OSplatform in allPlatforms if OSplatform in platforms]
+
+def submitJob(hq_server, main_job):
+    """Send a job to the server. Returns the job ids, None if the server
+    could not be reached so nothing was sent, or False if the job was refused
+    or the request failed after it was sent. The server may have created the
+    job in that case, so it must not be sent again."""
+    s = hQServerConnect(hq_server)
+    if s is None:
+        return None
+
+    # Big job trees are sent in pages rather than one huge request
+    if len(main_job.get('children', [])) > childPageSize:
+        return sendPagedJob(hq_server, main_job, s=s)
+
+    # We do this here as we need a server connection
+    #_setupEmailReasons(s, main_job)
+
+    # If we're running as an HQueue job, make that job our parent job.
+    try:
+        ids = s.newjob(main_job)
+    except xmlrpclib.Fault, fault:
+        print "Could not submit job:", main_job['name'], "to", hq_server, "-", fault.faultString
+        return False
+    except hq_connection.serverUnreachable, e:
+        # The connection was never made, so the server hasn't seen the job
+        print "Could not submit job:", main_job['name'], "to", hq_server, "-", e
+        return None
+    except hq_connection.serverError, e:
+        print "Could not submit job:", main_job['name'], "to", hq_server, "-", e
+        print "The server may have created the job, check it before submitting", main_job['name'], "again"
+        return False
+
+    hq_ledger.recordSubmission(hq_server, ids[0], main_job)
+    return ids
+
+def sendJob(hq_server, main_job):
+    """Submit a job, or spool it to be sent in the background if the server
+    can't be reached. Returns the job ids, None if the job was spooled or
+    False if it could not be submitted."""
+    return sendJobWithFailover(hq_server, main_job)[1]
+
+def sendJobWithFailover(hq_server, main_job):
+    """Submit a job to the least loaded of the configured servers, moving on
+    to the next one while a server can't be reached. Returns the server the
+    job went to, or hq_server if it was spooled, and what sendJob returns.
+    Only a server that never got the job is passed over, a job that may have
+    reached one server is never sent to another."""
+    for server in failoverServers(hq_server, [main_job]):
+        ids = submitJob(server, main_job)
+        # None means nothing was sent, anything else is final
+        if ids is not None:
+            hq_servers.jobsSent(server)
+            return (server, ids)
+    return (hq_server, spoolJob(hq_server, main_job))
+
+def failoverServers(hq_server, main_jobs):
+    """Return the servers to try the jobs on in order. With a server list in
+    the config the servers are probed together, the reachable ones come first
+    and the least loaded of those first. The jobs' paths were resolved with
+    hq_server's $HQROOT, so only servers mounting it in the same places for
+    every platform are used. If none of them can be reached only hq_server
+    is tried, so the jobs are spooled for it."""
+    servers = configuredServers(hq_server)
+    # Client and client group names belong to the server the job was built for
+    if len(servers) == 1 or any('host' in main_job or 'hostgroup' in main_job for main_job in main_jobs):
+        return [hq_server]
+
+    hqRoot = hq_cache.metadata.get(hq_server, 'hq_root')
+    probes = hq_servers.rankServers(servers)
+    for probe in probes:
+        print probe.describe()
+    reachable = []
+    for probe in probes:
+        if not probe.reachable:
+            continue
+        elif hq_connection.serverURL(probe.hq_server) == hq_connection.serverURL(hq_server):
+            reachable.append(probe.hq_server)
+        elif hqRoot is not None and probe.hqRoot == hqRoot:
+            reachable.append(probe.hq_server)
+        else:
+            print probe.hq_server, "mounts $HQROOT elsewhere than", hq_server, "so the jobs are not sent to it"
+    if not reachable:
+        return [hq_server]
+    return reachable
+
+def spoolJob(hq_server, main_job):
+    try:
+        hq_spool.spoolJob(hq_server, main_job)
+    except (IOError, OSError), e:
+        print "Could not spool job:", main_job['name'], "-", e
+        return False
+    startSpoolFlusher()
+    return None
+
+def startSpoolFlusher():
+    """Send any spooled jobs in the background once their server is back."""
+    return hq_spool.startFlusher(submitJob)
+
+def runConcurrently(function, argsList, maxThreads=8):
+    """Run function(*args) for every args tuple on up to maxThreads threads
+    and return the results in order. A call that raises returns its exception."""
+    results = [None] * len(argsList)
+    indexes = Queue.Queue()
+    for index in range(len(argsList)):
+        indexes.put(index)
+
+    def runCalls():
+        while True:
+            try:
+                index = indexes.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[index] = function(*argsList[index])
+            except Exception, e:
+                results[index] = e
+
+    threads = [threading.Thread(target=runCalls) for i in range(min(maxThreads, len(argsList)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def buildUmbrellaJobSpec(job_name, priority):
+    """Return an empty parent job that a batch of jobs is submitted under."""
+    job = {
+        "name": job_name,
+        "priority": priority,
+        "command": "",
+        "children": [],
+    }
+    addSubmittedByParm(job)
+    return job
+
+def sendJobs(hq_server, main_jobs, umbrella_job=None):
+    """Submit several job trees over the one pooled connection, optionally
+    under an umbrella parent job. The jobs go out as a single batch, so the
+    cost is one round trip rather than a connect and ping per job. Jobs with
+    more than childPageSize children are sent on their own with sendPagedJob.
+    Returns the job id of every job in order, None for a job the server
+    refused or that could not be sent, or False if nothing could be submitted. If the server can't be
+    reached the jobs are spooled and None is returned."""
+    return sendJobsWithFailover(hq_server, main_jobs, umbrella_job)[1]
+
+def sendJobsWithFailover(hq_server, main_jobs, umbrella_job=None):
+    """sendJobs to the least loaded of the configured servers, moving on to
+    the next one while a server can't be reached. Returns the server the
+    jobs went to, or hq_server if they were spooled, and what sendJobs returns.
+    As with sendJobWithFailover, only a server that got none of the jobs is passed over."""
+    jobs = main_jobs if umbrella_job is None else [umbrella_job] + main_jobs
+    for server in failoverServers(hq_server, jobs):
+        ids = submitJobs(server, main_jobs, umbrella_job)
+        # None means nothing was sent, anything else is final
+        if ids is not None:
+            hq_servers.jobsSent(server)
+            return (server, ids)
+
+    if umbrella_job is not None:
+        return (hq_server, spoolJob(hq_server, dict(umbrella_job, children=main_jobs)))
+    for main_job in main_jobs:
+        if spoolJob(hq_server, main_job) is False:
+            return (hq_server, False)
+    return (hq_server, None)
+
+def submitJobs(hq_server, main_jobs, umbrella_job=None):
+    """Send several job trees in one batch. Returns what sendJobs does, or
+    None if the server could not be reached and nothing was sent."""
+    s = hQServerConnect(hq_server)
+    if s is None:
+        return None
+
+    parent = ()
+    if umbrella_job is not None:
+        try:
+            parent = (s.newjob(umbrella_job)[0],)
+        except hq_connection.serverUnreachable, e:
+            print "Could not submit job:", umbrella_job['name'], "to", hq_server, "-", e
+            return None
+        except Exception, e:
+            print "Could not submit job:", umbrella_job['name'], "to", hq_server, "-", e
+            return False
+
+    # Big job trees are left out of the batch and sent in pages afterwards
+    batched = [main_job for main_job in main_jobs if len(main_job.get('children', [])) <= childPageSize]
+    try:
+        batchResults = iter(s.batch([('newjob', (main_job,) + parent) for main_job in batched], raiseFaults=False))
+    except hq_connection.serverUnreachable, e:
+        print "Could not submit", len(batched), "jobs to", hq_server, "-", e
+        # Nothing reached the server unless the umbrella job did
+        return None if not parent else False
+    except Exception, e:
+        print "Could not submit", len(batched), "jobs to", hq_server, "-", e
+        return False
+    results = [next(batchResults) if len(main_job.get('children', [])) <= childPageSize else None
+               for main_job in main_jobs]
+
+    ids = []
+    for main_job, result in zip(main_jobs, results):
+        if result is None:
+            jobIds = sendPagedJob(hq_server, main_job, *parent, s=s)
+            ids.append(jobIds[0] if jobIds else None)
+        elif isinstance(result, xmlrpclib.Fault):
+            print "Could not submit job:", main_job['name'], "to", hq_server, "-", result.faultString
+            ids.append(None)
+        else:
+            ids.append(result[0])
+            hq_ledger.recordSubmission(hq_server, result[0], main_job)
+    return ids
+
+def retryFailed(hq_server, jobId=None):
+    """Submit the failed and cancelled chunks of a job from the ledger, or of
+    the last job submitted to the server, as a new job. Returns the ids like
+    sendJob, None if there was nothing to retry or False if it failed."""
+    entry = hq_ledger.findEntry(hq_server, jobId)
+    if entry is None:
+        print "No job", jobId if jobId is not None else "", "submitted to", hq_server, "in the ledger"
+        return None
+
+    s = hQServerConnect(hq_server)
+    if s is None:
+        return False
+    chunks = hq_ledger.failedChunks(s, entry)
+    if chunks is None:
+        return False
+    elif not chunks:
+        print "Job", entry['jobId'], "has no failed chunks"
+        return None
+
+    print "Retrying", len(chunks), "of", len(entry['chunks']), "chunks of job", entry['jobId']
+    return submitJob(hq_server, hq_ledger.buildRetryJob(entry, chunks)) or False
+
+def availableClientCount(hq_server, assigned_to, clientList):
+    """Return how many clients the job can run on, using the local client
+    inventory rather than asking the server."""
+    if assigned_to == 'clients' and clientList.strip():
+        return len([client for client in clientList.split(',') if client.strip()])
+    hostnames = hq_cache.inventory.hostnames(hq_server)
+    if hostnames:
+        return len(hostnames)
+    return 1
+
+def getFrameWord(frames):
+    if len(frames) == 1:
+        return "Frame"
+    else:
+        return "Frames"
+
+def buildNukeCommands(NFS, frames, fileName, platforms=allPlatforms):
+    """Return the Nuke command line for each of the platforms."""
+    # One -F flag per run of the frameSet, e.g. -F 1-100x2 -F 150
+    frameArgs = " ".join("-F "+hq_frames.runExpression(run) for run in frames.runs)
+    # Example: nuke.exe -F 1-100 -x myscript.nk
+    return dict((OSplatform, NFS[OSplatform]+" "+frameArgs+" -x "+fileName[OSplatform]) for OSplatform in platforms)
+
+def mayaProjectPaths(fileName):
+    """Return the quoted project directory, two levels above the scene, for every platform."""
+    return {
+        "linux": '"'+'/'.join(fileName['linux'].strip('"').split('/')[:-2])+'"',
+        "windows": '"'+'\\'.join(fileName['windows'].strip('"').split('\\')[:-2])+'"',
+        "macosx": '"'+'/'.join(fileName['macosx'].strip('"').split('/')[:-2])+'"'
+    }
+
+def buildMayaCommands(MFS, renderer, frames, fileName, projects=None, platforms=allPlatforms):
+    """Return the Maya Render command line for each of the platforms."""
+    if projects is None:
+        projects = mayaProjectPaths(fileName)
+    # Render only takes one start, end and step, so every chunk is a single run
+    (startFrame, endFrame, step) = frames.runs[0]
+    args = " -r "+renderer+" -s "+str(startFrame)+" -e "+str(endFrame)+" -b "+str(step)+" -proj "
+    # Example: Render -r file -s 1 -e 100 -b 1 -proj "project" scene.ma
+    return dict((OSplatform, MFS[OSplatform]+args+projects[OSplatform]+" "+fileName[OSplatform]) for OSplatform in platforms)
+
+def hqRootExecutables(installDir, hqRoot, executable):
+    """Return the quoted path of the executable for every platform, given an
+    install directory that may contain $HQROOT and $OS."""
+    return {
+        'linux': posixpath.join(installDir.replace("$HQROOT", '"'+hqRoot['linux']).replace("$OS", 'linux'), executable)+'"',
+        'windows': posixpath.join(installDir.replace("$HQROOT", '"'+hqRoot['windows']).replace("$OS", 'windows'), executable+'.exe"').replace('/', '\\'),
+        'macosx': posixpath.join(installDir.replace("$HQROOT", '"'+hqRoot['macosx']).replace("$OS", 'macosx'), executable)+'"'
+    }
+
+#################################################################################################################################################################################################
+#### PAGED SUBMISSION
+
+# Pages attached at once, one for each pooled keep-alive connection
+pagesInFlight = hq_connection.maxIdleTransports
+
+# Paged submissions that failed midway, so sending the same job again resumes them
+_unfinishedSubmissions = {}
+_unfinishedLock = threading.Lock()
+
+class pagedSubmission(object):
+    """Sends a job tree as its parent with the first page of children, then
+    attaches the remaining children to it in pages that are pipelined over
+    the pooled connection. If a page could not reach the server the
+    submission remembers which pages made it, so calling submit again only
+    sends the rest. If a request failed after it was sent, mayHaveArrived
+    is set and the submission must not be sent again."""
+
+    def __init__(self, hq_server, main_job, parentId=None, pageSize=childPageSize):
+        self.hq_server = hq_server
+        self.main_job = main_job
+        self.parentId = parentId
+        children = main_job.get('children', [])
+        self.pages = [children[index:index + pageSize] for index in range(0, len(children), pageSize)] or [[]]
+        self.jobId = None
+        self.attached = set()
+        self.childrenSent = 0
+        self.seconds = 0.0
+        self.mayHaveArrived = False
+
+    def finished(self):
+        return len(self.attached) == len(self.pages)
+
+    def remainingChildren(self):
+        return sum(len(self.pages[index]) for index in range(len(self.pages)) if index not in self.attached)
+
+    def childrenPerSecond(self):
+        if not self.seconds:
+            return 0.0
+        return self.childrenSent / self.seconds
+
+    def submit(self, s=None):
+        """Send everything that has not reached the server yet, over s if
+        given. Returns True once the whole tree has been submitted."""
+        if s is None:
+            s = hQServerConnect(self.hq_server)
+            if s is None:
+                return False
+
+        start = time.time()
+        try:
+            if self.jobId is None:
+                self.submitParent(s)
+            pending = [index for index in range(len(self.pages)) if index not in self.attached]
+            results = runConcurrently(self.attachPage, [(s, index) for index in pending], pagesInFlight)
+            for index, result in zip(pending, results):
+                if isinstance(result, Exception):
+                    print "Could not attach", len(self.pages[index]), "children to job", self.jobId, "-", result
+                    self.requestFailed(result)
+        except Exception, e:
+            print "Could not submit job:", self.main_job['name'], "to", self.hq_server, "-", e
+            self.requestFailed(e)
+        self.seconds += time.time() - start
+        return self.finished()
+
+    def requestFailed(self, error):
+        # Only a request that never got a connection is known not to have reached the server
+        if not isinstance(error, hq_connection.serverUnreachable):
+            self.mayHaveArrived = True
+
+    def submitParent(self, s):
+        parent = dict(self.main_job, children=self.pages[0])
+        if self.parentId is None:
+            self.jobId = s.newjob(parent)[0]
+        else:
+            self.jobId = s.newjob(parent, self.parentId)[0]
+        self.pageSent(0)
+
+    def attachPage(self, s, index):
+        s.newjob(self.pages[index], self.jobId)
+        self.pageSent(index)
+
+    def pageSent(self, index):
+        with _unfinishedLock:
+            self.attached.add(index)
+            self.childrenSent += len(self.pages[index])
+
+def submissionKey(hq_server, main_job, parentId):
+    """Fingerprint of a job tree, so an identical resubmission finds its unfinished submission."""
+    return hashlib.sha1(hq_connection.serverURL(hq_server) + str(parentId) +
+                        json.dumps(main_job, sort_keys=True)).hexdigest()
+
+def sendPagedJob(hq_server, main_job, parentId=None, s=None):
+    """Submit a large job tree in pages, over s if given. Sending a job whose
+    pages could not reach the server resumes it rather than submitting it
+    twice. Returns [job id] like submitJob, None if the parent job could not
+    reach the server so nothing was sent, or False if children are missing.
+    A job that failed after a request was sent is not kept for resuming."""
+    key = submissionKey(hq_server, main_job, parentId)
+    with _unfinishedLock:
+        submission = _unfinishedSubmissions.pop(key, None)
+    if submission is None:
+        submission = pagedSubmission(hq_server, main_job, parentId)
+    else:
+        print "Resuming job", main_job['name'], "with", submission.remainingChildren(), "children left to send"
+
+    if not submission.submit(s):
+        if submission.mayHaveArrived:
+            print "The server may have created", main_job['name'], "or some of its children, check it before submitting it again"
+            return False
+        elif submission.jobId is None:
+            # The parent job never reached the server, so nothing was sent
+            return None
+        with _unfinishedLock:
+            _unfinishedSubmissions[key] = submission
+        print submission.remainingChildren(), "children of", main_job['name'], "were not sent, submit again to resume"
+        return False
+
+    print "Submitted", submission.childrenSent, "children of", main_job['name'], \
+        "in %.2fs (%.0f children/s)" % (submission.seconds, submission.childrenPerSecond())
+    hq_ledger.recordSubmission(hq_server, submission.jobId, main_job)
+    return [submission.jobId]
+
+#################################################################################################################################################################################################
+#### CONFIG FUNCTIONS
+
+def readConfig():
+    """Return every setting in the config file, or an empty dict if there is none."""
+    if os.path.isfile(configLocation):
+        with open(configLocation, 'r') as f:
+            return json.load(f)
+    return {}
+
+def retrieveConfigCache():
+    return readConfig().get('Server Address', defaultServerAddress)
+
+def configuredServers(hq_server):
+    """Return the servers a job for hq_server can be sent to. If hq_server is
+    in the ordered "Servers" list of the config that is the whole list,
+    otherwise hq_server is used on its own."""
+    try:
+        servers = readConfig().get('Servers') or []
+    except (IOError, OSError, ValueError):
+        servers = []
+    if hq_connection.serverURL(hq_server) not in [hq_connection.serverURL(server) for server in servers]:
+        return [hq_server]
+    return servers
+
+def writeConfigCache(serverAddress):
+    # Keep any other settings, such as 'Profile', that are in the file
+    config = readConfig()
+    config['Server Address'] = serverAddress
+    with open(configLocation, 'w') as f:
+        json.dump(config, f)
+    return True
+
+#################################################################################################################################################################################################
+#### FILE PATH FUNCTIONS
+
+def resolveNukeFilePaths(filePathValue, hqRoot, OSplatform):
+    """Return the quoted path of the script for every platform, plus the
+    $HQROOT relative path under 'hq'."""
+    # See if the file path has $HQROOT in it
+    if "$HQROOT" in filePathValue:
+        # Set the platforms file value to the resolved path
+        fileResponse = {
+            'windows': '"'+filePathValue.replace("$HQROOT", hqRoot['windows']).replace('/', '\\')+'"',
+            'macosx': '"'+filePathValue.replace("$HQROOT", hqRoot['macosx'])+'"',
+            'linux': '"'+filePathValue.replace("$HQROOT", hqRoot['linux'])+'"',
+            'hq': '"'+filePathValue+'"'
+        }
+    elif hqRoot['linux'] in filePathValue or hqRoot['macosx'] in filePathValue or \
+                    hqRoot['windows'].replace('\\', '/') in filePathValue:
+        fileResponse = {
+            'windows': filePathValue.replace(hqRoot[OSplatform], '"'+hqRoot['windows']).replace('/', '\\')+'"',
+            'macosx': filePathValue.replace(hqRoot[OSplatform], '"'+hqRoot['macosx'])+'"',
+            'linux': filePathValue.replace(hqRoot[OSplatform], '"'+hqRoot['linux'])+'"',
+            'hq': filePathValue.replace(hqRoot['linux'], '"'+"$HQROOT").replace(hqRoot['macosx'],
+                                                                                "$HQROOT").replace(
+                hqRoot['windows'], "$HQROOT")+'"'
+        }
+    else:
+        fileResponse = {
+            'windows': '"'+filePathValue.replace('/', '\\')+'"',
+            'macosx': '"'+filePathValue.replace('\\', '/')+'"',
+            'linux': '"'+filePathValue.replace('\\', '/')+'"',
+            'hq': '"'+filePathValue+'"'
+        }
+    return fileResponse
+
+def resolveMayaFilePaths(filePathValue, hqRoot, OSplatform):
+    """Return the quoted path of the scene for every platform, plus the
+    $HQROOT relative path under 'hq'."""
+    # See if the file path has $HQROOT in it
+    if "$HQROOT" in filePathValue:
+        # Set the platforms file value to the resolved path
+        fileResponse = {
+            'windows': filePathValue.replace("$HQROOT", '"'+hqRoot['windows']).replace('/', '\\')+'"',
+            'macosx': filePathValue.replace("$HQROOT", '"'+hqRoot['macosx']).replace('\\', '/')+'"',
+            'linux': filePathValue.replace("$HQROOT", '"'+hqRoot['linux']).replace('\\', '/')+'"',
+            'hq': '"'+filePathValue+'"'
+        }
+    elif hqRoot['linux'] in filePathValue or hqRoot['macosx'] in filePathValue or hqRoot['windows'].replace('\\', '/') in filePathValue:
+        fileResponse = {
+            'windows': filePathValue.replace(hqRoot[OSplatform].replace('\\', '/'), '"'+hqRoot['windows']).replace('/',
+                                                                                                  '\\')+'"',
+            'macosx': filePathValue.replace(hqRoot[OSplatform].replace('\\', '/'), '"'+hqRoot['macosx']).replace('\\',
+                                                                                                '/')+'"',
+            'linux': filePathValue.replace(hqRoot[OSplatform].replace('\\', '/'), '"'+hqRoot['linux']).replace('\\',
+                                                                                              '/')+'"',
+            'hq': filePathValue.replace(hqRoot['linux'], '"'+"$HQROOT").replace(hqRoot['macosx'], '"'+"$HQROOT").replace(hqRoot['windows'], '"'+"$HQROOT")+'"'
+        }
+    else:
+        fileResponse = {
+            'windows': '"'+filePathValue.replace('/', '\\')+'"',
+            'macosx': '"'+filePathValue.replace('\\', '/')+'"',
+            'linux': '"'+filePathValue.replace('\\', '/')+'"',
+            'hq': '"'+filePathValue+'"'
+        }
+    return fileResponse
+
+def checkFilePath(hq_server, filePathValue, resolveFilePaths):
+    """Resolve the file path against the server's $HQROOT with resolveFilePaths
+    and check the file exists.
+    Returns [hqRoot, OSplatform, fileResponse, found], or None if $HQROOT
+    could not be retrieved. Safe to run off the main thread."""
+    hqRootResponse = getHQROOT(hq_server)
+    if hqRootResponse is None:
+        return None
+
+    (hqRoot, OSplatform) = hqRootResponse
+    fileResponse = resolveFilePaths(filePathValue, hqRoot, OSplatform)
+    # Check if the file can be found at either of the possible file paths
+    found = os.path.isfile(fileResponse[OSplatform].strip('"')) or os.path.isfile(fileResponse['hq'].strip('"'))
+    return [hqRoot, OSplatform, fileResponse, found]
@@ -0,0 +1,125 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import os
+import os.path
+import json
+import time
+import atexit
+import threading
+
+# HQUEUE_TRACE turns tracing on. It is the file the trace is written to, or 1 for the default file.
+# A .json file is written in Chrome trace format (chrome://tracing), anything else as JSON lines.
+traceSetting = os.environ.get('HQUEUE_TRACE', '')
+defaultTraceLocation = os.path.join(os.path.expanduser('~'), '.hQueueTrace.jsonl')
+
+#################################################################################################################################################################################################
+#### TRACER
+
+class rpcTracer(object):
+    """Records one event per XML-RPC call: the method, how long it took, the
+    bytes sent and received and whether it succeeded. Events are tagged with
+    the current session, such as one press of a submit button.
+
+    JSON lines are written as each call finishes. A Chrome trace has to be
+    one JSON document, so it is rewritten at the end of every session and
+    when Python exits."""
+
+    def __init__(self, location):
+        self.location = location
+        self.chrome = location.lower().endswith('.json')
+        self.events = []
+        self.session = None
+        self.sessionStart = None
+        self._lock = threading.Lock()
+
+    def startSession(self, name):
+        with self._lock:
+            self.session = name
+            self.sessionStart = time.time()
+
+    def endSession(self):
+        with self._lock:
+            if self.session is not None and self.chrome:
+                self.events.append(self.chromeEvent({'session': self.session, 'method': self.session,
+                                                     'start': self.sessionStart, 'seconds': time.time() - self.sessionStart,
+                                                     'thread': 0}, 'session'))
+            self.session = None
+            self.sessionStart = None
+        if self.chrome:
+            self.write()
+
+    def record(self, hq_server, method, start, bytesSent, bytesReceived, outcome, compressed, calls=None):
+        event = {
+            'session': self.session,
+            'server': hq_server,
+            'method': method,
+            'start': start,
+            'seconds': time.time() - start,
+            'bytes_sent': bytesSent,
+            'bytes_received': bytesReceived,
+            'outcome': outcome,
+            'compressed': compressed,
+            'thread': threading.current_thread().ident,
+        }
+        if calls is not None:
+            event['calls'] = calls
+
+        with self._lock:
+            if self.chrome:
+                self.events.append(self.chromeEvent(event, 'xmlrpc'))
+                return
+            try:
+                with open(self.location, 'a') as f:
+                    f.write(json.dumps(event, sort_keys=True) + '\n')
+            except (IOError, OSError), e:
+                print "Could not write the RPC trace to", self.location, "-", e
+
+    def chromeEvent(self, event, category):
+        args = dict((key, value) for (key, value) in event.items()
+                    if key not in ('method', 'start', 'seconds', 'thread'))
+        return {
+            'name': event['method'],
+            'cat': category,
+            'ph': 'X',
+            'ts': int(event['start'] * 1000000),
+            'dur': int(event['seconds'] * 1000000),
+            'pid': os.getpid(),
+            'tid': event['thread'],
+            'args': args,
+        }
+
+    def write(self):
+        with self._lock:
+            events = list(self.events)
+        if not events:
+            return
+        try:
+            with open(self.location, 'w') as f:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        except (IOError, OSError), e:
+            print "Could not write the RPC trace to", self.location, "-", e
+
+def traceLocation(setting):
+    if setting.lower() in ('1', 'true', 'yes', 'on'):
+        return defaultTraceLocation
+    return os.path.expanduser(setting)
+
+# None when tracing is off, so a traced call costs one check
+tracer = None
+if traceSetting and traceSetting.lower() not in ('0', 'false', 'no', 'off'):
+    tracer = rpcTracer(traceLocation(traceSetting))
+    if tracer.chrome:
+        atexit.register(tracer.write)
+
+#################################################################################################################################################################################################
+#### SESSIONS
+
+def startSession(name):
+    """Tag the calls that follow with name, e.g. when a submit button is pressed."""
+    if tracer is not None:
+        tracer.startSession(name)
+
+def endSession():
+    if tracer is not None:
+        tracer.endSession()
@@ -0,0 +1,107 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import sys
+import threading
+import traceback
+import Queue
+
+#################################################################################################################################################################################################
+#### TASKS
+
+class workerTask(object):
+    """A single call queued on a backgroundWorker. Cancelling a task stops its
+    callbacks from running, a call that is already talking to the server is
+    left to finish in the background."""
+
+    def __init__(self, function, args, key):
+        self.function = function
+        self.args = args
+        self.key = key
+        self.callbacks = []
+        self.cancelled = False
+        self.done = threading.Event()
+
+    def addCallbacks(self, onResult, onError):
+        self.callbacks.append((onResult, onError))
+
+    def cancel(self):
+        self.cancelled = True
+
+#################################################################################################################################################################################################
+#### WORKER
+
+def runDirectly(function, args):
+    function(*args)
+
+class backgroundWorker(object):
+    """Runs queued calls one after another on a background thread so the UI
+    never waits on the server. Results are handed back through dispatch,
+    which should run a function on the UI thread, e.g. nuke.executeInMainThread."""
+
+    def __init__(self, dispatch=runDirectly):
+        self.dispatch = dispatch
+        self.queue = Queue.Queue()
+        self.thread = None
+        self.pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, function, args=(), onResult=None, onError=None, key=None):
+        """Queue function(*args) and return its workerTask. onResult is called
+        with the return value and onError with the exception, both through
+        dispatch. Submitting a key that is already queued or running does not
+        queue the call again, the callbacks are added to the existing task."""
+        with self._lock:
+            task = self.pending.get(key) if key is not None else None
+            if task is None or task.cancelled:
+                task = workerTask(function, args, key)
+                task.addCallbacks(onResult, onError)
+                if key is not None:
+                    self.pending[key] = task
+                self.queue.put(task)
+            else:
+                task.addCallbacks(onResult, onError)
+        self.startThread()
+        return task
+
+    def startThread(self):
+        with self._lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def run(self):
+        while True:
+            task = self.queue.get()
+            if not task.cancelled:
+                self.runTask(task)
+            task.done.set()
+
+    def runTask(self, task):
+        try:
+            result = task.function(*task.args)
+            failed = False
+        except Exception, e:
+            traceback.print_exc(file=sys.stdout)
+            result = e
+            failed = True
+
+        # Stop coalescing onto this task before handing out its result
+        with self._lock:
+            if task.key is not None and self.pending.get(task.key) is task:
+                del self.pending[task.key]
+            callbacks = list(task.callbacks)
+
+        for (onResult, onError) in callbacks:
+            self.deliver(task, onError if failed else onResult, result)
+
+    def deliver(self, task, callback, value):
+        if callback is None:
+            return
+
+        def deliverIfWanted(value):
+            # The task may have been cancelled while the result was on its way
+            if not task.cancelled:
+                callback(value)
+        self.dispatch(deliverIfWanted, (value,))
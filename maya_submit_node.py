@@ -3,262 +3,52 @@
 # Import needed modules and components
 import os
 import os.path
-import sys
-import xmlrpclib
-import getpass
-import json
 import posixpath
+import hq_submit
+import hq_worker
+import hq_frames
+import hq_trace
+import hq_profile
+import hq_monitor
+import hq_resume
+import hq_spool
 import maya.cmds as cmds
+import maya.utils
+from hq_submit import configLocation, defaultServerAddress, expandHQROOT, getHQROOT, hqServerProxySetup, \
+    doesHQServerExists, hQServerConnect, hQServerPing, getClients, getClientGroups, refreshServerMetadata, \
+    getBaseParameters, addSubmittedByParm, mayaJobSpec, targetPlatforms, sendJobWithFailover, availableClientCount, \
+    getFrameWord, retrieveConfigCache, writeConfigCache, hqRootExecutables, retryFailed, startSpoolFlusher
 
-configLocation = os.path.join(os.environ['HOME'], ".hQueueConfig.dat")
-defaultServerAddress = 'localhost:5000'
-
-# This chunk of code is lifted from hqrop.py and rewritten as neccessary #######################################################################
-def expandHQROOT(path, hq_server):
-    """Return the given file path with instances of $HQROOT expanded
-    out to the mount point for the HQueue shared folder root."""
-    # Get the HQueue root path.
-    hq_root = getHQROOT(hq_server)[0]
-    if hq_root is None:
-        return path
-
-    expanded_path = {
-        'windows': path.replace("$HQROOT", hq_root['windows']),
-        'linux': path.replace("$HQROOT", hq_root['linux']),
-        'macosx': path.replace("$HQROOT", hq_root['macosx'])
-    }
-    return expanded_path
-
-def getHQROOT(hq_server):
-    """Query the HQueue server and return the mount point path
-    to the HQueue shared folder root.
-    Return None if the path cannot be retrieved from the server.
-    """
-    # Identify this machine's platform.
-    OSplatform = sys.platform
-    if OSplatform.startswith("win"):
-        OSplatform = "windows"
-    elif OSplatform.startswith("linux"):
-        OSplatform = "linux"
-    elif OSplatform.startswith("darwin"):
-        OSplatform = "macosx"
-
-    # Connect to the HQueue server.
-    s = hQServerConnect(hq_server)
-    if s is None:
-        return None
-
-    try:
-        # Get the HQ root for all platforms.
-        hq_root = {
-            'windows': s.getHQRoot('windows'),
-            'linux': s.getHQRoot('linux'),
-            'macosx': s.getHQRoot('macosx')
-        }
-    except:
-        print("Could not retrieve $HQROOT from '" + hq_server + "'.")
-        return None
-
-    return [hq_root, OSplatform]
-
-def hqServerProxySetup(hq_server):
-    """Sets up a xmlrpclib server proxy to the given HQ server."""
-    if not hq_server.startswith("http://"):
-        full_hq_server_path = "http://%s" % hq_server
-    else:
-        full_hq_server_path = hq_server
-
-    return xmlrpclib.ServerProxy(full_hq_server_path, allow_none=True)
-
-def doesHQServerExists(hq_server):
-    """Check that the given HQ server can be connected to.
-    Returns True if the server exists and False if it does not. Furthermore,
-    it will display an error message if it does not exists."""
-    server = hqServerProxySetup(hq_server)
-    return hQServerPing(server, hq_server)
-
-def hQServerConnect(hq_server):
-    """Connect to the HQueue server and return the proxy connection."""
-    s = hqServerProxySetup(hq_server)
-
-    if hQServerPing(s, hq_server):
-        return s
-    else:
-        return None
-
-def hQServerPing(server, hq_server):
-    try:
-        server.ping()
-        return True
-    except:
-        print("Could not connect to '" + hq_server + "'.\n\n"
-            + "Make sure that the HQueue server is running\n"
-            + "or change the value of 'HQueue Server'.",
-            TypeError("this is a type error"))
-
-        return False
-
-def getClients(hq_server):
-    """Return a list of all the clients registered on the HQueue server.
-    Return None if the client list could not be retrieved from the server.
-    """
-    s = hQServerConnect(hq_server)
-
-    if s is None:
-        return None
-
-    try:
-        client_ids = None
-        attribs = ["id", "hostname"]
-        clients = s.getClients(client_ids, attribs)
-    except:
-        print("Could not retrieve client list from '" + hq_server + "'.")
-        return None
-
-    return [client["hostname"] for client in clients]
-
-def getClientGroups(hq_server):
-    """Return a list of all the client groups on the HQueue server.
-    Return None if the client group list could not be retrieved from the server.
-    """
-    s = hQServerConnect(hq_server)
-    if s is None:
-        return None
-
-    try:
-        client_groups = s.getClientGroups()
-    except:
-        print("Could not retrieve client group list from '"
-                    + hq_server + "'.")
-        return None
-
-    return client_groups
-
-def getBaseParameters(name, assigned_to, clientList, clientGroupList, installDir, serverAddress, priorityLevel):
-    """Return a dictionary of the base parameters used in this nuke script"""
-    parms = {
-        "name": name,
-        "assign_to": assigned_to,
-        "clients": clientList,
-        "client_groups": clientGroupList,
-        "dirs_to_create": "",
-        "environment": "",
-        "hfs": installDir,
-        "hq_server": serverAddress,
-        "open_browser": "",
-        "priority": priorityLevel,
-        "hip_action": "",
-        "autosave": "",
-        "warn_unsaved_changes": "",
-        "report_submitted_job_id": "",
-    }
-
-    addSubmittedByParm(parms)
-
-    return parms
-
-def addSubmittedByParm(parms):
-    """Adds who submits the job to the base parameters."""
-    try:
-        parms["submittedBy"] = getpass.getuser()
-    except (ImportError, KeyError):
-        pass
-
-def buildContainingJobSpec(job_name, parms, child_jobs,
-                           apply_conditions_to_children=True):
-    """Return a job spec that submits the child job and waits for it.
-    The job containing the child job will not run any command.
-    """
-    job = {
-        "name": job_name,
-        "priority": parms['priority'],
-#        "environment": {"HQCOMMANDS": hutil.json.utf8Dumps(hq_cmds)},
-        "command": "",
-        "children": child_jobs,
-#        "emailTo": parms["emailTo"],
-#        "emailReasons": parms["emailReasons"],
-    }
-
-    if "submittedBy" in parms:
-        job["submittedBy"] = parms["submittedBy"]
-
-    # Add job assignment conditions if any.
-    conditions = {"clients": "host", "client_groups": "hostgroup"}
-    for cond_type in conditions.keys():
-        job_cond_keyword = conditions[cond_type]
-        if parms["assign_to"] == cond_type:
-#            job[job_cond_keyword] = 'josh-laptop'
-            job[job_cond_keyword] = parms[cond_type]
-            if apply_conditions_to_children:
-                for child_job in job["children"]:
-                    child_job[job_cond_keyword] = parms[cond_type]
-
-    return job
-
-def buildOSCommands(MFS, startFrame, endFrame, fileName):
-    commands = {
-        # Example: nuke.exe -F 1-100 -x myscript.nk
-        "linux": MFS['linux']+" -r "+cmds.optionMenuGrp('renderChoice', q=True, value=True)+" -s "+str(startFrame)+" -e "+str(endFrame)+" -b 1 -proj "+'"'+'/'.join(fileName['linux'].strip('"').split('/')[:-2])+'" '+fileName['linux'],
-        "windows": MFS['windows']+" -r "+cmds.optionMenuGrp('renderChoice', q=True, value=True)+" -s "+str(startFrame)+" -e "+str(endFrame)+" -b 1 -proj "+'"'+'\\'.join(fileName['windows'].strip('"').split('\\')[:-2])+'" '+fileName['windows'],
-        "macosx": MFS['macosx']+" -r "+cmds.optionMenuGrp('renderChoice', q=True, value=True)+" -s "+str(startFrame)+" -e "+str(endFrame)+" -b 1 -proj "+'"'+'/'.join(fileName['windows'].strip('"').split('/')[:-2])+'" '+fileName['macosx']
-    }
-
-    return commands
-
-def buildChildJobs(jobName, OSCommands, priority):
-    job_spec = {
-        "name": jobName,
-        "command": OSCommands,
-        "priority": priority,
-        "tags": '',
-#        "maxHosts": 1,
-#        "minHosts": 1,
-    }
-    return job_spec
-
-def sendJob(hq_server, main_job):
-    s = hQServerConnect(hq_server)
-    if s is None:
-        return False
-
-    # We do this here as we need a server connection
-    #_setupEmailReasons(s, main_job)
-
-    # If we're running as an HQueue job, make that job our parent job.
-    try:
-        ids = s.newjob(main_job)
-    except Exception, e:
-        print "Could not submit job:", main_job['name'], "to", hq_server
-        return False
-
-    return ids
-
-def getFrameWord(frames):
-    if len(frames) == 1:
-        return "Frame"
-    else:
-        return "Frames"
-
-#################################################################################################################################################################################################
-#### CONFIG FUNCTIONS
-
-def retrieveConfigCache():
-    if os.path.isfile(configLocation):
-        with open(configLocation, 'r') as f:
-            config = json.load(f)
-        return config['Server Address']
-    else:
-        return defaultServerAddress
-
-def writeConfigCache(serverAddress):
-    config = {'Server Address': serverAddress}
-    with open(configLocation, 'w') as f:
-        json.dump(config, f)
-    return True
+# Rough number of seconds Maya takes to start on a render node
+mayaStartupSeconds = 30.0
 
 def getMayaRenderers():
     return cmds.renderer(q=1, namesOfAvailableRenderers=1),cmds.getAttr("defaultRenderGlobals.currentRenderer")
 
+def checkFilePath(hq_server, filePathValue):
+    """Resolve the scene path against the server's $HQROOT and check the file exists."""
+    return hq_submit.checkFilePath(hq_server, filePathValue, hq_submit.resolveMayaFilePaths)
+
+def renderOutputs():
+    """Return the image path of every renderable layer with its frame number as #s."""
+    padding = cmds.getAttr('defaultRenderGlobals.extensionPadding')
+    frame = str(int(cmds.getAttr('defaultRenderGlobals.startFrame'))).zfill(padding)
+    outputs = []
+    for image in cmds.renderSettings(firstImageName=True, fullPath=True) or []:
+        directory, name = os.path.split(image)
+        index = name.rfind(frame)
+        if index != -1:
+            outputs.append(os.path.join(directory, name[:index] + '#' * padding + name[index + len(frame):]))
+    return outputs
+
+def currentScene():
+    """Name of the open scene, used to name profiles."""
+    return cmds.file(q=True, sceneName=True)
+
+def executeDeferred(function, args):
+    """Dispatch used by the background worker to get results back onto Maya's main thread."""
+    maya.utils.executeDeferred(function, *args)
+
 #################################################################################################################################################################################################
 
 ### C:/Program Files/Autodesk/Maya2011/devkit/plug-ins/scripted
@@ -266,11 +56,17 @@ def getMayaRenderers():
 
 class createMyLayoutCls(object):
     def __init__(self, *args):
-        pass
+        # Server calls run on a background worker and report back through executeDeferred
+        self.worker = hq_worker.backgroundWorker(executeDeferred)
+        self.monitor = None
+
+        # Send any jobs spooled while the server was unreachable
+        startSpoolFlusher()
 
     def show(self):
         self.createMyLayout()
 
+    @hq_profile.profiled(currentScene)
     def createMyLayout(self):
 
         # check to see if our window exists
@@ -289,6 +85,9 @@ class createMyLayoutCls(object):
                                                      buttonLabel="Test the server Address",
                                                      buttonCommand=self.serverAddressConnect)
 
+        self.serverInfoRefresh = cmds.button(label="Refresh server info", recomputeSize=True,
+                                             command=self.serverInfoRefreshCommand)
+
         self.filePath = cmds.textFieldButtonGrp('filePath', label="File path: ",
                                                 text=cmds.file(q=True, location=True),
                                                 buttonLabel="Test the file path",
@@ -328,6 +127,23 @@ class createMyLayoutCls(object):
 
         self.trackRange = cmds.textFieldGrp('trackRange', label="Track Range: ", text=str(int(cmds.getAttr('defaultRenderGlobals.startFrame'))) + '-' + str(int(cmds.getAttr('defaultRenderGlobals.endFrame'))))
 
+        self.chunkStrategy = cmds.optionMenuGrp('chunkStrategy', label="Chunking: ",
+                                                changeCommand=self.chunkStrategyChange)
+        for i in hq_frames.chunkStrategyLabels:
+            cmds.menuItem(label=i)
+
+        # Frames per chunk, or minutes per chunk when chunking by time
+        self.chunkValue = cmds.textFieldGrp('chunkValue', label="Frames per chunk: ", text=str(hq_frames.defaultChunkSize))
+
+        # Estimated render time of one frame, only used when chunking by time
+        self.secondsPerFrame = cmds.textFieldGrp('secondsPerFrame', label="Seconds per frame: ", text='60', visible=False)
+
+        # Declare the paths once on the parent job instead of in every chunk
+        self.compactSpec = cmds.checkBox('compactSpec', label="Compact job spec", value=False)
+
+        # Only submit the frames that have not been rendered yet
+        self.resumeRender = cmds.checkBox('resumeRender', label="Skip frames already rendered", value=False)
+
         (self.renderOptions,self.currentRenderer) = getMayaRenderers()
         self.renderChoice = cmds.optionMenuGrp('renderChoice', label="Renderer: ")
         for i in self.renderOptions:
@@ -337,6 +153,15 @@ class createMyLayoutCls(object):
 
         self.submitJob = cmds.button(label="Submit job to farm", recomputeSize=True, command=self.submitJobToFarm)
 
+        # Sends the failed chunks of the last job again
+        self.retryFailedChunks = cmds.button(label="Retry failed chunks", recomputeSize=True, command=self.retryFailedJob)
+
+        # Shows what the background worker is doing
+        self.statusText = cmds.text('statusText', label="", align="center")
+
+        # Shows how the chunks of the submitted job are getting on
+        self.jobProgressText = cmds.text('jobProgress', label="", align="center")
+
         cmds.setParent(menu=True)
 
         cmds.showWindow(self.window)
@@ -355,9 +180,67 @@ class createMyLayoutCls(object):
             print "Unknown type:", args[0]
             raise ValueError
 
+    def runInBackground(self, message, key, function, args, onResult):
+        """Run function(*args) on the background worker and hand its result to
+        onResult through executeDeferred. Pressing a button again while the same
+        call is still running waits on that call instead of starting a new one."""
+        self.setStatus(message + "...")
+        self.worker.submit(function, args, onResult=self.taskFinished(onResult), onError=self.taskFailed,
+                           key=key)
+
+    def taskFinished(self, onResult):
+        def finished(result):
+            self.setStatus("")
+            try:
+                onResult(result)
+            except Exception:
+                # A submit that stops half way must not leave its trace session open
+                hq_trace.endSession()
+                raise
+        return finished
+
+    def taskFailed(self, error):
+        hq_trace.endSession()
+        self.setStatus("Failed: " + str(error))
+
+    def setStatus(self, message):
+        if cmds.text('statusText', exists=True):
+            cmds.text('statusText', edit=True, label=message)
+
+    def chunkStrategyChange(self, *args):
+        strategy = hq_frames.chunkStrategies[args[0]]
+        if strategy == 'fixed':
+            cmds.textFieldGrp('chunkValue', edit=True, label="Frames per chunk: ")
+        elif strategy == 'time':
+            cmds.textFieldGrp('chunkValue', edit=True, label="Minutes per chunk: ")
+        cmds.textFieldGrp('chunkValue', edit=True, visible=strategy != 'clients')
+        cmds.textFieldGrp('secondsPerFrame', edit=True, visible=strategy == 'time')
+
+    def frameChunks(self, frames):
+        # Split the frameSet with the chunking strategy chosen in the window
+        strategy = hq_frames.chunkStrategies[cmds.optionMenuGrp('chunkStrategy', q=True, value=True)]
+        chunkValue = cmds.textFieldGrp('chunkValue', q=True, text=True)
+        if strategy == 'clients':
+            value = availableClientCount(cmds.textFieldButtonGrp(self.serverAddress, q=True, text=True),
+                                         self.assigned_to, self.clientFullList)
+        elif strategy == 'time':
+            value = float(chunkValue) * 60
+        else:
+            value = int(chunkValue)
+        return hq_frames.chunkFrames(frames, strategy, value,
+                                     float(cmds.textFieldGrp('secondsPerFrame', q=True, text=True)), mayaStartupSeconds)
+
     def getClientList(self, *args):
+        hq_server = cmds.textFieldButtonGrp(self.serverAddress, q=True, text=True)
+        self.runInBackground("Getting the client list", ('getClients', hq_server), getClients, (hq_server,),
+                             self.getClientListDone)
+
+    def getClientListDone(self, response):
         # Get a response from the function of the button that was pressed
-        self.clientResponse = getClients(cmds.textFieldButtonGrp(self.serverAddress, q=True, text=True))
+        self.clientResponse = response
+        if not self.clientResponse:
+            self.setStatus("Could not get the client list")
+            return
 
         self.clientListType = 'clientGet'
 
@@ -367,8 +250,16 @@ class createMyLayoutCls(object):
         self.popUpPanel(self)
 
     def getClientGroupList(self, *args):
+        hq_server = cmds.textFieldButtonGrp(self.serverAddress, q=True, text=True)
+        self.runInBackground("Getting the client groups", ('getClientGroups', hq_server), getClientGroups,
+                             (hq_server,), self.getClientGroupListDone)
+
+    def getClientGroupListDone(self, response):
         # Get a response from the function of the button that was pressed
-        self.clientGroupResponse = getClientGroups(cmds.textFieldButtonGrp(self.serverAddress, q=True, text=True))
+        self.clientGroupResponse = response
+        if not self.clientGroupResponse:
+            self.setStatus("Could not get the client groups")
+            return
         self.cleanList = []
 
         self.clientListType = 'clientGroupGet'
@@ -401,11 +292,7 @@ class createMyLayoutCls(object):
 
     def cleanInstallEXE(self, unusableDir):
         if cmds.optionMenuGrp('installDirectoryCurrent', q=True, value=True) == "HQRoot install directory":
-            usableDir = {
-                'linux': posixpath.join(posixpath.join(unusableDir.replace("$HQROOT", '"'+self.hqRoot['linux']).replace("$OS", 'linux'), 'bin'), 'Render"'),
-                'windows': posixpath.join(posixpath.join(unusableDir.replace("$HQROOT", '"'+self.hqRoot['windows']).replace("$OS", 'windows'), 'bin'), 'Render.exe"').replace('/', '\\'),
-                'macosx': posixpath.join(posixpath.join(unusableDir.replace("$HQROOT", '"'+self.hqRoot['macosx']).replace("$OS", 'macosx'), 'bin'), 'Render"')
-            }
+            usableDir = hqRootExecutables(unusableDir, self.hqRoot, posixpath.join('bin', 'Render'))
         elif cmds.optionMenuGrp('installDirectory', q=True, value=True) == "Default install directory":
             mayaDirName = 'maya' + str(cmds.about(version=True))
             usableDir = {
@@ -419,10 +306,19 @@ class createMyLayoutCls(object):
         cmds.textFieldGrp('installDirectory', edit=True, text=self.installDirectoryChoicesKey[args[0]])
 
     def filePathCheck(self, *args):
-        self.hQRootFilePathCheck()
+        hq_server = cmds.textFieldButtonGrp(self.serverAddress, q=True, text=True)
+        filePathValue = cmds.textFieldButtonGrp(self.filePath, q=True, text=True)
+        self.runInBackground("Checking the file path", ('checkFilePath', hq_server, filePathValue), checkFilePath,
+                             (hq_server, filePathValue), self.filePathCheckDone)
+
+    def filePathCheckDone(self, response):
+        if response is None:
+            self.setStatus("Could not retrieve $HQROOT")
+            found = False
+        else:
+            (self.hqRoot, self.platform, self.fileResponse, found) = response
 
-        # Check if the file can be found at either of the possible file paths
-        if os.path.isfile(self.fileResponse[self.platform].strip('"')) or os.path.isfile(self.fileResponse['hq'].strip('"')):
+        if found:
             # Set the background of filePath's text box to green if File found
             cmds.textFieldButtonGrp('filePath', edit=True, backgroundColor=(0, 0.8, 0))
             self.filePathSuccess=True
@@ -431,36 +327,6 @@ class createMyLayoutCls(object):
             cmds.textFieldButtonGrp('filePath', edit=True, backgroundColor=(0.8, 0, 0))
             self.filePathSuccess=None
 
-    def hQRootFilePathCheck(self):
-        (self.hqRoot, self.platform) = getHQROOT(cmds.textFieldButtonGrp(self.serverAddress, q=True, text=True))
-        self.filePathValue = cmds.textFieldButtonGrp(self.filePath, q=True, text=True)
-        # See if the file path has $HQROOT in it
-        if "$HQROOT" in self.filePathValue:
-            # Set the platforms file value to the resolved path
-            self.fileResponse = {
-                'windows': self.filePathValue.replace("$HQROOT", '"'+self.hqRoot['windows']).replace('/', '\\')+'"',
-                'macosx': self.filePathValue.replace("$HQROOT", '"'+self.hqRoot['macosx']).replace('\\', '/')+'"',
-                'linux': self.filePathValue.replace("$HQROOT", '"'+self.hqRoot['linux']).replace('\\', '/')+'"',
-                'hq': '"'+self.filePathValue+'"'
-            }
-        elif self.hqRoot['linux'] in self.filePathValue or self.hqRoot['macosx'] in self.filePathValue or self.hqRoot['windows'].replace('\\', '/') in self.filePathValue:
-            self.fileResponse = {
-                'windows': self.filePathValue.replace(self.hqRoot[self.platform].replace('\\', '/'), '"'+self.hqRoot['windows']).replace('/',
-                                                                                                                  '\\')+'"',
-                'macosx': self.filePathValue.replace(self.hqRoot[self.platform].replace('\\', '/'), '"'+self.hqRoot['macosx']).replace('\\',
-                                                                                                                '/')+'"',
-                'linux': self.filePathValue.replace(self.hqRoot[self.platform].replace('\\', '/'), '"'+self.hqRoot['linux']).replace('\\',
-                                                                                                              '/')+'"',
-                'hq': self.filePathValue.replace(self.hqRoot['linux'], '"'+"$HQROOT").replace(self.hqRoot['macosx'], '"'+"$HQROOT").replace(self.hqRoot['windows'], '"'+"$HQROOT")+'"'
-            }
-        else:
-            self.fileResponse = {
-                'windows': '"'+self.filePathValue.replace('/', '\\')+'"',
-                'macosx': '"'+self.filePathValue.replace('\\', '/')+'"',
-                'linux': '"'+self.filePathValue.replace('\\', '/')+'"',
-                'hq': '"'+self.filePathValue+'"'
-            }
-
     def jobNameSet(self, jobName, FilePath):
         if jobName == "<default>":
             return "Render -> NK: "+FilePath
@@ -484,41 +350,137 @@ class createMyLayoutCls(object):
 
     def finaliseJobSpecs(self):
         self.finaliseClientList()
-        try:
-            if self.hqRoot:
-                pass
-        except:
-            self.filePathCheck()
         if self.filePathSuccess is True:
-            return getBaseParameters(self.jobNameSet(cmds.textFieldGrp('jobName', q=True, text=True), self.fileResponse['hq']), self.assigned_to_value,
+            return getBaseParameters(self.jobNameSet(cmds.textFieldGrp('jobName', q=True, text=True), self.fileResponse['hq']), self.assigned_to,
                                      self.clientFullList, self.clientGroupFullList,
                                      self.cleanInstallEXE(cmds.textFieldGrp('installDirectory', q=True, text=True)), cmds.textFieldButtonGrp('serverAddress', q=True, text=True), cmds.optionMenuGrp('priority', q=True, value=True))
         else:
             raise ValueError("File Path not found")
 
+    @hq_profile.profiled(currentScene)
     def submitJobToFarm(self, *args):
+        # The file path is always checked again so the job uses the current $HQROOT
+        hq_server = cmds.textFieldButtonGrp(self.serverAddress, q=True, text=True)
+        filePathValue = cmds.textFieldButtonGrp(self.filePath, q=True, text=True)
+        hq_trace.startSession('submit ' + filePathValue)
+        self.runInBackground("Checking the file path", ('submitJob', hq_server, filePathValue), checkFilePath,
+                             (hq_server, filePathValue), self.submitJobPathChecked)
+
+    @hq_profile.profiled(currentScene)
+    def submitJobPathChecked(self, response):
+        self.filePathCheckDone(response)
+        if response is None:
+            hq_trace.endSession()
+            return
+
         self.parms = self.finaliseJobSpecs()
-        self.childJobs = []
-        for i in range(int(cmds.textFieldGrp('trackRange', q=True, text=True).split('-')[0]), int(cmds.textFieldGrp('trackRange', q=True, text=True).split('-')[1]) + 1, 10):
-            self.childJobs.append(buildChildJobs("Frame Range_" + str(i) + "-" + str(i + 9),
-                                                 buildOSCommands(self.parms['hfs'], i, i + 9, self.fileResponse),
-                                                 self.parms['priority']))
+        # Every UI value is read once here rather than once per chunk
+        renderer = cmds.optionMenuGrp('renderChoice', q=True, value=True)
+        trackRange = cmds.textFieldGrp('trackRange', q=True, text=True)
+        compact = cmds.checkBox('compactSpec', q=True, value=True)
+        platforms = targetPlatforms(self.parms['hq_server'], self.assigned_to, self.clientFullList)
+        try:
+            frames = hq_frames.frameSet.parse(trackRange)
+        except:
+            raise ValueError("Frame range is invalid")
+
+        submitFrames = lambda frames: self.submitFrames(renderer, compact, platforms, frames)
+        if cmds.checkBox('resumeRender', q=True, value=True):
+            # Listing the render directories can take a while on a share. Only the same
+            # outputs and frames share a scan, another range or layer is scanned on its own.
+            outputs = renderOutputs()
+            self.runInBackground("Finding frames already rendered", ('resume', tuple(outputs), str(frames)),
+                                 hq_resume.missingFrames, (outputs, frames), submitFrames)
+        else:
+            submitFrames(frames)
+
+    @hq_profile.profiled(currentScene)
+    def submitFrames(self, renderer, compact, platforms, frames):
+        if frames is None:
+            hq_trace.endSession()
+            self.setStatus("Every frame has already been rendered")
+            return
+
         try:
-            self.mainJob = buildContainingJobSpec(self.parms['name'], self.parms, self.childJobs)
+            self.mainJob = mayaJobSpec(self.parms, renderer, self.frameChunks(frames),
+                                       self.fileResponse, compact, platforms)
         except:
             raise ValueError("Frame range is invalid")
-        self.jobResponse = sendJob(self.parms['hq_server'], self.mainJob)
+        # Only a second press for the very same job waits on the first, any change to it is a new job
+        self.runInBackground("Submitting the job", ('sendJob', hq_spool.specHash(self.parms['hq_server'], self.mainJob)),
+                             sendJobWithFailover, (self.parms['hq_server'], self.mainJob), self.submitJobDone)
+
+    def submitJobDone(self, response):
+        hq_trace.endSession()
+        # The job may have gone to another of the configured servers
+        (self.jobServer, self.jobResponse) = response
         if self.jobResponse:
-            print "Job submission successful"
+            print "Job submitted to", self.jobServer
+            self.setStatus("Job submitted to " + self.jobServer)
+            self.watchJob(self.jobServer, self.jobResponse[0])
+        elif self.jobResponse is None:
+            print "Server unreachable, the job is spooled"
+            self.setStatus("Server unreachable, the job will be submitted when it is back")
         else:
             print "Failed"
+            self.setStatus("Job submission failed")
+
+    def retryFailedJob(self, *args):
+        # Retry the job submitted from this window, or the last one in the ledger
+        jobId = self.jobResponse[0] if getattr(self, 'jobResponse', None) else None
+        if jobId is None:
+            self.jobServer = cmds.textFieldButtonGrp(self.serverAddress, q=True, text=True)
+        self.runInBackground("Retrying the failed chunks", ('retryFailed', self.jobServer, jobId), retryFailed,
+                             (self.jobServer, jobId), self.retryFailedDone)
+
+    def retryFailedDone(self, response):
+        if response:
+            self.setStatus("Failed chunks submitted as job " + str(response[0]))
+            self.watchJob(self.jobServer, response[0])
+        elif response is None:
+            self.setStatus("No failed chunks to retry")
+        else:
+            self.setStatus("Could not retry the failed chunks")
+
+    def watchJob(self, hq_server, jobId):
+        # Follow the new job, the previous one is left to the web UI
+        if self.monitor is not None:
+            self.monitor.stop()
+        self.monitor = hq_monitor.jobMonitor(hq_server, jobId, self.jobProgressChanged, executeDeferred).start()
+
+    def jobProgressChanged(self, monitor, changes):
+        # Only called when a status has changed, so the label is only redrawn then
+        if monitor is not self.monitor:
+            return
+        if not cmds.text('jobProgress', exists=True):
+            # The window has been closed
+            monitor.stop()
+            return
+        cmds.text('jobProgress', edit=True, label=monitor.summaryText())
 
     def serverAddressWrite(self, *args):
         self.response = writeConfigCache(cmds.textFieldButtonGrp(self.serverAddress, q=True, text=True))
         return self.response
 
+    def serverInfoRefreshCommand(self, *args):
+        # Fetch $HQROOT, client groups and email event names again
+        hq_server = cmds.textFieldButtonGrp(self.serverAddress, q=True, text=True)
+        self.runInBackground("Refreshing the server info", ('refreshServerMetadata', hq_server), refreshServerMetadata,
+                             (hq_server,), self.serverInfoRefreshDone)
+
+    def serverInfoRefreshDone(self, response):
+        if response:
+            cmds.textFieldButtonGrp('serverAddress', edit=True, backgroundColor=(0, 0.8, 0))
+        else:
+            cmds.textFieldButtonGrp('serverAddress', edit=True, backgroundColor=(0.8, 0, 0))
+
     def serverAddressConnect(self, *args):
-        self.response = doesHQServerExists(cmds.textFieldButtonGrp(self.serverAddress, q=True, text=True))
+        hq_server = cmds.textFieldButtonGrp(self.serverAddress, q=True, text=True)
+        self.runInBackground("Testing the server address", ('doesHQServerExists', hq_server), doesHQServerExists,
+                             (hq_server,), self.serverAddressConnectDone)
+
+    def serverAddressConnectDone(self, response):
+        self.response = response
         if self.response is True:
             self.serverAddressWrite()
             cmds.textFieldButtonGrp('serverAddress', edit=True, backgroundColor=(0, 0.8, 0))
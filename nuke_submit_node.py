@@ -3,260 +3,36 @@
 # Import needed modules and components
 import os
 import os.path
-import sys
-import xmlrpclib
-import getpass
-import io
-import json
-import threading
 import posixpath
+import hq_submit
+import hq_worker
+import hq_frames
+import hq_trace
+import hq_profile
+import hq_monitor
+import hq_resume
 import nuke
 import nukescripts
+from hq_submit import configLocation, defaultServerAddress, expandHQROOT, getHQROOT, hqServerProxySetup, \
+    doesHQServerExists, hQServerConnect, hQServerPing, getClients, getClientGroups, refreshServerMetadata, \
+    getBaseParameters, addSubmittedByParm, nukeJobSpec, targetPlatforms, sendJobWithFailover, availableClientCount, \
+    getFrameWord, retrieveConfigCache, writeConfigCache, hqRootExecutables, retryFailed, startSpoolFlusher
 
-configLocation = os.path.join(os.environ['HOME'], ".hQueueConfig.dat")
-defaultServerAddress = 'localhost:5000'
-
-# This chunk of code is lifted from hqrop.py and rewritten as neccessary #######################################################################
-def expandHQROOT(path, hq_server):
-    """Return the given file path with instances of $HQROOT expanded
-    out to the mount point for the HQueue shared folder root."""
-    # Get the HQueue root path.
-    hq_root = getHQROOT(hq_server)[0]
-    if hq_root is None:
-        return path
-
-    expanded_path = {
-        'windows': path.replace("$HQROOT", hq_root['windows']),
-        'linux': path.replace("$HQROOT", hq_root['linux']),
-        'macosx': path.replace("$HQROOT", hq_root['macosx'])
-    }
-    return expanded_path
-
-def getHQROOT(hq_server):
-    """Query the HQueue server and return the mount point path
-    to the HQueue shared folder root.
-    Return None if the path cannot be retrieved from the server.
-    """
-    # Identify this machine's platform.
-    OSplatform = sys.platform
-    if OSplatform.startswith("win"):
-        OSplatform = "windows"
-    elif OSplatform.startswith("linux"):
-        OSplatform = "linux"
-    elif OSplatform.startswith("darwin"):
-        OSplatform = "macosx"
-
-    # Connect to the HQueue server.
-    s = hQServerConnect(hq_server)
-    if s is None:
-        return None
-
-    try:
-        # Get the HQ root for all platforms.
-        hq_root = {
-            'windows': s.getHQRoot('windows'),
-            'linux': s.getHQRoot('linux'),
-            'macosx': s.getHQRoot('macosx')
-        }
-    except:
-        print("Could not retrieve $HQROOT from '" + hq_server + "'.")
-        return None
-
-    return [hq_root, OSplatform]
-
-def hqServerProxySetup(hq_server):
-    """Sets up a xmlrpclib server proxy to the given HQ server."""
-    if not hq_server.startswith("http://"):
-        full_hq_server_path = "http://%s" % hq_server
-    else:
-        full_hq_server_path = hq_server
-
-    return xmlrpclib.ServerProxy(full_hq_server_path, allow_none=True)
-
-def doesHQServerExists(hq_server):
-    """Check that the given HQ server can be connected to.
-    Returns True if the server exists and False if it does not. Furthermore,
-    it will display an error message if it does not exists."""
-    server = hqServerProxySetup(hq_server)
-    return hQServerPing(server, hq_server)
-
-def hQServerConnect(hq_server):
-    """Connect to the HQueue server and return the proxy connection."""
-    s = hqServerProxySetup(hq_server)
-
-    if hQServerPing(s, hq_server):
-        return s
-    else:
-        return None
-
-def hQServerPing(server, hq_server):
-    try:
-        server.ping()
-        return True
-    except:
-        print("Could not connect to '" + hq_server + "'.\n\n"
-            + "Make sure that the HQueue server is running\n"
-            + "or change the value of 'HQueue Server'.",
-            TypeError("this is a type error"))
-
-        return False
-
-def getClients(hq_server):
-    """Return a list of all the clients registered on the HQueue server.
-    Return None if the client list could not be retrieved from the server.
-    """
-    s = hQServerConnect(hq_server)
-
-    if s is None:
-        return None
-
-    try:
-        client_ids = None
-        attribs = ["id", "hostname"]
-        clients = s.getClients(client_ids, attribs)
-    except:
-        print("Could not retrieve client list from '" + hq_server + "'.")
-        return None
-
-    return [client["hostname"] for client in clients]
-
-def getClientGroups(hq_server):
-    """Return a list of all the client groups on the HQueue server.
-    Return None if the client group list could not be retrieved from the server.
-    """
-    s = hQServerConnect(hq_server)
-    if s is None:
-        return None
-
-    try:
-        client_groups = s.getClientGroups()
-    except:
-        print("Could not retrieve client group list from '"
-                    + hq_server + "'.")
-        return None
-
-    return client_groups
-
-def getBaseParameters(name, assigned_to, clientList, clientGroupList, installDir, serverAddress, priorityLevel):
-    """Return a dictionary of the base parameters used in this nuke script"""
-    parms = {
-        "name": name,
-        "assign_to": assigned_to,
-        "clients": clientList,
-        "client_groups": clientGroupList,
-        "dirs_to_create": "",
-        "environment": "",
-        "hfs": installDir,
-        "hq_server": serverAddress,
-        "open_browser": "",
-        "priority": priorityLevel,
-        "hip_action": "",
-        "autosave": "",
-        "warn_unsaved_changes": "",
-        "report_submitted_job_id": "",
-    }
-
-    addSubmittedByParm(parms)
-
-    return parms
-
-def addSubmittedByParm(parms):
-    """Adds who submits the job to the base parameters."""
-    try:
-        parms["submittedBy"] = getpass.getuser()
-    except (ImportError, KeyError):
-        pass
-
-def buildContainingJobSpec(job_name, parms, child_jobs,
-                           apply_conditions_to_children=True):
-    """Return a job spec that submits the child job and waits for it.
-    The job containing the child job will not run any command.
-    """
-    job = {
-        "name": job_name,
-        "priority": parms['priority'],
-#        "environment": {"HQCOMMANDS": hutil.json.utf8Dumps(hq_cmds)},
-        "command": "",
-        "children": child_jobs,
-#        "emailTo": parms["emailTo"],
-#        "emailReasons": parms["emailReasons"],
-    }
-
-    if "submittedBy" in parms:
-        job["submittedBy"] = parms["submittedBy"]
-
-    # Add job assignment conditions if any.
-    conditions = {"clients": "host", "client_groups": "hostgroup"}
-    for cond_type in conditions.keys():
-        job_cond_keyword = conditions[cond_type]
-        if parms["assign_to"] == cond_type:
-#            job[job_cond_keyword] = 'josh-laptop'
-            job[job_cond_keyword] = parms[cond_type]
-            if apply_conditions_to_children:
-                for child_job in job["children"]:
-                    child_job[job_cond_keyword] = parms[cond_type]
-
-    return job
-
-def buildOSCommands(NFS, startFrame, endFrame, fileName):
-    commands = {
-        # Example: nuke.exe -F 1-100 -x myscript.nk
-        "linux": NFS['linux']+" -F "+str(startFrame)+"-"+str(endFrame)+" -x "+fileName['linux'],
-        "windows": NFS['windows']+" -F "+str(startFrame)+"-"+str(endFrame)+" -x "+fileName['windows'],
-        "macosx": NFS['macosx']+" -F "+str(startFrame)+"-"+str(endFrame)+" -x "+fileName['macosx'],
-    }
-
-    return commands
-
-def buildChildJobs(jobName, OSCommands, priority):
-    job_spec = {
-        "name": jobName,
-        "command": OSCommands,
-        "priority": priority,
-        "tags": '',
-#        "maxHosts": 1,
-#        "minHosts": 1,
-    }
-    return job_spec
-
-def sendJob(hq_server, main_job):
-    s = hQServerConnect(hq_server)
-    if s is None:
-        return False
-
-    # We do this here as we need a server connection
-    #_setupEmailReasons(s, main_job)
-
-    # If we're running as an HQueue job, make that job our parent job.
-    try:
-        ids = s.newjob(main_job)
-    except Exception, e:
-        print "Could not submit job:", main_job['name'], "to", hq_server
-        return False
-
-    return ids
-
-def getFrameWord(frames):
-    if len(frames) == 1:
-        return "Frame"
-    else:
-        return "Frames"
+# Rough number of seconds Nuke takes to start on a render node
+nukeStartupSeconds = 10.0
 
-#################################################################################################################################################################################################
-#### CONFIG FUNCTIONS
+def checkFilePath(hq_server, filePathValue):
+    """Resolve the script path against the server's $HQROOT and check the file exists."""
+    return hq_submit.checkFilePath(hq_server, filePathValue, hq_submit.resolveNukeFilePaths)
 
-def retrieveConfigCache():
-    if os.path.isfile(configLocation):
-        with open(configLocation, 'r') as f:
-            config = json.load(f)
-        return config['Server Address']
-    else:
-        return defaultServerAddress
+def writeNodeOutputs():
+    """Return the image path of every enabled Write node in the script."""
+    return [nuke.filename(node) for node in nuke.allNodes('Write', recurseGroups=True)
+            if not node['disable'].value() and nuke.filename(node)]
 
-def writeConfigCache(serverAddress):
-    config = {'Server Address': serverAddress}
-    with open(configLocation, 'w') as f:
-        json.dump(config, f)
+def currentScene():
+    """Name of the open script, used to name profiles."""
+    return nuke.root().name()
 
 #################################################################################################################################################################################################
 #### SPLIT PATH FUNCTION
@@ -278,6 +54,10 @@ def splitall(path):
 
 #################################################################################################################################################################################################
 
+def executeInMainThread(function, args):
+    """Dispatch used by the background worker to get results back onto Nuke's main thread."""
+    nuke.executeInMainThread(function, args)
+
 # Run to open a window in Nuke
 class nukeWindow(nukescripts.PythonPanel):
 
@@ -298,6 +78,10 @@ class nukeWindow(nukescripts.PythonPanel):
         self.addressTest = nuke.PyScript_Knob("addressTest", "Test the server address", "")
         self.addKnob(self.addressTest)
 
+        # Setup a button that throws away the cached $HQROOT and client groups for the server
+        self.serverInfoRefresh = nuke.PyScript_Knob("serverInfoRefresh", "Refresh server info", "")
+        self.addKnob(self.serverInfoRefresh)
+
         # Create addressSuccessFlag flag that is hidden until the server is successfully pinged
         self.addressSuccessFlag = nuke.Text_Knob('addressSuccessFlag', '', '<span style="color:green">Connection Successful</span>')
         self.addressSuccessFlag.setFlag(nuke.STARTLINE)
@@ -363,47 +147,92 @@ class nukeWindow(nukescripts.PythonPanel):
         self.fRange = nuke.String_Knob('fRange', 'Track Range: ', '%s-%s' % (nuke.root().firstFrame(), nuke.root().lastFrame()))
         self.addKnob(self.fRange)
 
+        # Setup how the frame range is split into child jobs
+        self.chunkStrategy = nuke.Enumeration_Knob('chunkStrategy', 'Chunking: ', hq_frames.chunkStrategyLabels)
+        self.addKnob(self.chunkStrategy)
+
+        # Frames per chunk, or minutes per chunk when chunking by time
+        self.chunkValue = nuke.String_Knob('chunkValue', 'Frames per chunk: ', str(hq_frames.defaultChunkSize))
+        self.addKnob(self.chunkValue)
+
+        # Estimated render time of one frame, only used when chunking by time
+        self.secondsPerFrame = nuke.String_Knob('secondsPerFrame', 'Seconds per frame: ', '10')
+        self.secondsPerFrame.setVisible(False)
+        self.addKnob(self.secondsPerFrame)
+
+        # Declare the paths once on the parent job instead of in every chunk
+        self.compactSpec = nuke.Boolean_Knob('compactSpec', 'Compact job spec')
+        self.compactSpec.setFlag(nuke.STARTLINE)
+        self.addKnob(self.compactSpec)
+
+        # Only submit the frames the Write nodes have not rendered yet
+        self.resumeRender = nuke.Boolean_Knob('resumeRender', 'Skip frames already rendered')
+        self.resumeRender.setFlag(nuke.STARTLINE)
+        self.addKnob(self.resumeRender)
+
         # Setup a button to test the server address which will reveal the Connection Successful text
         self.submitJob = nuke.PyScript_Knob("submitJob", "Submit job to farm", "")
         self.submitJob.setFlag(nuke.STARTLINE)
         self.addKnob(self.submitJob)
 
+        # Setup a button that sends the failed chunks of the last job again
+        self.retryFailedChunks = nuke.PyScript_Knob("retryFailedChunks", "Retry failed chunks", "")
+        self.addKnob(self.retryFailedChunks)
+
+        # Create a status flag that shows what the background worker is doing
+        self.statusFlag = nuke.Text_Knob('statusFlag', '', '')
+        self.statusFlag.setFlag(nuke.STARTLINE)
+        self.statusFlag.setVisible(False)
+        self.addKnob(self.statusFlag)
+
+        # Setup a button that cancels the server call in progress, only visible while one is running
+        self.cancelTask = nuke.PyScript_Knob("cancelTask", "Cancel", "")
+        self.cancelTask.setVisible(False)
+        self.addKnob(self.cancelTask)
+
+        # Shows how the chunks of the submitted job are getting on
+        self.jobProgress = nuke.Text_Knob('jobProgress', '', '')
+        self.jobProgress.setFlag(nuke.STARTLINE)
+        self.jobProgress.setVisible(False)
+        self.addKnob(self.jobProgress)
+
+        # Server calls run on a background worker and report back on Nuke's main thread
+        self.worker = hq_worker.backgroundWorker(executeInMainThread)
+        self.currentTask = None
+        self.monitor = None
+
+        # Send any jobs spooled while the server was unreachable
+        startSpoolFlusher()
+
         # Set the minimum size of the python panel
         self.setMinimumSize(500, 600)
 
+    @hq_profile.profiled(currentScene)
     def knobChanged(self, knob):
         # When you press a button run the command attached to that button
         self.response = ""
 
-        # Figure out which knob was changed
+        # Figure out which knob was changed. Anything that talks to the server runs
+        # on the background worker and reports back through one of the ...Done methods
         if knob is self.addressTest:
-            # Get a response from the function of the button that was pressed
-            self.response = doesHQServerExists(self.serverAddress.value())
-
-            # If there is a response do thing
-            if self.response == True:
-                # Write out the server address to a a hidden file
-                writeConfigCache(self.serverAddress.value())
-                # Set the value of addressSuccessFlag to green text Connection Successful
-                self.addressSuccessFlag.setValue('<span style="color:green">Connection Successful</span>')
-            else:
-                # Set the value of addressSuccessFlag to green text Connection failed
-                self.addressSuccessFlag.setValue('<span style="color:red">Connection failed</span>')
+            self.runInBackground("Testing the server address", doesHQServerExists,
+                                 (self.serverAddress.value(),), self.addressTestDone)
 
-            # Set the address success text flag to visible
-            self.addressSuccessFlag.setVisible(True)
+        elif knob is self.serverInfoRefresh:
+            # Fetch $HQROOT, client groups and email event names again
+            self.runInBackground("Refreshing the server info", refreshServerMetadata,
+                                 (self.serverAddress.value(),), self.serverInfoRefreshDone)
 
         elif knob is self.filePathCheck:
-            self.hQRootFilePathCheck()# Check if the file path exists
+            self.runInBackground("Checking the file path", checkFilePath,
+                                 (self.serverAddress.value(), self.filePath.value()), self.filePathCheckDone)
 
-            if os.path.isfile(self.fileResponse[self.platform].strip('"')) or os.path.isfile(self.fileResponse['hq'].strip('"')):
-                # Set the value of pathSuccessFlag to green text File found
-                self.pathSuccessFlag.setValue('<span style="color:green">File found</span>')
-            else:
-                # Set the value of pathSuccessFlag to green text File not found
-                self.pathSuccessFlag.setValue('<span style="color:red">File not found</span>')
-            # Reveal the file result flag
-            self.pathSuccessFlag.setVisible(True)
+        elif knob is self.cancelTask:
+            if self.currentTask is not None:
+                self.currentTask.cancel()
+                self.currentTask = None
+            hq_trace.endSession()
+            self.setStatus('<span style="color:orange">Cancelled</span>', False)
 
 #        elif knob is self.installDirectoryCurrent:
 #            self.installDirectory.setValue(nuke.EXE_PATH)
@@ -425,80 +254,227 @@ class nukeWindow(nukescripts.PythonPanel):
                 self.clientGet.setVisible(False)
                 self.clientGroupGet.setVisible(False)
 
+        elif knob is self.chunkStrategy:
+            strategy = hq_frames.chunkStrategies[self.chunkStrategy.value()]
+            if strategy == 'fixed':
+                self.chunkValue.setLabel('Frames per chunk: ')
+            elif strategy == 'time':
+                self.chunkValue.setLabel('Minutes per chunk: ')
+            self.chunkValue.setVisible(strategy != 'clients')
+            self.secondsPerFrame.setVisible(strategy == 'time')
+
         elif knob is self.clientGet:
-            # Get a response from the function of the button that was pressed
-            self.clientResponse = getClients(self.serverAddress.value())
-            self.cleanList = {}
+            self.runInBackground("Getting the client list", getClients,
+                                 (self.serverAddress.value(),), self.clientGetDone)
 
-            for i in range(0, len(self.clientResponse)):
-                self.cleanList[self.clientResponse[i]] = self.clientResponse[i]
+        elif knob is self.clientGroupGet:
+            self.runInBackground("Getting the client groups", getClientGroups,
+                                 (self.serverAddress.value(),), self.clientGroupGetDone)
 
-            # Call the function for popping up the popup
-            self.clientInterrumList = self.popUpPanel(self.clientResponse)
+        elif knob is self.submitJob:
+            hq_trace.startSession('submit ' + self.filePath.value())
+            # The file path is always checked again so the job uses the current $HQROOT
+            self.runInBackground("Checking the file path", checkFilePath,
+                                 (self.serverAddress.value(), self.filePath.value()), self.submitJobPathChecked)
+
+        elif knob is self.retryFailedChunks:
+            # Retry the job submitted from this panel, or the last one in the ledger
+            jobId = self.jobResponse[0] if getattr(self, 'jobResponse', None) else None
+            if jobId is None:
+                self.jobServer = self.serverAddress.value()
+            self.runInBackground("Retrying the failed chunks", retryFailed,
+                                 (self.jobServer, jobId), self.retryFailedDone, cancellable=False)
+
+    def runInBackground(self, message, function, args, onResult, cancellable=True):
+        """Run function(*args) on the background worker, showing message until
+        onResult is called with its return value on the main thread. Tasks that
+        send a job are not cancellable, dropping their result would not stop the
+        job reaching the farm."""
+        self.setStatus('<span style="color:orange">' + message + '...</span>', cancellable)
+        self.currentTask = self.worker.submit(function, args, onResult=self.taskFinished(onResult),
+                                              onError=self.taskFailed)
+
+    def taskFinished(self, onResult):
+        def finished(result):
+            self.currentTask = None
+            self.setStatus('', False)
+            try:
+                onResult(result)
+            except Exception:
+                # A submit that stops half way must not leave its trace session open
+                hq_trace.endSession()
+                raise
+        return finished
+
+    def taskFailed(self, error):
+        hq_trace.endSession()
+        self.currentTask = None
+        self.setStatus('<span style="color:red">Failed: ' + str(error) + '</span>', False)
+
+    def setStatus(self, message, busy):
+        # Show what the worker is doing and only offer to cancel while it is busy
+        self.statusFlag.setValue(message)
+        self.statusFlag.setVisible(message != '')
+        self.cancelTask.setVisible(busy)
+
+    def addressTestDone(self, response):
+        self.response = response
 
-        elif knob is self.clientGroupGet:
-            # Get a response from the function of the button that was pressed
-            self.clientGroupResponse = getClientGroups(self.serverAddress.value())
-            self.cleanList = {}
+        # If there is a response do thing
+        if self.response == True:
+            # Write out the server address to a a hidden file
+            writeConfigCache(self.serverAddress.value())
+            # Set the value of addressSuccessFlag to green text Connection Successful
+            self.addressSuccessFlag.setValue('<span style="color:green">Connection Successful</span>')
+        else:
+            # Set the value of addressSuccessFlag to green text Connection failed
+            self.addressSuccessFlag.setValue('<span style="color:red">Connection failed</span>')
 
-            for i in range(0, len(self.clientGroupResponse)):
-                self.cleanList[self.clientGroupResponse[i]['name']] = self.clientGroupResponse[i]
+        # Set the address success text flag to visible
+        self.addressSuccessFlag.setVisible(True)
 
-            # Call the function for popping up the popup
-            self.clientInterrumList = self.popUpPanel(self.clientGroupResponse)
+    def serverInfoRefreshDone(self, response):
+        if response:
+            self.addressSuccessFlag.setValue('<span style="color:green">Server info refreshed</span>')
+        else:
+            self.addressSuccessFlag.setValue('<span style="color:red">Connection failed</span>')
+        self.addressSuccessFlag.setVisible(True)
 
-        elif knob is self.submitJob:
-            self.parms = self.finaliseJobSpecs()
-            self.childJobs = []
-            for i in range(int(self.fRange.value().split('-')[0]), int(self.fRange.value().split('-')[1])+1, 10):
-                self.childJobs.append(buildChildJobs("Frame Range_"+str(i)+"-"+str(i+9), buildOSCommands(self.parms['hfs'], i, i+9, self.fileResponse), self.parms['priority']))
-            try:
-                self.mainJob = buildContainingJobSpec(self.parms['name'], self.parms, self.childJobs)
-            except:
-                raise ValueError("Frame range is invalid")
-            self.jobResponse = sendJob(self.parms['hq_server'], self.mainJob)
-            if self.jobResponse:
-                print "Job submission successful"
+    def filePathCheckDone(self, response):
+        if response is None:
+            self.pathSuccessFlag.setValue('<span style="color:red">Could not retrieve $HQROOT</span>')
+        else:
+            (self.hqRoot, self.platform, self.fileResponse, found) = response
+            if found:
+                # Set the value of pathSuccessFlag to green text File found
+                self.pathSuccessFlag.setValue('<span style="color:green">File found</span>')
             else:
-                print "Failed"
-
-    def hQRootFilePathCheck(self):
-        (self.hqRoot, self.platform) = getHQROOT(self.serverAddress.value())
-        self.filePathValue = self.filePath.value()
-        # See if the file path has $HQROOT in it
-        if "$HQROOT" in self.filePathValue:
-            # Set the platforms file value to the resolved path
-            self.fileResponse = {
-                'windows': '"'+self.filePathValue.replace("$HQROOT", self.hqRoot['windows']).replace('/', '\\')+'"',
-                'macosx': '"'+self.filePathValue.replace("$HQROOT", self.hqRoot['macosx'])+'"',
-                'linux': '"'+self.filePathValue.replace("$HQROOT", self.hqRoot['linux'])+'"',
-                'hq': '"'+self.filePathValue+'"'
-            }
-        elif self.hqRoot['linux'] in self.filePathValue or self.hqRoot['macosx'] in self.filePathValue or \
-                        self.hqRoot['windows'].replace('\\', '/') in self.filePathValue:
-            self.fileResponse = {
-                'windows': self.filePathValue.replace(self.hqRoot[self.platform], '"'+self.hqRoot['windows']).replace('/', '\\')+'"',
-                'macosx': self.filePathValue.replace(self.hqRoot[self.platform], '"'+self.hqRoot['macosx'])+'"',
-                'linux': self.filePathValue.replace(self.hqRoot[self.platform], '"'+self.hqRoot['linux'])+'"',
-                'hq': self.filePathValue.replace(self.hqRoot['linux'], '"'+"$HQROOT").replace(self.hqRoot['macosx'],
-                                                                                             "$HQROOT").replace(
-                    self.hqRoot['windows'], "$HQROOT")+'"'
-            }
+                # Set the value of pathSuccessFlag to green text File not found
+                self.pathSuccessFlag.setValue('<span style="color:red">File not found</span>')
+        # Reveal the file result flag
+        self.pathSuccessFlag.setVisible(True)
+
+    def clientGetDone(self, response):
+        self.clientResponse = response
+        if not self.clientResponse:
+            self.setStatus('<span style="color:red">Could not get the client list</span>', False)
+            return
+
+        self.cleanList = {}
+        for i in range(0, len(self.clientResponse)):
+            self.cleanList[self.clientResponse[i]] = self.clientResponse[i]
+
+        # Call the function for popping up the popup
+        self.clientInterrumList = self.popUpPanel(self.clientResponse)
+
+    def clientGroupGetDone(self, response):
+        self.clientGroupResponse = response
+        if not self.clientGroupResponse:
+            self.setStatus('<span style="color:red">Could not get the client groups</span>', False)
+            return
+
+        self.cleanList = {}
+        for i in range(0, len(self.clientGroupResponse)):
+            self.cleanList[self.clientGroupResponse[i]['name']] = self.clientGroupResponse[i]
+
+        # Call the function for popping up the popup
+        self.clientInterrumList = self.popUpPanel(self.clientGroupResponse)
+
+    @hq_profile.profiled(currentScene)
+    def submitJobPathChecked(self, response):
+        self.filePathCheckDone(response)
+        if response is None:
+            hq_trace.endSession()
+            return
+
+        self.parms = self.finaliseJobSpecs()
+        try:
+            frames = hq_frames.frameSet.parse(self.fRange.value())
+        except:
+            raise ValueError("Frame range is invalid")
+        if self.resumeRender.value():
+            # Listing the render directories can take a while on a share
+            self.runInBackground("Finding frames already rendered", hq_resume.missingFrames,
+                                 (writeNodeOutputs(), frames), self.submitFrames)
         else:
-            self.fileResponse = {
-                'windows': '"'+self.filePathValue.replace('/', '\\')+'"',
-                'macosx': '"'+self.filePathValue.replace('\\', '/')+'"',
-                'linux': '"'+self.filePathValue.replace('\\', '/')+'"',
-                'hq': '"'+self.filePathValue+'"'
-            }
+            self.submitFrames(frames)
+
+    @hq_profile.profiled(currentScene)
+    def submitFrames(self, frames):
+        if frames is None:
+            hq_trace.endSession()
+            self.setStatus('<span style="color:green">Every frame has already been rendered</span>', False)
+            return
 
-    def finaliseJobSpecs(self):
-        self.finaliseClientList()
         try:
-            if self.hqRoot:
-                pass
+            self.mainJob = nukeJobSpec(self.parms, self.frameChunks(frames),
+                                       self.fileResponse, self.compactSpec.value(),
+                                       targetPlatforms(self.parms['hq_server'], self.assigned_to, self.clientFullList))
         except:
-            self.knobChanged(self.filePathCheck)
+            raise ValueError("Frame range is invalid")
+        self.runInBackground("Submitting the job", sendJobWithFailover, (self.parms['hq_server'], self.mainJob),
+                             self.submitJobDone, cancellable=False)
+
+    def submitJobDone(self, response):
+        hq_trace.endSession()
+        # The job may have gone to another of the configured servers
+        (self.jobServer, self.jobResponse) = response
+        if self.jobResponse:
+            print "Job submitted to", self.jobServer
+            self.setStatus('<span style="color:green">Job submitted to ' + self.jobServer + '</span>', False)
+            self.watchJob(self.jobServer, self.jobResponse[0])
+        elif self.jobResponse is None:
+            print "Server unreachable, the job is spooled"
+            self.setStatus('<span style="color:orange">Server unreachable, the job will be submitted when it is back</span>', False)
+        else:
+            print "Failed"
+            self.setStatus('<span style="color:red">Job submission failed</span>', False)
+
+    def retryFailedDone(self, response):
+        if response:
+            self.setStatus('<span style="color:green">Failed chunks submitted as job ' + str(response[0]) + '</span>', False)
+            self.watchJob(self.jobServer, response[0])
+        elif response is None:
+            self.setStatus('<span style="color:green">No failed chunks to retry</span>', False)
+        else:
+            self.setStatus('<span style="color:red">Could not retry the failed chunks</span>', False)
+
+    def watchJob(self, hq_server, jobId):
+        # Follow the new job, the previous one is left to the web UI
+        self.stopMonitor()
+        self.monitor = hq_monitor.jobMonitor(hq_server, jobId, self.jobProgressChanged, executeInMainThread).start()
+
+    def jobProgressChanged(self, monitor, changes):
+        # Only called when a status has changed, so the knob is only redrawn then
+        if monitor is not self.monitor:
+            return
+        if monitor.finished():
+            colour = 'red' if monitor.status() in ('failed', hq_monitor.missingStatus) else 'green'
+        else:
+            colour = 'orange'
+        self.jobProgress.setValue('<span style="color:' + colour + '">' + monitor.summaryText() + '</span>')
+        self.jobProgress.setVisible(True)
+
+    def stopMonitor(self):
+        if self.monitor is not None:
+            self.monitor.stop()
+            self.monitor = None
+
+    def frameChunks(self, frames):
+        # Split the frameSet with the chunking strategy chosen in the panel
+        strategy = hq_frames.chunkStrategies[self.chunkStrategy.value()]
+        if strategy == 'clients':
+            value = availableClientCount(self.serverAddress.value(), self.assigned_to, self.clientFullList)
+        elif strategy == 'time':
+            value = float(self.chunkValue.value()) * 60
+        else:
+            value = int(self.chunkValue.value())
+        return hq_frames.chunkFrames(frames, strategy, value,
+                                     float(self.secondsPerFrame.value()), nukeStartupSeconds)
+
+    @hq_profile.profiled(currentScene)
+    def finaliseJobSpecs(self):
+        self.finaliseClientList()
         return getBaseParameters(self.jobNameSet(self.jobName.value(), self.fileResponse['hq']), self.assigned_to,
                                  self.clientFullList, self.clientGroupFullList,
                                  self.cleanInstallEXE(self.installDirectory.value()), self.serverAddress.value(),
@@ -506,11 +482,7 @@ class nukeWindow(nukescripts.PythonPanel):
 
     def cleanInstallEXE(self, unusableDir):
         if self.installDirectoryCurrent.value() == "HQRoot install directory":
-            usableDir = {
-            'linux': posixpath.join(unusableDir.replace("$HQROOT", '"'+self.hqRoot['linux']).replace("$OS", 'linux'), os.path.split(nuke.EXE_PATH)[1])+'"',
-            'windows': posixpath.join(unusableDir.replace("$HQROOT", '"'+self.hqRoot['windows']).replace("$OS", 'windows'), os.path.split(nuke.EXE_PATH)[1]+'.exe"').replace('/', '\\'),
-            'macosx': posixpath.join(unusableDir.replace("$HQROOT", '"'+self.hqRoot['macosx']).replace("$OS", 'macosx'), os.path.split(nuke.EXE_PATH)[1])+'"'
-            }
+            usableDir = hqRootExecutables(unusableDir, self.hqRoot, os.path.split(nuke.EXE_PATH)[1])
         elif self.installDirectoryCurrent.value() == "Default install directory":
             nukeDirName = 'Nuke' + str(nuke.NUKE_VERSION_STRING)
             ### TODO: Figure out the Mac default install directory
@@ -578,4 +550,5 @@ class clientSelectionPanel(nukescripts.PythonPanel):
 
 def runGui():
     currentWindow = nukeWindow()
-    currentWindow.showModal()
\ No newline at end of file
+    currentWindow.showModal()
+    currentWindow.stopMonitor()
\ No newline at end of file
@@ -3,6 +3,8 @@ import os
 import os.path
 import sys
 import xmlrpclib
+import hq_connection
+import hq_cache
 
 ### Window setup
 class programCheck:
@@ -122,31 +124,19 @@ class hqRop(object):
 		new_reasons = []
 		failure_messages = []
 
+		for reason in placeholder_reasons:
+			if reason not in hq_cache.emailEventMethods:
+				raise Exception("Did not recieve valid placeholder reason " + 
+								reason + ".")
 
+		### The event names for every reason come from the metadata cache,
+		### which fetches all of them in a single round trip when it is cold
+		event_names = hq_cache.metadata.getOrFetch(server_connection, 'email_event_names')
 		for reason in placeholder_reasons:
-			try:
-				if reason == "start":
-					new_reasons.extend(
-						server_connection.getStartedJobEventNames())
-				elif reason == "success":
-					new_reasons.extend(server_connection.getSucceededStatusNames())
-				elif reason == "failure":
-					new_reasons.extend(server_connection.getFailedJobStatusNames())
-				elif reason == "pause":
-					new_reasons.extend(server_connection.getPausedJobStatusNames())
-				elif reason == "resume":
-					new_reasons.extend(server_connection.getResumedEventNames())
-				elif reason == "reschedule":
-					new_reasons.extend(
-					server_connection.getRescheduledEventNames())
-				elif reason == "priority change":
-					new_reasons.extend(
-					server_connection.getPriorityChangedEventNames())
-				else:
-					raise Exception("Did not recieve valid placeholder reason " + 
-									reason + ".")
-			except xmlrpclib.Fault:
+			if event_names[reason] is None:
 				failure_messages.append(string.capwords(reason))
+			else:
+				new_reasons.extend(event_names[reason])
 
 
 		if failure_messages:
@@ -441,13 +431,8 @@ class hqRop(object):
 		return True
 
 	def hqServerProxySetup(self, hq_server):
-		"""Sets up a xmlrpclib server proxy to the given HQ server."""
-		if not hq_server.startswith("http://"):
-			full_hq_server_path = "http://%s" % hq_server
-		else:
-			full_hq_server_path = hq_server
-
-		return xmlrpclib.ServerProxy(full_hq_server_path, allow_none=True)
+		"""Returns the shared keep-alive connection to the given HQ server."""
+		return hq_connection.getConnection(hq_server)
 
 	def doesHQServerExists(self, hq_server):
 		"""Check that the given HQ server can be connected to.
@@ -457,10 +442,11 @@ class hqRop(object):
 		return self.hQServerPing(server, hq_server)
 
 	def hQServerConnect(self, hq_server):
-		"""Connect to the HQueue server and return the proxy connection."""
+		"""Connect to the HQueue server and return the proxy connection.
+		The server is only pinged if it has not answered a call recently."""
 		s = self.hqServerProxySetup(hq_server)
 
-		if self.hQServerPing(s, hq_server):
+		if s.recentlyAlive() or self.hQServerPing(s, hq_server):
 			return s
 		else:
 			return None
@@ -570,6 +556,11 @@ class nukeWindow(nukescripts.PythonPanel):
 		### Set the minimum size of the python panel
 		self.setMinimumSize(500, 600)
 
+	def hqRootInFilePath(self):
+		### Query $HQROOT once and keep it for the rest of the file path check
+		self.hqroot = self.serverRop.getHQROOT(self.serverAddress.value())
+		return self.hqroot is not None and self.hqroot in self.filePath.value()
+
 	def knobChanged(self, knob):
 		### When you press a button run the command attached to that button
 		self.response = ""
@@ -590,8 +581,7 @@ class nukeWindow(nukescripts.PythonPanel):
 					self.pathSuccessFlag.setValue('<span style="color:red">File not found</span>')
 				### Set the address success text flag to visible
 				self.pathSuccessFlag.setVisible(True)
-			elif self.serverRop.getHQROOT(self.serverAddress.value()) in self.filePath.value():
-				self.hqroot = self.serverRop.getHQROOT(self.serverAddress.value())
+			elif self.hqRootInFilePath():
 				self.response = self.filePath.value().replace(self.hqroot, "$HQROOT")
 				### Check whether file exists
 				if os.path.isfile(self.filePath.value()):
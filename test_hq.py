@@ -0,0 +1,979 @@
+# Author: Josh Kelly
+
+# Import needed modules and components
+import os
+import time
+import threading
+import shutil
+import socket
+import tempfile
+import json
+import argparse
+import unittest
+import xmlrpclib
+
+# Keep the ledger, spool, cache and config the tests write out of the real home directory
+os.environ['HOME'] = tempfile.mkdtemp()
+
+import hq_benchmark
+import hq_cache
+import hq_cli
+import hq_connection
+import hq_frames
+import hq_ledger
+import hq_monitor
+import hq_resume
+import hq_profile
+import hq_servers
+import hq_spool
+import hq_submit
+import hq_trace
+import hq_worker
+from hq_standin_server import standinServer, defaultHQRoot
+
+# Nothing listens on port 1, so connecting to it fails straight away
+unreachableServer = '127.0.0.1:1'
+
+def chunkedJob(name, chunkCount):
+    return {'name': name, 'command': '', 'priority': 5,
+            'children': [{'name': 'Frame Range_%d' % index, 'command': 'render %d' % index}
+                         for index in range(chunkCount)]}
+
+def openBreaker(hq_server):
+    """Make calls to the server fail as if it could not be reached, until the breaker is closed."""
+    breaker = hq_connection.circuitBreaker(threshold=1, cooldown=60)
+    breaker.failed()
+    hq_connection.getConnection(hq_server).breaker = breaker
+    return breaker
+
+#################################################################################################################################################################################################
+#### FRAMES
+
+class frameSetTests(unittest.TestCase):
+
+    def testParse(self):
+        frames = hq_frames.frameSet.parse('1-10x3, 20, 21-23')
+        self.assertEqual(list(frames), [1, 4, 7, 10, 20, 21, 22, 23])
+        self.assertEqual(str(frames), '1-10x3,20-23')
+
+    def testParseNegativeFrames(self):
+        self.assertEqual(list(hq_frames.frameSet.parse('-5--3')), [-5, -4, -3])
+
+    def testParseRejectsBadRanges(self):
+        for expression in ['', '10-1', '1-10x0', 'a-b', '1,,x']:
+            self.assertRaises(ValueError, hq_frames.frameSet.parse, expression)
+
+    def testEndIsSnappedToTheStep(self):
+        self.assertEqual(hq_frames.frameSet.parse('1-10x4').runs, [(1, 9, 4)])
+
+    def testNormaliseJoinsAndMergesRuns(self):
+        self.assertEqual(hq_frames.normaliseRuns([(11, 20, 1), (1, 10, 1)]), [(1, 20, 1)])
+        self.assertEqual(hq_frames.normaliseRuns([(1, 10, 1), (5, 15, 1)]), [(1, 15, 1)])
+        self.assertEqual(hq_frames.normaliseRuns([(1, 9, 2), (2, 10, 2)]), [(1, 10, 1)])
+
+    def testChunks(self):
+        chunks = hq_frames.frameSet.parse('1-25').chunks(10)
+        self.assertEqual([str(chunk) for chunk in chunks], ['1-10', '11-20', '21-25'])
+
+class chunkingTests(unittest.TestCase):
+
+    def chunkStrings(self, expression, strategy, value, secondsPerFrame=0.0, startupSeconds=0.0):
+        frames = hq_frames.frameSet.parse(expression)
+        chunks = hq_frames.chunkFrames(frames, strategy, value, secondsPerFrame, startupSeconds)
+        self.assertEqual(sum(len(chunk) for chunk in chunks), len(frames))
+        return [str(chunk) for chunk in chunks]
+
+    def testFixedChunksStopAtEachRun(self):
+        self.assertEqual(self.chunkStrings('1-12,20-23', 'fixed', 5), ['1-5', '6-10', '11-12', '20-23'])
+
+    def testTimeChunksFitTheTarget(self):
+        # 60 seconds of startup leaves room for 4 frames of 60 seconds in 5 minutes
+        self.assertEqual(self.chunkStrings('1-10', 'time', 300, 60, 60), ['1-4', '5-8', '9-10'])
+        # Without a frame time there is nothing to go by but the default size
+        self.assertEqual(self.chunkStrings('1-20', 'time', 300), ['1-10', '11-20'])
+
+    def testOneChunkPerClient(self):
+        self.assertEqual(self.chunkStrings('1-10', 'clients', 4), ['1-3', '4-6', '7-8', '9-10'])
+        self.assertEqual(self.chunkStrings('1-3', 'clients', 10), ['1', '2', '3'])
+
+    def testClientChunksWithSeveralRuns(self):
+        self.assertEqual(self.chunkStrings('1-100x2,200-210', 'clients', 5),
+                         ['1-25x2', '27-51x2', '53-75x2', '77-99x2', '200-210'])
+        # A chunk is one run, so there can't be fewer chunks than runs
+        self.assertEqual(self.chunkStrings('1-5,10,20-24', 'clients', 2), ['1-5', '10', '20-24'])
+
+    def testUnknownStrategy(self):
+        self.assertRaises(ValueError, self.chunkStrings, '1-10', 'random', 3)
+
+#################################################################################################################################################################################################
+#### JOB SPECS
+
+class jobSpecTests(unittest.TestCase):
+
+    def nukeJob(self, compact, assigned_to='clients', platforms=hq_submit.allPlatforms):
+        fileName = hq_submit.resolveNukeFilePaths('$HQROOT/shots/sh010.nk', defaultHQRoot, 'linux')
+        executables = hq_submit.hqRootExecutables('$HQROOT/nuke_distros/$OS-Nuke9.0v8', defaultHQRoot, 'Nuke9.0')
+        parms = hq_submit.getBaseParameters('Render -> NK: sh010', assigned_to, 'render001,render002', '',
+                                            executables, 'localhost:5000', 5)
+        chunks = hq_frames.frameSet.parse('1-30').chunks(10)
+        return hq_submit.nukeJobSpec(parms, chunks, fileName, compact, platforms)
+
+    def expand(self, command, environment, OSplatform):
+        for name, value in environment.items():
+            if name.endswith('_' + OSplatform.upper()):
+                reference = '%' + name + '%' if OSplatform == 'windows' else '$' + name
+                command = command.replace(reference, value)
+        return command
+
+    def testCompactCommandsExpandToTheFullOnes(self):
+        full = self.nukeJob(False)
+        compact = self.nukeJob(True)
+        for fullChild, compactChild in zip(full['children'], compact['children']):
+            for OSplatform in hq_submit.allPlatforms:
+                self.assertEqual(self.expand(compactChild['command'][OSplatform], compact['environment'], OSplatform),
+                                 fullChild['command'][OSplatform])
+
+    def testCompactChildrenLeaveSharedFieldsToTheParent(self):
+        compact = self.nukeJob(True)
+        for child in compact['children']:
+            self.assertFalse('priority' in child or 'tags' in child)
+            # HQueue does not pass assignment conditions down, so every child keeps them
+            self.assertEqual(child['host'], 'render001,render002')
+        self.assertTrue(len(json.dumps(compact)) < len(json.dumps(self.nukeJob(False))))
+
+    def testOnlyTheGivenPlatforms(self):
+        for compact in [False, True]:
+            job = self.nukeJob(compact, platforms=['linux'])
+            self.assertEqual([child['command'].keys() for child in job['children']], [['linux']] * 3)
+        self.assertEqual(sorted(self.nukeJob(True, platforms=['linux'])['environment'].keys()),
+                         ['HQR_EXE_LINUX', 'HQR_SCENE_LINUX'])
+
+#################################################################################################################################################################################################
+#### RESUME
+
+class resumeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def render(self, name, contents='pixels'):
+        with open(os.path.join(self.directory, name), 'w') as f:
+            f.write(contents)
+
+    def testFrameTokens(self):
+        for fileName in ['comp.####.exr', 'comp.@@@@.exr', 'comp.%04d.exr', 'comp.$F4.exr']:
+            (directory, pattern) = hq_resume.outputPattern(os.path.join(self.directory, fileName))
+            self.assertEqual(directory, self.directory)
+            self.assertEqual(pattern.match('comp.0012.exr').group(1), '0012')
+            self.assertEqual(pattern.match('comp.12.exr'), None)
+        self.assertEqual(hq_resume.outputPattern('/renders/####/comp.exr'), None)
+        self.assertEqual(hq_resume.outputPattern('/renders/comp.exr'), None)
+
+    def testMissingAndEmptyFramesAreRenderedAgain(self):
+        for frame in range(1, 11):
+            self.render('comp.%04d.exr' % frame, '' if frame == 4 else 'pixels')
+        self.render('comp.0020.exr')
+        self.render('notes.txt')
+        output = os.path.join(self.directory, 'comp.####.exr')
+        frames = hq_resume.missingFrames([output], hq_frames.frameSet.parse('1-20'))
+        self.assertEqual(list(frames), [4] + range(11, 20))
+
+    def testEveryOutputMustHaveTheFrame(self):
+        for frame in range(1, 6):
+            self.render('beauty.%04d.exr' % frame)
+        for frame in range(1, 4):
+            self.render('depth.%04d.exr' % frame)
+        outputs = [os.path.join(self.directory, 'beauty.####.exr'), os.path.join(self.directory, 'depth.####.exr')]
+        self.assertEqual(str(hq_resume.missingFrames(outputs, hq_frames.frameSet.parse('1-5'))), '4-5')
+
+    def testNothingLeftToRender(self):
+        for frame in range(1, 4):
+            self.render('comp.%d.exr' % frame)
+        output = os.path.join(self.directory, 'comp.%d.exr')
+        self.assertEqual(hq_resume.missingFrames([output], hq_frames.frameSet.parse('1-3')), None)
+
+    def testMissingDirectoryMeansNothingRendered(self):
+        output = os.path.join(self.directory, 'not yet', 'comp.####.exr')
+        frames = hq_frames.frameSet.parse('1-3')
+        self.assertEqual(hq_resume.missingFrames([output], frames), frames)
+
+    def testWriteNodesOfANukeScript(self):
+        script = os.path.join(self.directory, 'sh010.nk')
+        with open(script, 'w') as f:
+            f.write('Write {\n file /renders/sh010/comp.####.exr\n name Write1\n}\n'
+                    'Write {\n file "/renders/sh010/disabled.####.exr"\n disable true\n}\n'
+                    'Write {\n file "[value root.name].####.exr"\n}\n'
+                    'Write {\n file "/renders/sh010/with space.####.exr"\n}\n')
+        self.assertEqual(hq_resume.nukeScriptOutputs(script),
+                         ['/renders/sh010/comp.####.exr', '/renders/sh010/with space.####.exr'])
+
+#################################################################################################################################################################################################
+#### CONNECTION
+
+class circuitBreakerTests(unittest.TestCase):
+
+    def testOpensAfterThresholdAndLetsOneTrialThrough(self):
+        breaker = hq_connection.circuitBreaker(threshold=2, cooldown=0.2)
+        breaker.failed()
+        self.assertTrue(breaker.allow())
+        breaker.failed()
+        self.assertEqual(breaker.state(), 'open')
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.25)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.succeeded()
+        self.assertEqual(breaker.state(), 'closed')
+        self.assertTrue(breaker.allow())
+
+    def testFailedTrialOpensAgain(self):
+        breaker = hq_connection.circuitBreaker(threshold=1, cooldown=0.1)
+        breaker.failed()
+        time.sleep(0.15)
+        self.assertTrue(breaker.allow())
+        breaker.failed()
+        self.assertFalse(breaker.allow())
+
+    def testOpenBreakerFailsFast(self):
+        s = hq_connection.hqServerConnection(unreachableServer)
+        s.breaker = hq_connection.circuitBreaker(threshold=1, cooldown=60)
+        self.assertRaises(hq_connection.serverUnreachable, s.ping)
+        start = time.time()
+        self.assertRaises(hq_connection.circuitOpenError, s.ping)
+        self.assertTrue(time.time() - start < 0.1)
+
+class errorTests(unittest.TestCase):
+
+    def testErrorsAreClassified(self):
+        for (error, kind) in [(socket.timeout('timed out'), hq_connection.serverTimeout),
+                              (socket.error(104, 'Connection reset by peer'), hq_connection.connectionLost),
+                              (xmlrpclib.ProtocolError('hq:5000/RPC2', 503, 'Service Unavailable', {}),
+                               hq_connection.serverProtocolError)]:
+            classified = hq_connection.classifyError('hq:5000', 'getJob', error)
+            self.assertTrue(isinstance(classified, kind))
+            self.assertEqual((classified.hq_server, classified.method, classified.cause), ('hq:5000', 'getJob', error))
+        self.assertEqual(hq_connection.classifyError('hq:5000', 'getJob', ValueError()), None)
+
+    def testOnlyAProxyErrorIsWorthRetrying(self):
+        for (code, retryable) in [(500, False), (502, True), (503, True), (504, True)]:
+            error = xmlrpclib.ProtocolError('hq:5000/RPC2', code, '', {})
+            self.assertEqual(hq_connection.classifyError('hq:5000', 'getJob', error).retryable, retryable)
+
+    def testOnlyReadsAreRetried(self):
+        self.assertTrue(hq_connection.isIdempotent('getJob', (1,)))
+        self.assertTrue(hq_connection.isIdempotent('ping', ()))
+        self.assertFalse(hq_connection.isIdempotent('newjob', ({},)))
+        reads = [{'methodName': 'getJob', 'params': [1]}, {'methodName': 'getHQRoot', 'params': ['linux']}]
+        self.assertTrue(hq_connection.isIdempotent('system.multicall', (reads,)))
+        self.assertFalse(hq_connection.isIdempotent('system.multicall', (reads + [{'methodName': 'newjob', 'params': [{}]}],)))
+
+    def testUnreachableServerIsRetried(self):
+        s = hq_connection.hqServerConnection(unreachableServer)
+        s.breaker = hq_connection.circuitBreaker(threshold=0)
+        self.assertRaises(hq_connection.serverUnreachable, s.getJob, 1)
+        self.assertEqual(s.stats.snapshot()['retries'], hq_connection.maxRetries)
+        self.assertRaises(hq_connection.serverUnreachable, s.newjob, {})
+        self.assertEqual(s.stats.snapshot()['retries'], hq_connection.maxRetries)
+
+#################################################################################################################################################################################################
+#### WORKER
+
+class workerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.worker = hq_worker.backgroundWorker()
+        self.release = threading.Event()
+        self.calls = []
+        # Hold the worker on a first task so the ones queued after it wait
+        self.worker.submit(self.release.wait)
+
+    def call(self, value):
+        self.calls.append(value)
+        return value
+
+    def finish(self, task):
+        self.release.set()
+        self.assertTrue(task.done.wait(5))
+
+    def testSameKeyIsCalledOnce(self):
+        results = []
+        first = self.worker.submit(self.call, ('clients',), results.append, key='getClients')
+        second = self.worker.submit(self.call, ('clients',), results.append, key='getClients')
+        self.assertTrue(first is second)
+        self.finish(first)
+        self.assertEqual(self.calls, ['clients'])
+        self.assertEqual(results, ['clients', 'clients'])
+
+    def testKeyIsQueuedAgainOnceFinished(self):
+        first = self.worker.submit(self.call, (1,), key='getClients')
+        self.finish(first)
+        second = self.worker.submit(self.call, (2,), key='getClients')
+        self.assertTrue(second.done.wait(5))
+        self.assertEqual(self.calls, [1, 2])
+
+    def testCancelledTaskDeliversNothing(self):
+        results = []
+        task = self.worker.submit(self.call, ('skipped',), results.append, key='getClients')
+        task.cancel()
+        again = self.worker.submit(self.call, ('sent',), results.append, key='getClients')
+        self.assertFalse(task is again)
+        self.finish(again)
+        self.assertEqual(self.calls, ['sent'])
+        self.assertEqual(results, ['sent'])
+
+    def testErrorGoesToOnError(self):
+        errors = []
+        task = self.worker.submit(int, ('not a number',), None, errors.append)
+        self.finish(task)
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(isinstance(errors[0], ValueError))
+
+#################################################################################################################################################################################################
+#### SUBMISSION
+
+class standinTestCase(unittest.TestCase):
+    """Runs every test against a fresh stand-in server with an empty spool and ledger."""
+
+    def setUp(self):
+        self.server = standinServer().start()
+        hq_submit._unfinishedSubmissions.clear()
+        for path in [hq_spool.spoolDirectory, hq_ledger.ledgerLocation]:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+
+    def tearDown(self):
+        hq_connection.closeAllConnections()
+        self.server.stop()
+
+    def jobsNamed(self, name):
+        return [record for record in self.server.jobs.values() if record['name'] == name]
+
+class poolTests(standinTestCase):
+
+    def testOneConnectionPerServer(self):
+        self.assertTrue(hq_connection.getConnection(self.server.address) is
+                        hq_connection.getConnection('http://' + self.server.address))
+
+    def testCallsReuseTheOpenSocket(self):
+        s = hq_connection.getConnection(self.server.address)
+        for i in range(10):
+            s.getHQRoot('linux')
+        self.assertEqual(self.server.connects, 1)
+        self.assertEqual(s.stats.snapshot()['connects'], 1)
+        self.assertEqual(s.stats.snapshot()['requests'], 10)
+
+    def testIdleSocketsAreCapped(self):
+        s = hq_connection.getConnection(self.server.address)
+        s.supportsMulticall = False
+        s.batch([('getHQRoot', ('linux',))] * 20)
+        self.assertTrue(len(s._idle) <= hq_connection.maxIdleTransports)
+        s.close()
+        self.assertEqual(s._idle, [])
+
+class healthCheckTests(standinTestCase):
+
+    def testPingIsSkippedWhileTheServerIsAlive(self):
+        hq_submit.hQServerConnect(self.server.address)
+        self.server.requests = 0
+        self.assertTrue(hq_submit.hQServerConnect(self.server.address) is not None)
+        self.assertEqual(self.server.requests, 0)
+
+    def testPingAfterTheTTL(self):
+        s = hq_submit.hQServerConnect(self.server.address)
+        s.healthTTL = 0.05
+        time.sleep(0.1)
+        self.server.requests = 0
+        hq_submit.hQServerConnect(self.server.address)
+        self.assertEqual(self.server.requests, 1)
+
+    def testPingAfterAFailure(self):
+        s = hq_submit.hQServerConnect(self.server.address)
+        self.server.failNext('getHQRoot', kind='error')
+        self.assertRaises(hq_connection.serverError, s.getHQRoot, 'linux')
+        self.assertFalse(s.recentlyAlive())
+        self.server.requests = 0
+        hq_submit.hQServerConnect(self.server.address)
+        self.assertEqual(self.server.requests, 1)
+
+class batchTests(standinTestCase):
+
+    def testBatchIsOneRequest(self):
+        ids = hq_submit.sendJob(self.server.address, chunkedJob('batched', 3))
+        s = hq_connection.getConnection(self.server.address)
+        self.server.requests = 0
+        jobs = s.batch([('getJob', (jobId,)) for jobId in self.server.jobs[ids[0]]['children']])
+        self.assertEqual([job['name'] for job in jobs], ['Frame Range_0', 'Frame Range_1', 'Frame Range_2'])
+        self.assertEqual(self.server.requests, 1)
+
+    def testFallbackWithoutMulticallIsBounded(self):
+        self.server.stop()
+        self.server = standinServer(multicall=False, latency=0.05).start()
+        ids = hq_submit.sendJob(self.server.address, chunkedJob('unbatched', 40))
+        s = hq_connection.getConnection(self.server.address)
+        self.server.connects = 0
+        children = self.server.jobs[ids[0]]['children']
+        jobs = s.batch([('getJob', (jobId,)) for jobId in children] + [('getJob', (999,))], raiseFaults=False)
+        self.assertFalse(s.supportsMulticall)
+        self.assertEqual([job['id'] for job in jobs[:-1]], children)
+        self.assertEqual(jobs[-1], None)
+        self.assertTrue(self.server.connects <= hq_connection.maxIdleTransports)
+
+    def testFallbackStopsAtTheFirstError(self):
+        self.server.stop()
+        self.server = standinServer(multicall=False).start()
+        s = hq_connection.getConnection(self.server.address)
+        s.supportsMulticall = False
+        self.server.failNext('getJob', kind='error')
+        self.server.requests = 0
+        self.assertRaises(hq_connection.serverError, s.batch, [('getJob', (jobId,)) for jobId in range(100)])
+        self.assertTrue(self.server.requests < 100)
+
+class inventorySyncTests(standinTestCase):
+
+    def testRemovedClientsAreDropped(self):
+        self.server.clients.append({'id': 2, 'hostname': 'render002', 'os': 'linux', 'ip': '10.0.0.3'})
+        hq_submit.syncClients(self.server.address)
+        del self.server.clients[0]
+        hq_submit.syncClients(self.server.address)
+        self.assertEqual(hq_cache.inventory.hostnames(self.server.address), ['render002'])
+
+    def testFullListingOnceADay(self):
+        hq_submit.syncClients(self.server.address)
+        # A renamed client keeps its id, so only a full listing picks the new name up
+        self.server.clients[0]['hostname'] = 'renamed001'
+        hq_submit.syncClients(self.server.address)
+        self.assertEqual(hq_cache.inventory.hostnames(self.server.address), ['render001'])
+
+        server = hq_cache.inventory.load()[hq_connection.serverURL(self.server.address)]
+        server['fullSync'] -= hq_cache.fullSyncInterval + 1
+        hq_submit.syncClients(self.server.address)
+        self.assertEqual(hq_cache.inventory.hostnames(self.server.address), ['renamed001'])
+
+    def testInventoryIsKeptOnDisk(self):
+        hq_submit.syncClients(self.server.address)
+        inventory = hq_cache.clientInventory(hq_cache.inventory.location)
+        self.assertEqual(inventory.hostnames(self.server.address), ['render001'])
+
+    def testClientListComesFromTheInventory(self):
+        self.assertEqual(hq_submit.getClients(self.server.address), ['render001'])
+        self.server.requests = 0
+        hq_cache.inventory.syncInBackground = lambda connection, onDone=None: None
+        try:
+            self.assertEqual(hq_submit.getClients(self.server.address), ['render001'])
+        finally:
+            del hq_cache.inventory.syncInBackground
+        self.assertEqual(self.server.requests, 0)
+
+class metadataCacheTests(standinTestCase):
+
+    def testHQROOTIsAskedForOnce(self):
+        self.assertEqual(hq_submit.getHQROOT(self.server.address)[0], defaultHQRoot)
+        self.server.requests = 0
+        self.assertEqual(hq_submit.getHQROOT(self.server.address)[0], defaultHQRoot)
+        self.assertEqual(self.server.requests, 0)
+
+    def testCacheIsKeptOnDisk(self):
+        hq_submit.getHQROOT(self.server.address)
+        cache = hq_cache.serverMetadataCache(hq_cache.metadata.location)
+        self.assertEqual(cache.get(self.server.address, 'hq_root'), defaultHQRoot)
+
+    def testExpiredEntryIsFetchedAgain(self):
+        hq_submit.getHQROOT(self.server.address)
+        entry = hq_cache.metadata.load()[hq_connection.serverURL(self.server.address)]['hq_root']
+        entry['time'] -= hq_cache.metadataTTL['hq_root'] + 1
+        self.assertEqual(hq_cache.metadata.get(self.server.address, 'hq_root'), None)
+        self.server.hqRoot['linux'] = '/net/hq'
+        self.assertEqual(hq_submit.getHQROOT(self.server.address)[0]['linux'], '/net/hq')
+
+    def testRefreshFetchesEverythingAgain(self):
+        hq_submit.getHQROOT(self.server.address)
+        self.server.hqRoot['linux'] = '/net/hq'
+        self.server.requests = 0
+        self.assertTrue(hq_submit.refreshServerMetadata(self.server.address))
+        # One multicall, and a ping if the server has not answered recently
+        self.assertTrue(self.server.requests <= 2)
+        self.assertEqual(hq_cache.metadata.get(self.server.address, 'hq_root')['linux'], '/net/hq')
+        self.assertEqual(hq_cache.metadata.get(self.server.address, 'client_groups'), [{'name': 'linux_farm'}])
+
+    def testInvalidateOneKey(self):
+        hq_submit.refreshServerMetadata(self.server.address)
+        hq_cache.metadata.invalidate(self.server.address, 'client_groups')
+        self.assertEqual(hq_cache.metadata.get(self.server.address, 'client_groups'), None)
+        self.assertEqual(hq_cache.metadata.get(self.server.address, 'hq_root'), defaultHQRoot)
+
+class inventoryTests(standinTestCase):
+
+    def testPlatformsComeFromARecentSync(self):
+        self.assertEqual(hq_submit.targetPlatforms(self.server.address, 'any', ''), hq_submit.allPlatforms)
+        self.assertTrue(hq_submit.syncClients(self.server.address))
+        self.assertEqual(hq_submit.targetPlatforms(self.server.address, 'any', ''), ['linux'])
+
+    def testStaleInventoryGivesEveryPlatform(self):
+        hq_submit.syncClients(self.server.address)
+        server = hq_cache.inventory.load()[hq_connection.serverURL(self.server.address)]
+        server['synced'] = time.time() - hq_cache.platformsMaxAge - 1
+        self.assertFalse(hq_cache.inventory.recentlySynced(self.server.address))
+        self.assertEqual(hq_submit.targetPlatforms(self.server.address, 'any', ''), hq_submit.allPlatforms)
+
+    def testSyncOnlyFetchesNewClients(self):
+        hq_submit.syncClients(self.server.address)
+        self.server.clients.append({'id': 2, 'hostname': 'render002', 'os': 'windows', 'ip': '10.0.0.3'})
+        fetched = []
+        getClients = self.server.getClients
+        def countingGetClients(ids, attribs):
+            fetched.append(ids)
+            return getClients(ids, attribs)
+        self.server.server.funcs['getClients'] = countingGetClients
+        hq_submit.syncClients(self.server.address)
+        self.assertEqual(fetched, [None, [2]])
+        self.assertEqual(hq_cache.inventory.hostnames(self.server.address), ['render001', 'render002'])
+        self.assertEqual(hq_submit.targetPlatforms(self.server.address, 'clients', 'render002'), ['windows'])
+
+class gzipTests(standinTestCase):
+
+    def testLargeRequestsAreCompressed(self):
+        job = chunkedJob('compressed', 200)
+        s = hq_connection.getConnection(self.server.address)
+        s.ping()
+        s.stats.reset()
+        s.newjob(job)
+        self.assertTrue(s.supportsGzip)
+        self.assertTrue(s.stats.snapshot()['bytes_sent'] < len(xmlrpclib.dumps((job,), 'newjob')) / 4)
+
+    def testSmallRequestsAreNot(self):
+        s = hq_connection.getConnection(self.server.address)
+        s.ping()
+        self.assertEqual(s.supportsGzip, None)
+
+    def testServerWithoutGzipGetsThePlainRequest(self):
+        self.server.stop()
+        self.server = standinServer(gzip=False).start()
+        s = hq_submit.hQServerConnect(self.server.address)
+        self.assertTrue(hq_submit.submitJob(self.server.address, chunkedJob('plain', 200)))
+        self.assertEqual(len(self.jobsNamed('plain')), 1)
+        self.assertEqual(s.supportsGzip, False)
+        # Later requests go uncompressed straight away
+        self.server.requests = 0
+        hq_submit.submitJob(self.server.address, chunkedJob('plain again', 200))
+        self.assertEqual(self.server.requests, 1)
+
+    def testServerErrorIsNotSentAgainUncompressed(self):
+        hq_submit.hQServerConnect(self.server.address)
+        self.server.failNext('newjob', kind='error')
+        self.assertEqual(hq_submit.submitJob(self.server.address, chunkedJob('failed', 200)), False)
+        self.assertEqual(len(self.server.submissions), 0)
+        self.assertEqual(hq_connection.getConnection(self.server.address).supportsGzip, None)
+
+class spoolTests(standinTestCase):
+
+    def testSameJobIsSpooledOnce(self):
+        job = chunkedJob('spooled', 2)
+        hq_spool.spoolJob(self.server.address, job)
+        hq_spool.spoolJob(self.server.address, job)
+        hq_spool.spoolJob(self.server.address, chunkedJob('other', 2))
+        self.assertEqual(len(hq_spool.spooledJobs()), 2)
+
+    def testFlushSendsInSpoolOrder(self):
+        for name in ['first', 'second', 'third']:
+            hq_spool.spoolJob(self.server.address, chunkedJob(name, 1))
+        flusher = hq_spool.spoolFlusher(hq_submit.submitJob)
+        self.assertEqual(flusher.flush(), None)
+        self.assertEqual([job['name'] for (job, parent) in self.server.submissions], ['first', 'second', 'third'])
+        self.assertEqual(hq_spool.spooledJobs(), [])
+
+    def testUnreachableServerKeepsItsJobs(self):
+        hq_spool.spoolJob(unreachableServer, chunkedJob('waiting', 1))
+        flusher = hq_spool.spoolFlusher(hq_submit.submitJob)
+        self.assertTrue(flusher.flush() > time.time())
+        self.assertEqual(len(hq_spool.spooledJobs()), 1)
+
+    def testJobThatMayHaveArrivedIsNotSpooled(self):
+        # The server gets the job but answers after the read timeout
+        hq_submit.hQServerConnect(self.server.address)
+        self.server.latency = 0.5
+        readTimeout = hq_connection.readTimeout
+        hq_connection.readTimeout = 0.2
+        try:
+            self.assertEqual(hq_submit.sendJob(self.server.address, chunkedJob('slow', 1)), False)
+        finally:
+            hq_connection.readTimeout = readTimeout
+        time.sleep(0.5)
+        self.assertEqual(hq_spool.spooledJobs(), [])
+        self.assertEqual(len(self.jobsNamed('slow')), 1)
+
+class pagedSubmissionTests(standinTestCase):
+
+    def testUnreachableParentSendsNothing(self):
+        job = chunkedJob('paged', hq_submit.childPageSize + 10)
+        self.assertEqual(hq_submit.submitJob(unreachableServer, job), None)
+
+        s = hq_submit.hQServerConnect(self.server.address)
+        openBreaker(self.server.address)
+        self.assertEqual(hq_submit.sendPagedJob(self.server.address, job, s=s), None)
+        self.assertEqual(self.server.jobs, {})
+        self.assertEqual(hq_submit._unfinishedSubmissions, {})
+
+    def testParentThatMayHaveArrivedIsNotResent(self):
+        job = chunkedJob('paged', hq_submit.childPageSize + 10)
+        hq_submit.hQServerConnect(self.server.address)
+        self.server.latency = 0.5
+        readTimeout = hq_connection.readTimeout
+        hq_connection.readTimeout = 0.2
+        try:
+            self.assertEqual(hq_submit.submitJob(self.server.address, job), False)
+        finally:
+            hq_connection.readTimeout = readTimeout
+        time.sleep(0.5)
+        self.assertEqual(hq_submit._unfinishedSubmissions, {})
+        self.assertEqual(len(self.jobsNamed('paged')), 1)
+
+    def testResumesAfterPagesCouldNotBeSent(self):
+        job = chunkedJob('pages', 30)
+        submission = hq_submit.pagedSubmission(self.server.address, job, pageSize=10)
+        s = hq_connection.getConnection(self.server.address)
+        submission.submitParent(s)
+        breaker = openBreaker(self.server.address)
+        self.assertFalse(submission.submit(s))
+        self.assertFalse(submission.mayHaveArrived)
+        self.assertEqual(submission.remainingChildren(), 20)
+
+        breaker.succeeded()
+        self.assertTrue(submission.submit(s))
+        self.assertEqual(len(self.jobsNamed('pages')), 1)
+        self.assertEqual(len(self.server.leafJobs(submission.jobId)), 30)
+
+    def testPageThatMayHaveArrivedIsNotResent(self):
+        job = chunkedJob('pages', 30)
+        submission = hq_submit.pagedSubmission(self.server.address, job, pageSize=10)
+        s = hq_connection.getConnection(self.server.address)
+        submission.submitParent(s)
+        self.server.failNext('newjob', kind='error')
+        self.assertFalse(submission.submit(s))
+        self.assertTrue(submission.mayHaveArrived)
+
+    def testFailedParentIsNotKeptForResuming(self):
+        job = chunkedJob('paged', hq_submit.childPageSize + 10)
+        self.server.failNext('newjob', kind='error')
+        self.assertEqual(hq_submit.sendPagedJob(self.server.address, job), False)
+        self.assertEqual(hq_submit._unfinishedSubmissions, {})
+
+class batchSubmissionTests(standinTestCase):
+
+    def testJobsGoUnderTheUmbrellaInOneBatch(self):
+        hq_submit.hQServerConnect(self.server.address)
+        self.server.requests = 0
+        umbrella = hq_submit.buildUmbrellaJobSpec('nightly', 5)
+        ids = hq_submit.sendJobs(self.server.address, [chunkedJob('sh010', 2), chunkedJob('sh020', 2)], umbrella)
+        # The umbrella job, then every scene in one multicall
+        self.assertEqual(self.server.requests, 2)
+        umbrellaId = self.jobsNamed('nightly')[0]['id']
+        self.assertEqual([self.server.jobs[jobId]['parent'] for jobId in ids], [umbrellaId, umbrellaId])
+
+    def testRefusedJobIsLeftOut(self):
+        self.server.failNext('newjob', kind='fault')
+        ids = hq_submit.sendJobs(self.server.address, [chunkedJob('refused', 1), chunkedJob('sent', 1)])
+        self.assertEqual(ids[0], None)
+        self.assertEqual(self.server.jobs[ids[1]]['name'], 'sent')
+
+    def testLargeJobIsPagedAfterTheBatch(self):
+        large = chunkedJob('large', hq_submit.childPageSize + 10)
+        ids = hq_submit.sendJobs(self.server.address, [chunkedJob('small', 1), large])
+        self.assertEqual(len(self.server.leafJobs(ids[1])), len(large['children']))
+
+    def testUnreachableServerSendsNothing(self):
+        self.assertEqual(hq_submit.submitJobs(unreachableServer, [chunkedJob('lost', 1)]), None)
+
+class retryTests(standinTestCase):
+
+    def testRetriesOnlyFailedChunks(self):
+        ids = hq_submit.sendJob(self.server.address, chunkedJob('retried', 5))
+        chunks = self.server.jobs[ids[0]]['children']
+        self.server.setJobStatus(chunks[1], 'failed')
+        self.server.setJobStatus(chunks[3], 'cancelled')
+
+        retry = hq_submit.retryFailed(self.server.address, ids[0])
+        self.assertTrue(retry)
+        names = sorted(self.server.jobs[childId]['name'] for childId in self.server.jobs[retry[0]]['children'])
+        self.assertEqual(names, ['Frame Range_1', 'Frame Range_3'])
+
+    def testLedgerRemembersTheChunkIds(self):
+        ids = hq_submit.sendJob(self.server.address, chunkedJob('remembered', 3))
+        entry = hq_ledger.findEntry(self.server.address)
+        self.assertEqual((entry['jobId'], entry['name'], len(entry['chunks'])), (ids[0], 'remembered', 3))
+        self.assertEqual(entry['childIds'], None)
+
+        s = hq_connection.getConnection(self.server.address)
+        self.assertEqual(hq_ledger.failedChunks(s, entry), [])
+        entry = hq_ledger.findEntry(self.server.address, ids[0])
+        self.assertEqual(sorted(entry['childIds'].values()), self.server.jobs[ids[0]]['children'])
+        # With the ids known the statuses are one batched request
+        self.server.requests = 0
+        hq_ledger.chunkStatuses(s, entry)
+        self.assertEqual(self.server.requests, 1)
+
+    def testLineCutShortIsSkipped(self):
+        hq_submit.sendJob(self.server.address, chunkedJob('kept', 1))
+        with open(hq_ledger.ledgerLocation, 'a') as f:
+            f.write('{"server": "hq:5000", "jobId"')
+        self.assertEqual([entry['name'] for entry in hq_ledger.readLedger()], ['kept'])
+
+    def testNothingToRetry(self):
+        ids = hq_submit.sendJob(self.server.address, chunkedJob('fine', 3))
+        self.assertEqual(hq_submit.retryFailed(self.server.address, ids[0]), None)
+
+    def testServerErrorIsReported(self):
+        ids = hq_submit.sendJob(self.server.address, chunkedJob('broken', 3))
+        self.server.failNext('getJob', 5, 'error')
+        self.assertEqual(hq_submit.retryFailed(self.server.address, ids[0]), False)
+
+class failoverTests(standinTestCase):
+
+    def setUp(self):
+        standinTestCase.setUp(self)
+        self.other = standinServer().start()
+
+    def tearDown(self):
+        standinTestCase.tearDown(self)
+        self.other.stop()
+        os.remove(hq_submit.configLocation)
+
+    def useServers(self, servers):
+        with open(hq_submit.configLocation, 'w') as f:
+            json.dump({'Servers': servers}, f)
+        # The jobs were built with the first server's $HQROOT, which getHQROOT caches
+        hq_cache.metadata.set(servers[0], 'hq_root', defaultHQRoot)
+
+    def testUnreachableServerIsPassedOver(self):
+        self.useServers([unreachableServer, self.server.address])
+        (hq_server, ids) = hq_submit.sendJobWithFailover(unreachableServer, chunkedJob('moved', 2))
+        self.assertEqual(hq_server, self.server.address)
+        self.assertEqual(len(self.jobsNamed('moved')), 1)
+
+    def testLargeJobIsPassedOver(self):
+        self.useServers([unreachableServer, self.server.address])
+        job = chunkedJob('movedPages', hq_submit.childPageSize + 10)
+        (hq_server, ids) = hq_submit.sendJobWithFailover(unreachableServer, job)
+        self.assertEqual(hq_server, self.server.address)
+        self.assertEqual(len(self.server.leafJobs(ids[0])), len(job['children']))
+
+    def testLeastLoadedServerIsChosen(self):
+        self.server.jobSeconds = 60
+        hq_submit.sendJob(self.server.address, chunkedJob('busy', 5))
+        self.useServers([self.server.address, self.other.address])
+        (hq_server, ids) = hq_submit.sendJobWithFailover(self.server.address, chunkedJob('balanced', 2))
+        self.assertEqual(hq_server, self.other.address)
+
+    def testQueueDepthIsCachedUntilJobsAreSent(self):
+        self.useServers([self.server.address, self.other.address])
+        self.assertEqual(hq_servers.probeServer(self.server.address).queueDepth, 0)
+        self.server.requests = 0
+        self.assertEqual(hq_servers.probeServer(self.server.address).queueDepth, 0)
+        # Only the ping
+        self.assertEqual(self.server.requests, 1)
+
+        self.server.jobSeconds = 60
+        (hq_server, ids) = hq_submit.sendJobWithFailover(self.server.address, chunkedJob('queued', 2))
+        self.assertEqual(hq_cache.metadata.get(hq_server, 'queue_depth'), None)
+        self.assertEqual(hq_servers.probeServer(hq_server).queueDepth, 3)
+
+    def testServerWithAnotherRootIsPassedOver(self):
+        self.other.stop()
+        self.other = standinServer(hqRoot={'linux': '/net/hq', 'windows': 'R:', 'macosx': '/Volumes/hq'}).start()
+        self.server.jobSeconds = 60
+        hq_submit.sendJob(self.server.address, chunkedJob('busy', 5))
+        self.useServers([self.server.address, self.other.address])
+        (hq_server, ids) = hq_submit.sendJobWithFailover(self.server.address, chunkedJob('stays', 2))
+        self.assertEqual(hq_server, self.server.address)
+        self.assertEqual(self.other.jobs, {})
+
+    def testServerOutsideTheListIsUsedAlone(self):
+        self.useServers([self.other.address])
+        self.assertEqual(hq_submit.configuredServers(self.server.address), [self.server.address])
+
+class monitorTests(standinTestCase):
+
+    def testFollowsJobUntilItFinishes(self):
+        ids = hq_submit.sendJob(self.server.address, chunkedJob('watched', 3))
+        monitor = hq_monitor.jobMonitor(self.server.address, ids[0], minInterval=0.01)
+        monitor.watch()
+        self.assertEqual(monitor.status(), 'succeeded')
+        self.assertEqual(monitor.summary(), {'succeeded': 3})
+
+    def testUnknownJobIsGivenUpOn(self):
+        monitor = hq_monitor.jobMonitor(self.server.address, 999, minInterval=0.01)
+        monitor.watch()
+        self.assertEqual(monitor.status(), hq_monitor.missingStatus)
+        self.assertEqual(monitor.polls, hq_monitor.maxMissingPolls)
+
+#################################################################################################################################################################################################
+#### TRACING AND PROFILING
+
+class traceTests(standinTestCase):
+
+    def setUp(self):
+        standinTestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        hq_trace.tracer = None
+        standinTestCase.tearDown(self)
+        shutil.rmtree(self.directory)
+
+    def testCallsAreRecordedAsJSONLines(self):
+        location = os.path.join(self.directory, 'trace.jsonl')
+        hq_trace.tracer = hq_trace.rpcTracer(location)
+        s = hq_connection.getConnection(self.server.address)
+        hq_trace.startSession('submit')
+        s.ping()
+        s.batch([('getHQRoot', (OSplatform,)) for OSplatform in hq_submit.allPlatforms])
+        self.server.failNext('getJob')
+        self.assertRaises(xmlrpclib.Fault, s.getJob, 1)
+        hq_trace.endSession()
+        s.ping()
+
+        with open(location) as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual([(event['method'], event['outcome'], event['session']) for event in events],
+                         [('ping', 'ok', 'submit'), ('system.multicall', 'ok', 'submit'),
+                          ('getJob', 'fault', 'submit'), ('ping', 'ok', None)])
+        self.assertEqual(events[1]['calls'], 3)
+        self.assertTrue(events[1]['bytes_sent'] > 0 and events[1]['bytes_received'] > 0)
+
+    def testChromeTraceIsWrittenAtTheEndOfASession(self):
+        location = os.path.join(self.directory, 'trace.json')
+        hq_trace.tracer = hq_trace.rpcTracer(location)
+        hq_trace.startSession('submit')
+        hq_connection.getConnection(self.server.address).ping()
+        self.assertFalse(os.path.exists(location))
+        hq_trace.endSession()
+
+        with open(location) as f:
+            events = json.load(f)['traceEvents']
+        self.assertEqual([(event['name'], event['cat']) for event in events], [('ping', 'xmlrpc'), ('submit', 'session')])
+
+class profileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.enabled = hq_profile.enabled
+        self.profileDirectory = hq_profile.profileDirectory
+        hq_profile.profileDirectory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(hq_profile.profileDirectory)
+        (hq_profile.enabled, hq_profile.profileDirectory) = (self.enabled, self.profileDirectory)
+
+    def testOneProfilePerOutermostCall(self):
+        hq_profile.enabled = True
+
+        @hq_profile.profiled(lambda: '/shots/sh010 v2.nk')
+        def inner():
+            return 'inner'
+
+        @hq_profile.profiled(lambda: '/shots/sh010 v2.nk')
+        def submitJob():
+            return inner()
+
+        self.assertEqual(submitJob(), 'inner')
+        profiles = os.listdir(hq_profile.profileDirectory)
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0].startswith('sh010_v2_submitJob_') and profiles[0].endswith('.prof'))
+
+    def testFunctionIsLeftAloneWhenOff(self):
+        hq_profile.enabled = False
+        def submitJob():
+            pass
+        self.assertTrue(hq_profile.profiled(lambda: None)(submitJob) is submitJob)
+
+#################################################################################################################################################################################################
+#### COMMAND LINE
+
+class cliTestCase(standinTestCase):
+    """Runs hq_cli against a stand-in whose $HQROOT is a scratch directory holding two scenes."""
+
+    def setUp(self):
+        self.hqRoot = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.hqRoot, 'shots'))
+        for scene in ['sh010.nk', 'sh020.nk']:
+            open(os.path.join(self.hqRoot, 'shots', scene), 'w').close()
+        standinTestCase.setUp(self)
+        self.server.stop()
+        self.server = standinServer(hqRoot=dict((OSplatform, self.hqRoot) for OSplatform in defaultHQRoot)).start()
+
+    def tearDown(self):
+        standinTestCase.tearDown(self)
+        shutil.rmtree(self.hqRoot)
+
+    def submit(self, *args):
+        return hq_cli.main(list(args) + ['--server', self.server.address])
+
+class cliTests(cliTestCase):
+
+    def testSubmitsAScene(self):
+        self.assertEqual(self.submit('$HQROOT/shots/sh010.nk', '--frames', '1-25'), 0)
+        self.assertEqual(len(self.server.submissions), 1)
+        commands = [record['command'] for record in self.server.leafJobs()]
+        self.assertEqual(len(commands), 3)
+        self.assertTrue(all(self.hqRoot + '/shots/sh010.nk' in command['linux'] for command in commands))
+
+    def testDryRunSendsNothing(self):
+        self.assertEqual(self.submit('$HQROOT/shots/sh010.nk', '--frames', '1-25', '--dry-run'), 0)
+        self.assertEqual(self.server.jobs, {})
+
+    def testMissingSceneFails(self):
+        self.assertEqual(self.submit('$HQROOT/shots/sh999.nk', '--frames', '1-25'), 1)
+        self.assertEqual(self.server.jobs, {})
+
+    def testScenesGoUnderOneUmbrella(self):
+        self.assertEqual(self.submit('$HQROOT/shots/sh010.nk', '$HQROOT/shots/sh020.nk', '--frames', '1-10',
+                                     '--umbrella', 'nightly'), 0)
+        umbrella = self.jobsNamed('nightly')[0]
+        self.assertEqual(len(umbrella['children']), 2)
+
+    def testChunkStrategy(self):
+        self.assertEqual(self.submit('$HQROOT/shots/sh010.nk', '--frames', '1-100', '--chunk', 'clients:4'), 0)
+        self.assertEqual(len(self.server.leafJobs()), 4)
+
+    def testParseChunk(self):
+        self.assertEqual(hq_cli.parseChunk('fixed'), ('fixed', hq_frames.defaultChunkSize))
+        self.assertEqual(hq_cli.parseChunk('time:15'), ('time', 900.0))
+        self.assertEqual(hq_cli.parseChunk('clients'), ('clients', None))
+        self.assertRaises(argparse.ArgumentTypeError, hq_cli.parseChunk, 'random:3')
+        self.assertRaises(argparse.ArgumentTypeError, hq_cli.parseChunk, 'fixed:ten')
+
+#################################################################################################################################################################################################
+#### BENCHMARK
+
+class benchmarkTests(standinTestCase):
+
+    def testScratchHomeMovesTheCaches(self):
+        locations = (hq_cache.metadata.location, hq_cache.inventory.location, hq_ledger.ledgerLocation,
+                     hq_spool.spoolDirectory, hq_spool.rejectedDirectory, hq_submit.configLocation)
+        home = os.environ['HOME']
+        scratch = tempfile.mkdtemp()
+        try:
+            hq_benchmark.useScratchHome(scratch)
+            for location in [hq_cache.metadata.location, hq_cache.inventory.location, hq_ledger.ledgerLocation,
+                             hq_spool.spoolDirectory, hq_submit.configLocation]:
+                self.assertTrue(location.startswith(scratch))
+        finally:
+            (hq_cache.metadata.location, hq_cache.inventory.location, hq_ledger.ledgerLocation,
+             hq_spool.spoolDirectory, hq_spool.rejectedDirectory, hq_submit.configLocation) = locations
+            os.environ['HOME'] = home
+
+    def testCaseRunsInItsOwnProcess(self):
+        small = hq_benchmark.runCase(self.server.address, 'nuke', 100, False)
+        large = hq_benchmark.runCase(self.server.address, 'nuke', 20000, False)
+        self.assertTrue(small['submitted'])
+        self.assertEqual(small['chunks'], 10)
+        if small['peak_memory_kb'] is not None:
+            self.assertTrue(large['memory_growth_kb'] > small['memory_growth_kb'])
+            self.assertTrue(small['peak_memory_kb'] < large['peak_memory_kb'])
+
+if __name__ == '__main__':
+    unittest.main()